@@ -0,0 +1,270 @@
+"""
+Admission control and load shedding.
+
+Every route belongs to a priority class. Critical routes (health, block state,
+ingest) are admitted unconditionally. Other classes get a concurrency limit
+with a short bounded queue in front of it; a request that finds the queue
+full, or waits longer than the class allows, is turned away at once with 503
+and a Retry-After estimate. That keeps analytics scans and LLM calls from
+occupying the event loop and the Mongo pool that enforcement depends on.
+
+Polling routes are additionally capped per client by a token bucket (429).
+Clients are told apart by their X-Device-Id header, then their Authorization
+header, then their address; the user_id query parameter is not used for this
+since it defaults to "default". None of these is authenticated, which is why
+the cap is opt-in (POLL_RATE_PER_SECOND).
+"""
+
+import asyncio
+import hashlib
+import math
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+
+CRITICAL = "critical"
+
+# class or route -> (max concurrent, max queued)
+DEFAULT_LIMITS = "standard=128:512,expensive=8:32,llm=16:16"
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    """Parse "name=concurrency[:queue],..." where name is a priority class or a route template"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        concurrency, _, queue = value.partition(":")
+        try:
+            limits[name.strip()] = (int(concurrency), int(queue or concurrency))
+        except ValueError:
+            raise ValueError(f"Invalid admission limit {item!r}, expected name=concurrency[:queue]")
+    return limits
+
+
+class ConcurrencyLimit:
+    """At most max_concurrent holders, at most max_queue waiters, FIFO hand-off"""
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Moving average of how long a slot is held, for Retry-After
+        self.avg_hold = 0.0
+        self.admitted = 0
+        self.queue_full = 0
+        self.timed_out = 0
+
+    async def acquire(self) -> bool:
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.queue_full += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            return False
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before the client went away
+            if waiter.done() and not waiter.cancelled():
+                self.release(0.0)
+            raise
+        finally:
+            if not waiter.done() or waiter.cancelled():
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+        self.admitted += 1
+        return True
+
+    def release(self, held: float):
+        self.avg_hold = held if not self.avg_hold else 0.9 * self.avg_hold + 0.1 * held
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Hand the slot straight to the next waiter; active stays the same
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue is likely to have drained"""
+        backlog = (len(self._waiters) + 1) / self.max_concurrent
+        return min(60, max(1, math.ceil(backlog * self.avg_hold)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued": len(self._waiters),
+            "maxConcurrent": self.max_concurrent,
+            "maxQueue": self.max_queue,
+            "admitted": self.admitted,
+            "queueFull": self.queue_full,
+            "timedOut": self.timed_out,
+        }
+
+
+class UserRateLimiter:
+    """Per-client token buckets, least recently seen clients evicted past max_users"""
+
+    def __init__(self, rate: float, burst: int, max_users: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.limited = 0
+
+    def check(self, user_id: str) -> float:
+        """Take one token; returns 0 if allowed, otherwise seconds until the next token"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(user_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            self.limited += 1
+            wait = (1 - tokens) / self.rate
+        self._buckets[user_id] = (tokens, now)
+        if len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        return {"ratePerSecond": self.rate, "burst": self.burst, "users": len(self._buckets), "limited": self.limited}
+
+
+@dataclass
+class RoutePolicy:
+    route: Any
+    priority: str
+    limit: Optional[ConcurrencyLimit]
+    polled: bool
+
+
+class AdmissionController:
+    def __init__(self, priorities: Dict[str, str], polled_routes: Iterable[str], default_priority: str = "standard"):
+        self.priorities = priorities
+        self.polled_routes = set(polled_routes)
+        self.default_priority = default_priority
+        self.enabled = False
+        self.limits: Dict[str, ConcurrencyLimit] = {}
+        self.rate_limiter: Optional[UserRateLimiter] = None
+        self._routes: List[Any] = []
+        self._policies: List[RoutePolicy] = []
+
+    def bind(self, routes: List[Any]):
+        """Remember the app's routes; matching happens against their templates"""
+        self._routes = routes
+
+    def configure(self, enabled: bool = True, limits: str = DEFAULT_LIMITS, max_wait: float = 2.0,
+                  poll_rate: float = 0.0, poll_burst: int = 10):
+        parsed = parse_limits(limits)
+        known = {getattr(r, "path", None) for r in self._routes}
+        unknown = [name for name in parsed if name.startswith("/") and name not in known]
+        if unknown:
+            raise ValueError(f"Unknown route in admission limits: {', '.join(unknown)}")
+
+        self.limits = {
+            name: ConcurrencyLimit(name, concurrency, queue, max_wait)
+            for name, (concurrency, queue) in parsed.items()
+        }
+        self.rate_limiter = UserRateLimiter(poll_rate, poll_burst) if poll_rate > 0 else None
+
+        self._policies = []
+        for route in self._routes:
+            path = getattr(route, "path", None)
+            priority = self.priorities.get(path, self.default_priority)
+            # A route of its own in the limits overrides the shared class limit
+            limit = None if priority == CRITICAL else self.limits.get(path) or self.limits.get(priority)
+            # Critical routes are never shed, so they are not rate limited either
+            polled = path in self.polled_routes and priority != CRITICAL and self.rate_limiter is not None
+            if limit is not None or polled:
+                self._policies.append(RoutePolicy(route, priority, limit, polled))
+        self.enabled = enabled
+
+    def match(self, scope) -> Optional[RoutePolicy]:
+        for policy in self._policies:
+            if policy.route.matches(scope)[0] == Match.FULL:
+                return policy
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "limits": {name: limit.stats() for name, limit in self.limits.items()},
+            "polling": self.rate_limiter.stats() if self.rate_limiter else None,
+        }
+
+
+def client_key(scope) -> str:
+    """Rate-limit key for a request: its device id, its credentials, or failing both its address"""
+    headers = dict(scope.get("headers") or ())
+    device = headers.get(b"x-device-id")
+    if device:
+        return "device:" + device.decode("latin-1")[:128]
+    authorization = headers.get(b"authorization")
+    if authorization:
+        # Keep the credential itself out of the bucket table
+        return "auth:" + hashlib.sha256(authorization).hexdigest()[:32]
+    client = scope.get("client")
+    return "addr:" + (client[0] if client else "unknown")
+
+
+class AdmissionMiddleware:
+    """Reject or queue requests before they reach the router"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        controller = self.controller
+        if not controller.enabled or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        policy = controller.match(scope)
+        if policy is None:
+            return await self.app(scope, receive, send)
+
+        if policy.polled:
+            wait = controller.rate_limiter.check(client_key(scope))
+            if wait:
+                return await self._reject(scope, receive, send, policy, 429, "Polling too frequently", wait)
+
+        limit = policy.limit
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        if not await limit.acquire():
+            return await self._reject(scope, receive, send, policy, 503, "Server busy, retry later", limit.retry_after())
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limit.release(time.monotonic() - started)
+
+    async def _reject(self, scope, receive, send, policy: RoutePolicy, status: int, detail: str, retry_after: float):
+        # Label the rejection with its route in the request metrics
+        scope["route"] = policy.route
+        response = JSONResponse(
+            {"detail": detail},
+            status_code=status,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,74 @@
+"""
+In-memory per-user snapshot of blocked packages for the on-device enforcer.
+
+Snapshots are loaded lazily from monitored_apps and then kept current by the
+write paths in server.py, so polling /api/apps/blocked never touches Mongo.
+"""
+
+import itertools
+import time
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+# Versions start from the boot time in milliseconds so a restarted process
+# never hands out a version (and ETag) that a device has already cached.
+_version_counter = itertools.count(int(time.time() * 1000))
+
+
+@dataclass(frozen=True)
+class BlockSnapshot:
+    version: int
+    packages: FrozenSet[str]
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.version}"'
+
+    def to_payload(self) -> Dict:
+        return {"version": self.version, "blocked": sorted(self.packages)}
+
+
+class BlockStateStore:
+    def __init__(self):
+        self._snapshots: Dict[str, BlockSnapshot] = {}
+        # Bumped on every write so a load that raced a write is not stored
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+
+    def get(self, user_id: str) -> Optional[BlockSnapshot]:
+        return self._snapshots.get(user_id)
+
+    def begin_load(self, user_id: str) -> Tuple[int, int]:
+        """Return a token to pass to finish_load once the database read completes"""
+        return self._epoch, self._generations.get(user_id, 0)
+
+    def finish_load(self, user_id: str, token: Tuple[int, int], packages: Iterable[str]) -> BlockSnapshot:
+        snapshot = BlockSnapshot(next(_version_counter), frozenset(packages))
+        if self.begin_load(user_id) == token:
+            self._snapshots[user_id] = snapshot
+        return snapshot
+
+    def set_blocked(self, user_id: str, package_name: str, blocked: bool):
+        """Record a block-state change; only bumps the version if the set changes"""
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        snapshot = self._snapshots.get(user_id)
+        if snapshot is None:
+            return
+        if (package_name in snapshot.packages) == blocked:
+            return
+
+        packages = set(snapshot.packages)
+        if blocked:
+            packages.add(package_name)
+        else:
+            packages.discard(package_name)
+        self._snapshots[user_id] = BlockSnapshot(next(_version_counter), frozenset(packages))
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """Drop one user's snapshot, or all of them, forcing a reload on next read"""
+        if user_id is None:
+            self._epoch += 1
+            self._snapshots.clear()
+        else:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self._snapshots.pop(user_id, None)
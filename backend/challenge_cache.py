@@ -0,0 +1,137 @@
+"""
+Pool of validated LLM challenges, reused across users.
+
+The generation prompt depends only on the difficulty and a coarse band of the
+user's recent success rate, so challenges generated for the same
+(difficulty, band) are interchangeable. Each key keeps a bounded pool; a user
+is served one they have not seen yet, and the provider is only called when
+the pool has nothing new for them. That challenge then joins the pool,
+evicting the oldest one once the pool is full.
+
+Each refill of a key gets its own number, so the caller can vary the LLM
+session and prompt between refills, and recent() lists the questions the
+prompt should steer away from.
+"""
+
+import random
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Success-rate bands, split at the thresholds that steer "auto" difficulty
+BANDS = {
+    "low": "below 40%",
+    "mid": "between 40% and 80%",
+    "high": "above 80%",
+}
+
+# {"question", "answer", "timeReward"} as returned by the LLM
+Template = Dict[str, Any]
+
+_ARITHMETIC = re.compile(r"^\s*(\d+)\s*([+\-−×xX*÷/])\s*(\d+)\s*=\s*\?\s*$")
+
+
+def success_band(success_rate: float) -> str:
+    if success_rate < 0.4:
+        return "low"
+    if success_rate > 0.8:
+        return "high"
+    return "mid"
+
+
+def verify_answer(question: str, answer: int) -> bool:
+    """True if the question is "a <op> b = ?" and the answer is right; other shapes are not pooled"""
+    match = _ARITHMETIC.match(question)
+    if not match:
+        return False
+    a, op, b = int(match.group(1)), match.group(2), int(match.group(3))
+    if op == "+":
+        return a + b == answer
+    if op in "-−":
+        return a - b == answer
+    if op in "×xX*":
+        return a * b == answer
+    return b != 0 and a % b == 0 and a // b == answer
+
+
+class ChallengeCache:
+    def __init__(self, max_per_key: int = 100, max_users: int = 10000, seen_per_user: int = 500):
+        self.max_per_key = max_per_key
+        self.max_users = max_users
+        self.seen_per_user = seen_per_user
+        self._pools: Dict[Tuple[str, str], "OrderedDict[str, Template]"] = {}
+        # Questions served to each user, most recent last; users are evicted LRU
+        self._seen: "OrderedDict[str, OrderedDict[str, None]]" = OrderedDict()
+        self._refills: Dict[Tuple[str, str], int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_per_key > 0
+
+    def take(self, difficulty: str, band: str, user_id: str) -> Optional[Template]:
+        """A pooled challenge the user has not seen, or None if the provider must be called"""
+        if not self.enabled:
+            return None
+        pool = self._pools.get((difficulty, band), {})
+        seen = self._seen.get(user_id, {})
+        unseen = [question for question in pool if question not in seen]
+        if not unseen:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        template = pool[random.choice(unseen)]
+        self.mark_seen(user_id, template["question"])
+        return dict(template)
+
+    def add(self, difficulty: str, band: str, template: Template):
+        if not self.enabled:
+            return
+        pool = self._pools.setdefault((difficulty, band), OrderedDict())
+        pool[template["question"]] = dict(template)
+        pool.move_to_end(template["question"])
+        while len(pool) > self.max_per_key:
+            pool.popitem(last=False)
+            self.evictions += 1
+
+    def next_refill(self, difficulty: str, band: str) -> int:
+        key = (difficulty, band)
+        self._refills[key] = self._refills.get(key, 0) + 1
+        return self._refills[key]
+
+    def has_seen(self, user_id: str, question: str) -> bool:
+        return question in self._seen.get(user_id, {})
+
+    def recent(self, difficulty: str, band: str, user_id: str, limit: int = 10) -> List[str]:
+        """The user's latest questions, then the pool's newest, most recent first"""
+        questions = list(reversed(self._seen.get(user_id, {})))
+        questions += reversed(self._pools.get((difficulty, band), {}))
+        return list(dict.fromkeys(questions))[:limit]
+
+    def mark_seen(self, user_id: str, question: str):
+        if not self.enabled:
+            return
+        seen = self._seen.setdefault(user_id, OrderedDict())
+        self._seen.move_to_end(user_id)
+        seen[question] = None
+        seen.move_to_end(question)
+        while len(seen) > self.seen_per_user:
+            seen.popitem(last=False)
+        while len(self._seen) > self.max_users:
+            self._seen.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": sum(len(pool) for pool in self._pools.values()),
+            "maxPerKey": self.max_per_key,
+            "users": len(self._seen),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRatio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,125 @@
+"""
+Timezone-aware daily reset of monitored app counters.
+
+Monitored apps carry the owner's IANA timezone, so all apps that share a
+zone roll over at the same instant and can be reset with one update. Apps
+created before the field existed count as DEFAULT_TIMEZONE.
+
+Whether an app is due is decided per app from its lastResetDate, so an app
+that moves into a zone after that zone's reset is still reset on the next
+tick. Usage written between local midnight and that tick resets the app on
+the write path first (see MonitoredAppRepository.add_usage).
+"""
+
+import asyncio
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEZONE = "UTC"
+
+
+def resolve_timezone(name: Optional[str]) -> ZoneInfo:
+    """Return the ZoneInfo for a timezone name, falling back to UTC"""
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown timezone {name!r}, using {DEFAULT_TIMEZONE}")
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def is_valid_timezone(name: str) -> bool:
+    try:
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+
+def local_today(tz_name: Optional[str], now: Optional[datetime] = None) -> date:
+    """Current calendar date in the given timezone"""
+    now = now or datetime.now(timezone.utc)
+    return now.astimezone(resolve_timezone(tz_name)).date()
+
+
+def reset_pending(last_reset_date: Optional[str], local_date: str) -> bool:
+    """True if an app's counters were last reset before local_date, or never"""
+    # ISO dates compare as strings; a later date (the owner moved west) is left alone
+    return (last_reset_date or "") < local_date
+
+
+def local_day_window(
+    tz_name: Optional[str], now: Optional[datetime] = None, days: int = 1
+) -> Tuple[date, datetime, datetime]:
+    """
+    Return (local date, start, end) for the user's current local day, or the
+    last `days` local days ending with it.
+
+    start/end are naive UTC datetimes so they compare directly against the
+    naive utcnow() timestamps stored in usage_sessions.
+    """
+    tz = resolve_timezone(tz_name)
+    today = local_today(tz_name, now)
+    start_local = datetime.combine(today - timedelta(days=days - 1), datetime.min.time(), tzinfo=tz)
+    end_local = datetime.combine(today + timedelta(days=1), datetime.min.time(), tzinfo=tz)
+    start = start_local.astimezone(timezone.utc).replace(tzinfo=None)
+    end = end_local.astimezone(timezone.utc).replace(tzinfo=None)
+    return today, start, end
+
+
+class DailyResetScheduler:
+    """Background task that zeroes timeUsed/isBlocked at each zone's local midnight"""
+
+    def __init__(self, monitored_apps, interval_seconds: float = 60.0, on_reset=None):
+        self.monitored_apps = monitored_apps
+        self.interval_seconds = interval_seconds
+        # Optional async callback(tz_name, local_date) run after apps in a zone were reset
+        self.on_reset = on_reset
+        self._task: Optional[asyncio.Task] = None
+
+    async def reset_zone(self, tz_name: str, local_date: str) -> int:
+        """Reset every active app in one timezone last reset before local_date"""
+        return await self.monitored_apps.reset_zone(tz_name, local_date, datetime.utcnow())
+
+    async def run_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Reset the apps in every zone that are behind that zone's local date"""
+        now = now or datetime.now(timezone.utc)
+        zones = await self.monitored_apps.active_timezones()
+
+        reset_counts = {}
+        for tz_name in zones:
+            local_date = local_today(tz_name, now).isoformat()
+            modified = await self.reset_zone(tz_name, local_date)
+            reset_counts[tz_name] = modified
+            if modified:
+                logger.info(f"Daily reset for {tz_name} ({local_date}): {modified} apps")
+                if self.on_reset:
+                    await self.on_reset(tz_name, local_date)
+
+        return reset_counts
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Daily reset failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,247 @@
+"""
+Write-behind buffer for usage session ingest.
+
+Sessions are acknowledged as soon as they are queued. A background task
+flushes them in batches: one insert for all the sessions and one bulk update
+that applies the summed durations per (userId, packageName) to
+monitored_apps.
+
+A batch that fails is retried with backoff before anything else is taken
+from the queue, so a storage outage fills the queue and /usage/session
+answers 503 instead of dropping acknowledged sessions. The two steps are
+tracked separately: a retry re-inserts only the sessions that are not
+stored yet, and never re-applies durations that were already added.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo.write_concern import WriteConcern
+
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+AppKey = Tuple[str, str]
+
+# Queued by drain() so the flusher stops after everything ahead of it
+_STOP = object()
+
+
+class _Batch:
+    """Sessions being flushed, and which of the two writes already succeeded"""
+
+    def __init__(self, sessions: List[Dict[str, Any]]):
+        self.sessions = sessions
+        # Coalesce per app so a burst from one device becomes one update
+        self.durations: Dict[AppKey, int] = {}
+        for session in sessions:
+            key = (session.get("userId", "default"), session["packageName"])
+            self.durations[key] = self.durations.get(key, 0) + session.get("duration", 0)
+        self.attempts = 0
+        self.stored = False
+        self.applied = False
+
+
+def parse_write_concern(value: str) -> WriteConcern:
+    """INGEST_WRITE_CONCERN accepts a node count ("0", "1", ...) or a tag such as "majority" """
+    return WriteConcern(w=int(value) if value.isdigit() else value)
+
+
+class IngestBuffer:
+    def __init__(
+        self,
+        storage: Storage,
+        max_queue: int = 10000,
+        flush_size: int = 500,
+        flush_interval: float = 1.0,
+        enqueue_timeout: float = 0.05,
+        write_concern: Optional[WriteConcern] = None,
+        on_flush: Optional[Callable[[List[str], Optional[List[Dict[str, Any]]]], Awaitable[None]]] = None,
+        retry_delay: float = 0.5,
+        max_retry_delay: float = 30.0,
+        max_attempts: int = 20,
+        drain_timeout: float = 30.0,
+    ):
+        self.storage = storage.with_write_concern(write_concern or WriteConcern(w=1))
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        # Called with the updated monitored_apps documents after each flush
+        self.on_flush = on_flush
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        # A batch that still fails after this many attempts is given up on
+        self.max_attempts = max_attempts
+        self.drain_timeout = drain_timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._current: Optional[_Batch] = None
+        self.accepted = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.retries = 0
+        self.lost = 0
+
+    async def submit(self, session: Dict[str, Any]) -> bool:
+        """Queue a session; returns False if the queue stayed full (caller should shed load)"""
+        try:
+            await asyncio.wait_for(self._queue.put(session), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        return True
+
+    async def flush(self, sessions: List[Dict[str, Any]]):
+        """Write a batch, retrying with backoff until it succeeds or max_attempts is reached"""
+        if not sessions:
+            return
+
+        started = time.time()
+        # Left set if drain() cancels the retries, so it can account for the batch
+        batch = self._current = _Batch(sessions)
+        delay = self.retry_delay
+        while not await self._write(batch):
+            if batch.attempts >= self.max_attempts:
+                self._current = None
+                self._give_up(batch, f"still failing after {batch.attempts} attempts")
+                return
+            self.retries += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_retry_delay)
+        self._current = None
+
+        if self.on_flush:
+            # Every user in the batch has new sessions, whether or not one of their apps matched
+            user_ids = list(dict.fromkeys(user_id for user_id, _ in batch.durations))
+            try:
+                updated = await self.storage.monitored_apps.find_by_keys(
+                    batch.durations, {"_id": 0, "id": 1, "userId": 1, "packageName": 1, "isBlocked": 1}
+                )
+            except Exception as e:
+                logger.error(f"Failed to read back flushed apps: {e}")
+                updated = None
+            try:
+                await self.on_flush(user_ids, updated)
+            except Exception as e:
+                logger.error(f"Post-flush update failed: {e}")
+
+        logger.debug(f"Flushed {len(sessions)} sessions in {time.time() - started:.3f}s")
+
+    async def _write(self, batch: _Batch) -> bool:
+        batch.attempts += 1
+        try:
+            if not batch.stored:
+                pending = batch.sessions
+                if batch.attempts > 1:
+                    # An earlier attempt may have stored part of the batch
+                    pending = await self.storage.usage_sessions.unsaved(pending)
+                if pending:
+                    await self.storage.usage_sessions.insert_many(pending)
+                batch.stored = True
+                self.flushed += len(batch.sessions)
+            if not batch.applied:
+                # Not idempotent; a failure part-way through may be applied twice on retry
+                await self.storage.monitored_apps.add_usage(batch.durations, datetime.utcnow())
+                batch.applied = True
+            return True
+        except Exception as e:
+            step = "apply usage from" if batch.stored else "store"
+            logger.error(f"Failed to {step} {len(batch.sessions)} usage sessions (attempt {batch.attempts}): {e}")
+            return False
+
+    def _give_up(self, batch: _Batch, reason: str):
+        if batch.stored:
+            logger.error(f"Usage from {len(batch.sessions)} stored sessions was not added to monitored apps: {reason}")
+        else:
+            self.lost += len(batch.sessions)
+            logger.error(f"Dropped {len(batch.sessions)} acknowledged usage sessions: {reason}")
+
+    async def _next_batch(self) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Wait for the first session, then gather more until the size or time
+        threshold. Returns the batch and whether a stop was requested.
+        """
+        first = await self._queue.get()
+        if first is _STOP:
+            return [], True
+
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.flush_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self):
+        while True:
+            batch, stopping = await self._next_batch()
+            await self.flush(batch)
+            if stopping:
+                return
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def drain(self):
+        """
+        Flush everything queued so far and stop the background flusher. A batch
+        that is being retried keeps retrying for up to drain_timeout.
+        """
+        try:
+            await asyncio.wait_for(self._drain(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            reason = f"storage still failing after the {self.drain_timeout:.0f}s shutdown drain"
+            if self._current is not None:
+                self._give_up(self._current, reason)
+                self._current = None
+            queued = [item for item in self._take_all() if item is not _STOP]
+            if queued:
+                self._give_up(_Batch(queued), reason)
+            self._task = None
+
+    def _take_all(self) -> List[Any]:
+        items = []
+        while not self._queue.empty():
+            items.append(self._queue.get_nowait())
+        return items
+
+    async def _drain(self):
+        if self._task is not None:
+            await self._queue.put(_STOP)
+            await self._task
+            self._task = None
+
+        # Anything submitted while the flusher was stopping
+        while not self._queue.empty():
+            batch = []
+            while not self._queue.empty() and len(batch) < self.flush_size:
+                item = self._queue.get_nowait()
+                if item is not _STOP:
+                    batch.append(item)
+            await self.flush(batch)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self._queue.qsize(),
+            "retrying": len(self._current.sessions) if self._current is not None and self._current.attempts > 1 else 0,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "flushed": self.flushed,
+            "retries": self.retries,
+            "lost": self.lost,
+        }
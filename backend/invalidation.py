@@ -0,0 +1,271 @@
+"""
+Cross-worker invalidation bus.
+
+Every uvicorn worker keeps its own read cache, block-state snapshots and ETag
+version counters. A write handled by one worker publishes "user X /
+collection Y changed"; the other workers receive it and drop or bump their
+copy, so caching stays correct with more than one worker.
+
+Transports:
+
+- unix:  datagram sockets in a shared directory, one per worker (one host)
+- mongo: inserts into the capped `invalidations` collection, read back by
+         every worker through a change stream (needs a replica set)
+
+Delivery is best effort. When a transport knows it lost events (a change
+stream that could not resume, a peer that was not reachable) the receivers
+are told to drop everything, which costs cache misses but never staleness.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (collection, user_id); user_id None means every user of the collection
+Invalidation = Tuple[str, Optional[str]]
+
+# Collection name meaning "everything may have changed"
+EVERYTHING = "*"
+
+# Events per datagram / insert; keeps datagrams well under the socket limit
+BATCH_SIZE = 64
+
+
+class InvalidationBus(ABC):
+    name = ""
+
+    def __init__(self):
+        # Events from this process are skipped on receipt
+        self.origin = uuid.uuid4().hex
+        self._handler: Optional[Callable[[List[Invalidation]], None]] = None
+        self._outbox: asyncio.Queue = asyncio.Queue()
+        self._sender: Optional[asyncio.Task] = None
+        self.published = 0
+        self.received = 0
+        self.lost = 0
+
+    async def start(self, handler: Callable[[List[Invalidation]], None]):
+        self._handler = handler
+        await self._open()
+        self._sender = asyncio.create_task(self._send_loop())
+
+    async def stop(self):
+        if self._sender is not None:
+            self._sender.cancel()
+            try:
+                await self._sender
+            except asyncio.CancelledError:
+                pass
+            self._sender = None
+        await self._close()
+
+    def publish(self, collection: str, user_id: Optional[str] = None):
+        """Queue an event for the other workers; never blocks the request"""
+        self._outbox.put_nowait((collection, user_id))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "transport": self.name,
+            "published": self.published,
+            "received": self.received,
+            "lost": self.lost,
+            "pending": self._outbox.qsize(),
+        }
+
+    async def _send_loop(self):
+        while True:
+            events = [await self._outbox.get()]
+            while len(events) < BATCH_SIZE and not self._outbox.empty():
+                events.append(self._outbox.get_nowait())
+            # Duplicates within a batch carry no extra information
+            events = list(dict.fromkeys(events))
+            try:
+                await self._send(events)
+                self.published += len(events)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to publish {len(events)} invalidations: {e}")
+
+    def _deliver(self, origin: str, events: List[Invalidation]):
+        if origin == self.origin or self._handler is None:
+            return
+        self.received += len(events)
+        self._handler(events)
+
+    def _lose(self, reason: str):
+        # Whatever was missed, dropping all local state covers it
+        self.lost += 1
+        logger.warning(f"Invalidation events may have been lost ({reason}); clearing local caches")
+        if self._handler is not None:
+            self._handler([(EVERYTHING, None)])
+
+    @abstractmethod
+    async def _open(self): ...
+
+    @abstractmethod
+    async def _close(self): ...
+
+    @abstractmethod
+    async def _send(self, events: List[Invalidation]): ...
+
+
+def _encode(origin: str, events: List[Invalidation]) -> bytes:
+    return json.dumps({"o": origin, "e": events}, separators=(",", ":")).encode()
+
+
+class UnixSocketBus(InvalidationBus):
+    """Each worker binds <directory>/<pid>.sock and sends to every other socket there"""
+
+    name = "unix"
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = Path(directory)
+        self.path = self.directory / f"{os.getpid()}.sock"
+        self._socket: Optional[socket.socket] = None
+        # Peers whose socket was full when we sent to them
+        self._behind: Set[Path] = set()
+
+    async def _open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path.unlink(missing_ok=True)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._socket.bind(str(self.path))
+        asyncio.get_running_loop().add_reader(self._socket.fileno(), self._on_readable)
+
+    async def _close(self):
+        if self._socket is not None:
+            asyncio.get_running_loop().remove_reader(self._socket.fileno())
+            self._socket.close()
+            self._socket = None
+        self.path.unlink(missing_ok=True)
+
+    def _on_readable(self):
+        while True:
+            try:
+                payload = self._socket.recv(65536)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                logger.error(f"Invalidation socket read failed: {e}")
+                return
+            try:
+                message = json.loads(payload)
+                self._deliver(message["o"], [(c, u) for c, u in message["e"]])
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Ignoring malformed invalidation message: {e}")
+
+    async def _send(self, events: List[Invalidation]):
+        payload = _encode(self.origin, events)
+        for peer in self.directory.glob("*.sock"):
+            if peer == self.path:
+                continue
+            try:
+                if peer in self._behind:
+                    # It missed events earlier; it must start over before anything else
+                    self._socket.sendto(_encode(self.origin, [(EVERYTHING, None)]), str(peer))
+                    self._behind.discard(peer)
+                self._socket.sendto(payload, str(peer))
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a worker that exited without cleaning up
+                peer.unlink(missing_ok=True)
+                self._behind.discard(peer)
+            except BlockingIOError:
+                # The peer's receive buffer is full
+                if peer not in self._behind:
+                    logger.warning(f"Invalidation peer {peer.name} is not keeping up")
+                self._behind.add(peer)
+
+
+class MongoChangeStreamBus(InvalidationBus):
+    """Publish by inserting into a capped collection; receive through a change stream on it"""
+
+    name = "mongo"
+    COLLECTION = "invalidations"
+    CAPPED_SIZE_BYTES = 16 * 1024 * 1024
+
+    def __init__(self, db, retry_seconds: float = 1.0):
+        super().__init__()
+        self.db = db
+        self.collection = db[self.COLLECTION]
+        self.retry_seconds = retry_seconds
+        self._listener: Optional[asyncio.Task] = None
+        self._opened: Optional[asyncio.Event] = None
+
+    async def _open(self):
+        if self.COLLECTION not in await self.db.list_collection_names():
+            try:
+                await self.db.create_collection(self.COLLECTION, capped=True, size=self.CAPPED_SIZE_BYTES)
+            except Exception as e:
+                # Another worker created it first
+                logger.debug(f"Invalidation collection not created: {e}")
+        self._opened = asyncio.Event()
+        self._listener = asyncio.create_task(self._listen())
+        # Wait briefly for the stream so this worker's first requests are covered
+        try:
+            await asyncio.wait_for(self._opened.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning("Invalidation change stream is not open yet")
+
+    async def _close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self):
+        pipeline = [{"$match": {"operationType": "insert", "fullDocument.o": {"$ne": self.origin}}}]
+        resume_token = None
+        delay = self.retry_seconds
+        while True:
+            opened = False
+            try:
+                async with self.collection.watch(pipeline, resume_after=resume_token) as stream:
+                    opened = True
+                    resume_token = stream.resume_token
+                    delay = self.retry_seconds
+                    self._opened.set()
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        document = change["fullDocument"]
+                        self._deliver(document["o"], [(c, u) for c, u in document["e"]])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Invalidation change stream failed: {e}")
+                if not opened and resume_token is not None:
+                    # The resume point has rolled off the oplog; start from now
+                    resume_token = None
+                    self._lose("change stream could not resume")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+
+    async def _send(self, events: List[Invalidation]):
+        await self.collection.insert_one({"o": self.origin, "e": events, "at": datetime.utcnow()})
+
+
+def create_bus(transport: str, socket_dir: Optional[str] = None, db=None) -> Optional[InvalidationBus]:
+    """The configured bus, or None for a single worker"""
+    if transport == "none":
+        return None
+    if transport == "unix":
+        return UnixSocketBus(socket_dir)
+    if transport == "mongo":
+        if db is None:
+            raise ValueError("INVALIDATION_BUS=mongo requires STORAGE_BACKEND=mongo")
+        return MongoChangeStreamBus(db)
+    raise ValueError(f"Unknown invalidation bus: {transport}")
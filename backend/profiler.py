@@ -0,0 +1,185 @@
+"""
+On-demand sampling profiler for live requests.
+
+While a profiling session is active, a background thread wakes every few
+milliseconds, checks whether the event loop is currently running one of the
+selected requests and, if so, records the loop thread's Python stack. Stacks
+are aggregated in the folded format ("outer;inner;leaf count") that
+flamegraph.pl and speedscope read directly.
+
+When no session is active the middleware does one attribute check per request
+and no thread is running.
+"""
+
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from starlette.routing import Match
+
+# Distinct stacks kept per session; further new stacks are counted as dropped
+MAX_STACKS = 20000
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def fold_stack(frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.route: Optional[str] = None
+        self.sample_rate = 1.0
+        self.interval = 0.005
+        self.started_at: Optional[float] = None
+        self.expires_at: Optional[float] = None
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self.dropped = 0
+        self.profiled_requests = 0
+        self._routes: List[Any] = []
+        self._active: Set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._previous_factory = None
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self, routes: List[Any], route: Optional[str] = None, sample_rate: float = 1.0,
+              interval_ms: float = 5.0, duration_seconds: float = 60.0):
+        """Begin a session for one route template (e.g. "/api/analytics") or a share of all requests"""
+        self.stop()
+        self._routes = [r for r in routes if getattr(r, "path", None) == route] if route else []
+        if route and not self._routes:
+            raise ValueError(f"Unknown route: {route}")
+
+        self.route = route
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        self.stacks = {}
+        self.samples = 0
+        self.dropped = 0
+        self.profiled_requests = 0
+        self.started_at = time.time()
+        # Sessions always end on their own so a forgotten one cannot tax production
+        self.expires_at = self.started_at + duration_seconds
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        # Work a request hands to child tasks (single-flight, gather) is attributed to it too
+        self._previous_factory = self._loop.get_task_factory()
+        self._loop.set_task_factory(self._task_factory)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._active.clear()
+        if self._loop is not None:
+            self._loop.set_task_factory(self._previous_factory)
+            self._loop = None
+            self._previous_factory = None
+
+    def _expire(self, started_at: float):
+        if started_at == self.started_at:
+            self.stop()
+
+    def _task_factory(self, loop, coro, **kwargs):
+        if self._previous_factory is not None:
+            task = self._previous_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        if asyncio.current_task(loop) in self._active:
+            self._active.add(task)
+            task.add_done_callback(self._active.discard)
+        return task
+
+    def _selects(self, scope) -> bool:
+        if self._routes:
+            if not any(r.matches(scope)[0] == Match.FULL for r in self._routes):
+                return False
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            if time.time() >= self.expires_at:
+                self.enabled = False
+                # Restore the task factory from the loop thread
+                self._loop.call_soon_threadsafe(self._expire, self.started_at)
+                return
+            if not self._active:
+                continue
+            # Attribute the loop thread's stack only while a selected request owns the loop
+            loop = self._loop
+            if loop is None:
+                continue
+            task = asyncio.current_task(loop)
+            if task not in self._active:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = fold_stack(frame)
+            self.samples += 1
+            if stack in self.stacks:
+                self.stacks[stack] += 1
+            elif len(self.stacks) < MAX_STACKS:
+                self.stacks[stack] = 1
+            else:
+                self.dropped += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "route": self.route,
+            "sampleRate": self.sample_rate,
+            "intervalMs": self.interval * 1000,
+            "startedAt": self.started_at,
+            "expiresAt": self.expires_at,
+            "profiledRequests": self.profiled_requests,
+            "samples": self.samples,
+            "distinctStacks": len(self.stacks),
+            "droppedStacks": self.dropped,
+        }
+
+
+class ProfilerMiddleware:
+    """Register selected requests with the profiler; a single flag check when it is off"""
+
+    def __init__(self, app, profiler: SamplingProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        profiler = self.profiler
+        if not profiler.enabled or scope["type"] != "http" or not profiler._selects(scope):
+            return await self.app(scope, receive, send)
+
+        task = asyncio.current_task()
+        profiler._active.add(task)
+        profiler.profiled_requests += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler._active.discard(task)
@@ -0,0 +1,142 @@
+"""
+Bounded LRU/TTL cache for read endpoints.
+
+Entries are keyed by (user, endpoint, params). Write handlers invalidate the
+affected user/endpoint explicitly, so the TTL is only a safety net.
+
+A load takes a token (begin_load) before reading storage and hands it back to
+set(). Invalidations advance the generations the token was taken from, so a
+result read before a concurrent write is dropped instead of being cached
+after that write's invalidation.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+# User key for data that is not scoped to a single user (registry, analytics)
+GLOBAL = "*"
+
+_MISSING = object()
+
+CacheKey = Tuple[str, str, Hashable]
+
+# (global, endpoint, user, user+endpoint) generations when a load started
+LoadToken = Tuple[int, int, int, int]
+
+
+class ReadCache:
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Any]]" = OrderedDict()
+        self._keys_by_user: Dict[str, Set[CacheKey]] = {}
+        # Advanced by invalidate(), at the scope it was called with
+        self._epoch = 0
+        self._endpoint_epochs: Dict[str, int] = {}
+        self._user_generations: Dict[str, int] = {}
+        self._endpoint_generations: Dict[Tuple[str, str], int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_loads = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def get(self, user_id: str, endpoint: str, params: Hashable = ()) -> Any:
+        """Return the cached value, or None on a miss"""
+        key = (user_id, endpoint, params)
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def begin_load(self, user_id: str, endpoint: str) -> LoadToken:
+        """Return a token to pass to set() once the storage read completes"""
+        return (
+            self._epoch,
+            self._endpoint_epochs.get(endpoint, 0),
+            self._user_generations.get(user_id, 0),
+            self._endpoint_generations.get((user_id, endpoint), 0),
+        )
+
+    def set(self, user_id: str, endpoint: str, value: Any, params: Hashable = (), *, token: LoadToken):
+        """Cache a loaded value, unless an invalidation ran since its token was taken"""
+        if not self.enabled or value is None:
+            return
+        if self.begin_load(user_id, endpoint) != token:
+            self.stale_loads += 1
+            return
+
+        key = (user_id, endpoint, params)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        self._keys_by_user.setdefault(user_id, set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            oldest, _ = self._entries.popitem(last=False)
+            self._forget(oldest)
+            self.evictions += 1
+
+    def invalidate(self, user_id: Optional[str] = None, *endpoints: str):
+        """
+        Drop cached entries for a user (all endpoints, or only the given ones).
+        With no user, drop the given endpoints for every user, or everything.
+        """
+        self._advance(user_id, endpoints)
+        if user_id is None:
+            keys = [k for k in self._entries if not endpoints or k[1] in endpoints]
+        else:
+            keys = [k for k in self._keys_by_user.get(user_id, ()) if not endpoints or k[1] in endpoints]
+        for key in keys:
+            self._remove(key)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "maxEntries": self.max_entries,
+            "ttlSeconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "staleLoads": self.stale_loads,
+            "hitRatio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _advance(self, user_id: Optional[str], endpoints: Tuple[str, ...]):
+        if user_id is None and not endpoints:
+            self._epoch += 1
+        elif user_id is None:
+            for endpoint in endpoints:
+                self._endpoint_epochs[endpoint] = self._endpoint_epochs.get(endpoint, 0) + 1
+        elif not endpoints:
+            self._user_generations[user_id] = self._user_generations.get(user_id, 0) + 1
+        else:
+            for endpoint in endpoints:
+                key = (user_id, endpoint)
+                self._endpoint_generations[key] = self._endpoint_generations.get(key, 0) + 1
+
+    def _remove(self, key: CacheKey):
+        self._entries.pop(key, None)
+        self._forget(key)
+
+    def _forget(self, key: CacheKey):
+        keys = self._keys_by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[key[0]]
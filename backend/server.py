@@ -1,26 +1,148 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Header, Request, Response
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.middleware.gzip import GZipMiddleware
 import os
+import functools
+import hmac
 import logging
+import tempfile
+from contextlib import asynccontextmanager
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any, Tuple, Callable, Awaitable, Hashable
+import time
 import uuid
 from datetime import datetime
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+from block_state import BlockStateStore
+from read_cache import ReadCache
+from challenge_cache import BANDS, ChallengeCache, success_band, verify_answer
+from single_flight import SingleFlight, flight_key
+from versions import VersionRegistry, etag_matches
+from ingest import IngestBuffer, parse_write_concern
+from storage import READ_PREFERENCES, Change, DuplicateAppError, Storage, create_storage
+from metrics import HttpMetricsMiddleware, MetricsRegistry, MongoCommandMetrics
+from profiler import ProfilerMiddleware, SamplingProfiler
+from slow_queries import RequestScopeMiddleware, SlowQueryLog
+from admission import CRITICAL, DEFAULT_LIMITS, AdmissionController, AdmissionMiddleware
+from invalidation import EVERYTHING, Invalidation, InvalidationBus, create_bus
+from daily_reset import DailyResetScheduler, DEFAULT_TIMEZONE, is_valid_timezone, local_day_window, local_today, reset_pending
 
 ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Storage backend and background workers are created by the lifespan
+# handler (see init_resources), so importing this module stays cheap.
+storage: Optional[Storage] = None
+# Route template -> storage bound to that route's read preference (see reader())
+read_storages: Dict[str, Storage] = {}
+llm_api_key: Optional[str] = None
 
-# Create the main app without a prefix
-app = FastAPI(title="Brain Rot Reduction API")
+# Blocked-package snapshots served to the on-device enforcer
+block_state = BlockStateStore()
+
+# Per-user read cache, invalidated explicitly by the write handlers
+# (resized from settings at startup)
+read_cache = ReadCache()
+
+# Validated LLM challenges per (difficulty, success band), shared across users
+# (resized from settings at startup)
+challenge_cache = ChallengeCache()
+
+# Coalesces concurrent identical expensive reads into one query
+single_flight = SingleFlight()
+
+# Version counters behind the ETags of the read endpoints
+versions = VersionRegistry()
+
+# Process-local metrics exposed at /metrics
+metrics = MetricsRegistry()
+mongo_metrics = MongoCommandMetrics(metrics)
+http_in_flight = metrics.gauge(
+    "http_requests_in_flight", "HTTP requests currently being served", ["method"]
+)
+http_latency = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ["method", "route", "status"]
+)
+llm_latency = metrics.histogram(
+    "llm_request_duration_seconds", "LLM challenge generation latency", ["outcome"],
+    buckets=(0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+)
+challenges_generated = metrics.counter(
+    "challenges_generated_total", "Challenges generated by source", ["source", "reason"]
+)
+cache_metrics = metrics.gauge(
+    "read_cache", "Read cache counters (hits, misses, evictions, stale_loads, size, hit_ratio)", ["stat"]
+)
+challenge_cache_metrics = metrics.gauge(
+    "challenge_cache", "LLM challenge pool counters (hits, misses, evictions, size)", ["stat"]
+)
+single_flight_metrics = metrics.gauge(
+    "single_flight", "Single-flight executed vs coalesced reads", ["stat"]
+)
+ingest_metrics = metrics.gauge(
+    "ingest_buffer", "Write-behind usage session ingest counters", ["stat"]
+)
+admission_metrics = metrics.gauge(
+    "admission", "Admission control slots, queue depth and rejections per limit", ["limit", "stat"]
+)
+invalidation_metrics = metrics.gauge(
+    "invalidation_bus", "Cross-worker invalidations published, received and lost", ["stat"]
+)
+
+def collect_component_metrics():
+    stats = read_cache.stats()
+    for stat in ("hits", "misses", "evictions", "size"):
+        cache_metrics.set(stats[stat], stat=stat)
+    cache_metrics.set(stats["staleLoads"], stat="stale_loads")
+    cache_metrics.set(stats["hitRatio"], stat="hit_ratio")
+    stats = challenge_cache.stats()
+    for stat in ("hits", "misses", "evictions", "size"):
+        challenge_cache_metrics.set(stats[stat], stat=stat)
+    for stat, value in single_flight.stats().items():
+        single_flight_metrics.set(value, stat=stat)
+    if ingest_buffer is not None:
+        for stat, value in ingest_buffer.stats().items():
+            ingest_metrics.set(value, stat=stat)
+    for name, limit in admission.limits.items():
+        for stat, value in limit.stats().items():
+            admission_metrics.set(value, limit=name, stat=stat)
+    if admission.rate_limiter is not None:
+        admission_metrics.set(admission.rate_limiter.limited, limit="polling", stat="limited")
+    if invalidation_bus is not None:
+        for stat in ("published", "received", "lost", "pending"):
+            invalidation_metrics.set(invalidation_bus.stats()[stat], stat=stat)
+
+metrics.add_collector(collect_component_metrics)
+
+# Admin-controlled request profiler; idle unless a session is started
+profiler = SamplingProfiler()
+
+# Priority class per route template; unlisted routes are "standard".
+# Critical routes are never queued or shed.
+ROUTE_PRIORITIES = {
+    "/metrics": CRITICAL,
+    "/api/health": CRITICAL,
+    "/api/apps/blocked": CRITICAL,
+    "/api/usage/session": CRITICAL,
+    "/api/apps/monitored/{app_id}/usage": CRITICAL,
+    "/api/analytics": "expensive",
+    "/api/analytics/heatmap": "expensive",
+    "/api/analytics/timeseries": "expensive",
+    "/api/usage/sessions": "expensive",
+    "/api/apps/search": "expensive",
+    "/api/challenges/generate": "llm",
+}
+# Routes clients poll; capped per client by POLL_RATE_PER_SECOND / POLL_BURST.
+# Block state is critical and stays uncapped so enforcement never sees a 429.
+POLLED_ROUTES = ("/api/usage/realtime", "/api/apps/monitored", "/api/sync")
+
+admission = AdmissionController(ROUTE_PRIORITIES, POLLED_ROUTES)
+
+# Reporting reads that tolerate replication lag and may be sent to secondaries.
+# Ingest, block state and challenge submission always read from the primary.
+ROUTABLE_READS = ("/api/analytics", "/api/usage/sessions", "/api/apps/search")
+DEFAULT_READ_ROUTES = "/api/analytics=secondaryPreferred,/api/usage/sessions=secondaryPreferred"
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -32,9 +154,104 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class Settings(BaseModel):
+    # mongo (default), sqlite for the local single-device mode, or memory
+    storage_backend: Literal["mongo", "sqlite", "memory"] = "mongo"
+    sqlite_path: str = str(ROOT_DIR / "mindclear.db")
+    mongo_url: Optional[str] = None
+    db_name: Optional[str] = None
+    llm_api_key: Optional[str] = None
+    # Per-process pool bounds; with N workers the server sees up to N * max
+    mongo_max_pool_size: Optional[int] = None
+    mongo_min_pool_size: Optional[int] = None
+    mongo_warmup_timeout_seconds: float = 5.0
+    # legacy, dual (mirror writes to the compact collections) or compact
+    mongo_schema: Literal["legacy", "dual", "compact"] = "legacy"
+    read_cache_max_entries: int = 2048
+    read_cache_ttl_seconds: float = 30.0
+    # Pooled LLM challenges per (difficulty, success band); 0 calls the provider every time
+    challenge_cache_size: int = 100
+    daily_reset_interval_seconds: float = 60.0
+    ingest_buffer_enabled: bool = False
+    ingest_max_queue: int = 10000
+    ingest_flush_size: int = 500
+    ingest_flush_interval_seconds: float = 1.0
+    ingest_write_concern: str = "1"
+    # How long shutdown keeps retrying a failing flush before giving up on queued sessions
+    ingest_drain_timeout_seconds: float = 30.0
+    # Slow-query log is off unless a threshold is set
+    slow_query_threshold_ms: Optional[float] = None
+    slow_query_explain: bool = True
+    slow_query_log_file: Optional[str] = None
+    slow_query_capped_size_mb: int = 16
+    # Admin endpoints are disabled unless a token is configured
+    admin_token: Optional[str] = None
+    admission_enabled: bool = True
+    # "class_or_route=concurrency[:queue],..." e.g. "expensive=8:32,/api/analytics=4"
+    admission_limits: str = DEFAULT_LIMITS
+    admission_max_wait_seconds: float = 2.0
+    # Per-client polling cap (clients poll every 30-60s); off by default because
+    # X-Device-Id is only a claim and clients on older builds share their address
+    poll_rate_per_second: float = 0.0
+    poll_burst: int = 20
+    # "route=readPreference,..." for the routes in ROUTABLE_READS
+    read_routes: str = DEFAULT_READ_ROUTES
+    # Secondaries lagging further than this are not read from (MongoDB minimum 90)
+    read_max_staleness_seconds: int = 120
+    # none (one worker), unix (workers on one host) or mongo (change stream, any topology)
+    invalidation_transport: Literal["none", "unix", "mongo"] = "none"
+    invalidation_socket_dir: str = str(Path(tempfile.gettempdir()) / "mindclear-bus")
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """Read settings from the environment, failing with a clear message if required ones are missing"""
+        env = os.environ.get
+        backend = env("STORAGE_BACKEND", "mongo")
+        if backend == "mongo":
+            missing = [name for name in ("MONGO_URL", "DB_NAME") if not env(name)]
+            if missing:
+                raise RuntimeError(f"Missing required environment variables: {', '.join(missing)}")
+        
+        return cls(
+            storage_backend=backend,
+            sqlite_path=env("SQLITE_PATH", str(ROOT_DIR / "mindclear.db")),
+            mongo_url=env("MONGO_URL"),
+            db_name=env("DB_NAME"),
+            llm_api_key=env("EMERGENT_LLM_KEY") or None,
+            mongo_max_pool_size=env("MONGO_MAX_POOL_SIZE") or None,
+            mongo_min_pool_size=env("MONGO_MIN_POOL_SIZE") or None,
+            mongo_warmup_timeout_seconds=env("MONGO_WARMUP_TIMEOUT_SECONDS", "5"),
+            mongo_schema=env("MONGO_SCHEMA", "legacy"),
+            read_cache_max_entries=env("READ_CACHE_MAX_ENTRIES", "2048"),
+            read_cache_ttl_seconds=env("READ_CACHE_TTL_SECONDS", "30"),
+            challenge_cache_size=env("CHALLENGE_CACHE_SIZE", "100"),
+            daily_reset_interval_seconds=env("DAILY_RESET_INTERVAL_SECONDS", "60"),
+            ingest_buffer_enabled=env("INGEST_BUFFER_ENABLED", "false").lower() == "true",
+            ingest_max_queue=env("INGEST_MAX_QUEUE", "10000"),
+            ingest_flush_size=env("INGEST_FLUSH_SIZE", "500"),
+            ingest_flush_interval_seconds=env("INGEST_FLUSH_INTERVAL_SECONDS", "1.0"),
+            ingest_write_concern=env("INGEST_WRITE_CONCERN", "1"),
+            ingest_drain_timeout_seconds=env("INGEST_DRAIN_TIMEOUT_SECONDS", "30"),
+            slow_query_threshold_ms=env("SLOW_QUERY_THRESHOLD_MS") or None,
+            slow_query_explain=env("SLOW_QUERY_EXPLAIN", "true").lower() == "true",
+            slow_query_log_file=env("SLOW_QUERY_LOG_FILE") or None,
+            slow_query_capped_size_mb=env("SLOW_QUERY_CAPPED_SIZE_MB", "16"),
+            admin_token=env("ADMIN_TOKEN") or None,
+            admission_enabled=env("ADMISSION_ENABLED", "true").lower() == "true",
+            admission_limits=env("ADMISSION_LIMITS", DEFAULT_LIMITS),
+            admission_max_wait_seconds=env("ADMISSION_MAX_WAIT_SECONDS", "2"),
+            poll_rate_per_second=env("POLL_RATE_PER_SECOND", "0"),
+            poll_burst=env("POLL_BURST", "20"),
+            read_routes=env("READ_ROUTES", DEFAULT_READ_ROUTES),
+            read_max_staleness_seconds=env("READ_MAX_STALENESS_SECONDS", "120"),
+            invalidation_transport=env("INVALIDATION_BUS", "none"),
+            invalidation_socket_dir=env("INVALIDATION_SOCKET_DIR", str(Path(tempfile.gettempdir()) / "mindclear-bus")),
+        )
+
 # Models
 class Challenge(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    userId: str = "default"
     question: str
     answer: int
     difficulty: str = "medium"
@@ -43,11 +260,13 @@ class Challenge(BaseModel):
     correct: Optional[bool] = None
 
 class ChallengeRequest(BaseModel):
+    userId: str = "default"
     difficulty: Optional[str] = "medium"
     user_performance: Optional[List[Dict[str, Any]]] = []
 
 class AppInfo(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    userId: str = "default"
     packageName: str
     appName: str
     displayName: str
@@ -70,9 +289,21 @@ class MonitoredApp(BaseModel):
     isBlocked: bool = False
     category: Optional[str] = "social"
     isActive: bool = True
+    timezone: Optional[str] = DEFAULT_TIMEZONE  # owner's IANA timezone, drives the daily reset
+    lastResetDate: Optional[str] = None  # local date of the last timeUsed reset
     createdAt: datetime = Field(default_factory=datetime.utcnow)
     updatedAt: datetime = Field(default_factory=datetime.utcnow)
 
+class MonitoredAppOperation(BaseModel):
+    op: Literal["add", "update_limit", "remove"]
+    app: Optional[MonitoredApp] = None  # required for add
+    id: Optional[str] = None  # monitored app id, required for update_limit/remove
+    dailyLimit: Optional[int] = None  # required for update_limit
+
+class BulkMonitoredAppRequest(BaseModel):
+    userId: str = "default"
+    operations: List[MonitoredAppOperation]
+
 class UsageSession(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     userId: Optional[str] = "default"
@@ -84,6 +315,21 @@ class UsageSession(BaseModel):
     date: str
     sessionType: str = "active"  # active, background, foreground
 
+class UserSettings(BaseModel):
+    userId: str = "default"
+    timezone: str = DEFAULT_TIMEZONE
+    updatedAt: datetime = Field(default_factory=datetime.utcnow)
+
+class UserSettingsUpdate(BaseModel):
+    timezone: str
+
+class ProfilerRequest(BaseModel):
+    enabled: bool = True
+    route: Optional[str] = None  # route template, e.g. "/api/analytics"; all routes if omitted
+    sampleRate: float = Field(default=1.0, gt=0, le=1)
+    intervalMs: float = Field(default=5.0, ge=1, le=1000)
+    durationSeconds: float = Field(default=60.0, gt=0, le=3600)
+
 class Analytics(BaseModel):
     totalTimeUsed: int
     averageDaily: float
@@ -92,16 +338,210 @@ class Analytics(BaseModel):
     challengesCompleted: int
     timeEarned: int
 
-# Initialize LLM Chat
-llm_api_key = os.environ.get('EMERGENT_LLM_KEY')
-if not llm_api_key:
-    logger.warning("EMERGENT_LLM_KEY not found, using fallback challenge generation")
+def require_admin(token: Optional[str]):
+    """Reject requests without the configured admin token"""
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token, admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+async def get_user_timezone(user_id: str) -> str:
+    """Helper function to get a user's IANA timezone name"""
+    settings = await storage.user_settings.get(user_id)
+    return settings.get("timezone", DEFAULT_TIMEZONE) if settings else DEFAULT_TIMEZONE
+
+def parse_read_routes(spec: str) -> Dict[str, str]:
+    """Parse "route=readPreference,..." and reject routes that must stay on the primary"""
+    routes = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        route, _, mode = (part.strip() for part in item.partition("="))
+        if route not in ROUTABLE_READS:
+            raise ValueError(f"Read routing is not supported for {route}; choose from {', '.join(ROUTABLE_READS)}")
+        if mode not in READ_PREFERENCES:
+            raise ValueError(f"Unknown read preference {mode!r} for {route}")
+        routes[route] = mode
+    return routes
+
+def reader(route: str) -> Storage:
+    """Storage to read from for a route: a secondary-routed view if configured, else the primary"""
+    return read_storages.get(route, storage)
+
+def json_response(content: Any, status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> ORJSONResponse:
+    """
+    Serialize trusted data straight to orjson, skipping jsonable_encoder and
+    response_model re-validation. Documents must be projected without _id.
+    """
+    return ORJSONResponse(content, status_code=status_code, headers=headers)
+
+# Lean default response shapes for list endpoints; ?fields=all returns whole documents
+REGISTRY_DEFAULT_FIELDS = ("id", "packageName", "appName", "displayName", "category", "icon", "isSystemApp")
+MONITORED_DEFAULT_FIELDS = (
+    "id", "packageName", "appName", "displayName", "icon",
+    "dailyLimit", "timeUsed", "isBlocked", "category"
+)
+SESSION_DEFAULT_FIELDS = ("id", "packageName", "appName", "duration", "timestamp", "date")
+# lastResetDate tells /api/sync whether today's reset has reached every app
+SYNC_APP_PROJECTION = {"_id": 0, **{f: 1 for f in MONITORED_DEFAULT_FIELDS}, "lastResetDate": 1}
+
+def parse_fields(fields: Optional[str], model: type, default: tuple) -> Dict[str, int]:
+    """Turn a comma-separated ?fields= value into a Mongo projection"""
+    if fields == "all":
+        return {"_id": 0}
+    
+    requested = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(default)
+    unknown = [f for f in requested if f not in model.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    
+    projection = {"_id": 0}
+    projection.update({f: 1 for f in requested})
+    return projection
+
+def projection_key(projection: Dict[str, int]) -> tuple:
+    """Hashable form of a projection for cache and single-flight keys"""
+    return tuple(sorted(projection))
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag))
+
+def validator_headers(etag: str) -> Dict[str, str]:
+    # no-cache: clients may store the body but must revalidate with If-None-Match
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+async def load_cached(
+    user_id: str,
+    endpoint: str,
+    params: Hashable,
+    current_etag: Callable[[], str],
+    load: Callable[[], Awaitable[Any]],
+    flight: Optional[Tuple] = None
+) -> Tuple[str, Any]:
+    """
+    (ETag, body) for a cached read endpoint. The ETag is taken before storage
+    is read, so it never claims a newer version than the body reflects, and is
+    cached with the body; a hit is only served while that ETag is still current.
+    """
+    cached = read_cache.get(user_id, endpoint, params=params)
+    if cached is not None and cached[0] == current_etag():
+        return cached
+    
+    token = read_cache.begin_load(user_id, endpoint)
+    
+    async def fill() -> Tuple[str, Any]:
+        etag = current_etag()
+        body = await load()
+        read_cache.set(user_id, endpoint, (etag, body), params=params, token=token)
+        return etag, body
+    
+    if flight is None:
+        return await fill()
+    # Requests after an invalidation start a new load rather than join one that predates it
+    return await single_flight.do((flight, token), fill)
+
+# Cached endpoints built from each collection; a write to it drops only these
+CACHED_READS = {
+    "monitored_apps": ("monitored_apps", "realtime_usage"),
+    "usage_sessions": ("realtime_usage", "analytics", "analytics_heatmap", "analytics_timeseries"),
+    "challenges": ("analytics",),
+    "app_registry": ("app_registry",),
+}
+
+def invalidate_cached_reads(collection: str, user_id: Optional[str] = None):
+    """Drop cached reads built from a collection, for one user or for everyone"""
+    read_cache.invalidate(user_id, *CACHED_READS[collection])
+
+def invalidate_user_reads(user_id: str):
+    """Drop cached reads for a user after their monitored apps change"""
+    invalidate_cached_reads("monitored_apps", user_id)
+    versions.bump("monitored_apps", user_id)
+    publish_invalidation("monitored_apps", user_id)
+
+def publish_invalidation(collection: str, user_id: Optional[str] = None):
+    """Tell the other workers that a user's documents in a collection changed"""
+    if invalidation_bus is not None:
+        invalidation_bus.publish(collection, user_id)
+
+def apply_invalidations(events: List[Invalidation]):
+    """Bring this worker's caches, block snapshots and ETags up to date with another worker's writes"""
+    for collection, user_id in events:
+        if collection == EVERYTHING:
+            read_cache.invalidate()
+            block_state.invalidate()
+            for name in ("monitored_apps", "usage_sessions", "challenges", "app_registry"):
+                versions.bump(name)
+        elif collection in ("challenges", "app_registry"):
+            invalidate_cached_reads(collection, user_id)
+            versions.bump(collection, user_id)
+        else:
+            # Apps and sessions both move usage totals and block state
+            invalidate_cached_reads("monitored_apps", user_id)
+            block_state.invalidate(user_id)
+            versions.bump("monitored_apps", user_id)
+            if collection == "usage_sessions":
+                invalidate_cached_reads("usage_sessions", user_id)
+                versions.bump("usage_sessions", user_id)
+
+async def record_changes(user_id: str, *changes: Change):
+    """Append to the user's change log so /api/sync picks up the write"""
+    if changes:
+        await storage.sync_log.append(user_id, list(changes))
+
+@functools.lru_cache(maxsize=None)
+def load_llm_client():
+    """Import the LLM integration on first use; it is heavy and only needed for challenges"""
+    from emergentintegrations.llm.chat import LlmChat, UserMessage
+    return LlmChat, UserMessage
+
+# LLM calls per request before repeated questions fall back to a generated challenge
+CHALLENGE_LLM_ATTEMPTS = 3
+# Questions listed in the prompt for the model to avoid
+CHALLENGE_AVOID_RECENT = 10
+# Refill numbers restart in every worker and after every restart; this keeps session ids apart
+CHALLENGE_SESSION_PREFIX = uuid.uuid4().hex[:12]
+
+async def request_llm_challenge(difficulty: str, band: str, refill: int, avoid: List[str]) -> str:
+    """Ask the LLM for one challenge; each refill is its own session so answers are not replayed"""
+    avoid_text = "\n".join(f"- {question}" for question in avoid) or "- (none yet)"
+    LlmChat, UserMessage = load_llm_client()
+    chat = LlmChat(
+        api_key=llm_api_key,
+        session_id=f"challenge_{CHALLENGE_SESSION_PREFIX}_{difficulty}_{band}_{refill}",
+        system_message=f"""You are a math challenge generator for a brain training app. 
+        Generate a single math problem appropriate for {difficulty} level.
+        
+        Difficulty guidelines:
+        - Easy: Single digit operations, basic addition/subtraction (reward: 5-7 minutes)
+        - Medium: Two digit operations, multiplication/division (reward: 8-10 minutes)  
+        - Hard: Multi-digit operations, complex calculations (reward: 12-15 minutes)
+        
+        User's recent success rate: {BANDS[band]}
+        
+        Respond with ONLY a JSON object in this exact format:
+        {{"question": "12 + 8 = ?", "answer": 20, "timeReward": 8}}
+        
+        Make sure the answer is a whole number."""
+    ).with_model("openai", "gpt-4o-mini")
+    
+    user_message = UserMessage(
+        text=f"Generate {difficulty} math challenge #{refill}. Success rate: {BANDS[band]}\n"
+             f"It must differ from all of these questions:\n{avoid_text}"
+    )
+    
+    started = time.perf_counter()
+    try:
+        response = await chat.send_message(user_message)
+    except Exception:
+        llm_latency.observe(time.perf_counter() - started, outcome="error")
+        raise
+    llm_latency.observe(time.perf_counter() - started, outcome="success")
+    return response
 
-async def generate_ai_challenge(difficulty: str, user_performance: List[Dict]) -> Challenge:
+async def generate_ai_challenge(difficulty: str, user_performance: List[Dict], user_id: str = "default") -> Challenge:
     """Generate a math challenge using AI based on user performance"""
     try:
         if not llm_api_key:
-            return generate_fallback_challenge(difficulty)
+            challenges_generated.inc(source="fallback", reason="no_api_key")
+            return generate_fallback_challenge(difficulty, user_id)
             
         # Analyze user performance to adjust difficulty
         recent_performance = user_performance[-5:] if user_performance else []
@@ -125,56 +565,62 @@ async def generate_ai_challenge(difficulty: str, user_performance: List[Dict]) -
             # Invalid difficulty, default to medium
             actual_difficulty = "medium"
         
-        # Create LLM chat instance
-        chat = LlmChat(
-            api_key=llm_api_key,
-            session_id=f"challenge_{datetime.now().timestamp()}",
-            system_message=f"""You are a math challenge generator for a brain training app. 
-            Generate a single math problem appropriate for {actual_difficulty} level.
-            
-            Difficulty guidelines:
-            - Easy: Single digit operations, basic addition/subtraction (reward: 5-7 minutes)
-            - Medium: Two digit operations, multiplication/division (reward: 8-10 minutes)  
-            - Hard: Multi-digit operations, complex calculations (reward: 12-15 minutes)
-            
-            User's recent success rate: {success_rate:.1%}
-            
-            Respond with ONLY a JSON object in this exact format:
-            {{"question": "12 + 8 = ?", "answer": 20, "timeReward": 8}}
-            
-            Make sure the answer is a whole number."""
-        ).with_model("openai", "gpt-4o-mini")
-        
-        user_message = UserMessage(
-            text=f"Generate a {actual_difficulty} math challenge. Success rate: {success_rate:.1%}"
-        )
-        
-        response = await chat.send_message(user_message)
+        # The prompt only sees the band, so equivalent requests can share a challenge
+        band = success_band(success_rate)
+        cached = challenge_cache.take(actual_difficulty, band, user_id)
+        if cached is not None:
+            challenge = Challenge(userId=user_id, difficulty=actual_difficulty, **cached)
+            await storage.challenges.insert(challenge.dict())
+            challenges_generated.inc(source="cache", reason="")
+            return challenge
         
-        # Parse AI response
+        # A repeat of something the user has seen is pooled for others and asked again
         import json
-        try:
-            ai_data = json.loads(response.strip())
-            challenge = Challenge(
-                question=ai_data["question"],
-                answer=int(ai_data["answer"]),
-                difficulty=actual_difficulty,
-                timeReward=int(ai_data["timeReward"]),
+        for _ in range(CHALLENGE_LLM_ATTEMPTS):
+            avoid = challenge_cache.recent(actual_difficulty, band, user_id, limit=CHALLENGE_AVOID_RECENT)
+            response = await request_llm_challenge(
+                actual_difficulty, band, challenge_cache.next_refill(actual_difficulty, band), avoid
             )
             
+            # Parse AI response
+            try:
+                ai_data = json.loads(response.strip())
+                challenge = Challenge(
+                    userId=user_id,
+                    question=ai_data["question"],
+                    answer=int(ai_data["answer"]),
+                    difficulty=actual_difficulty,
+                    timeReward=int(ai_data["timeReward"]),
+                )
+            except (json.JSONDecodeError, KeyError, ValueError) as e:
+                logger.error(f"Failed to parse AI response: {e}, response: {response}")
+                challenges_generated.inc(source="fallback", reason="parse_error")
+                return generate_fallback_challenge(actual_difficulty, user_id)
+            
+            if challenge.timeReward > 0 and verify_answer(challenge.question, challenge.answer):
+                challenge_cache.add(actual_difficulty, band, {
+                    "question": challenge.question,
+                    "answer": challenge.answer,
+                    "timeReward": challenge.timeReward,
+                })
+            if challenge_cache.has_seen(user_id, challenge.question):
+                continue
+            
             # Store challenge in database
-            await db.challenges.insert_one(challenge.dict())
+            await storage.challenges.insert(challenge.dict())
+            challenges_generated.inc(source="llm", reason="")
+            challenge_cache.mark_seen(user_id, challenge.question)
             return challenge
-            
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
-            logger.error(f"Failed to parse AI response: {e}, response: {response}")
-            return generate_fallback_challenge(actual_difficulty)
+        
+        challenges_generated.inc(source="fallback", reason="repeat")
+        return generate_fallback_challenge(actual_difficulty, user_id)
             
     except Exception as e:
         logger.error(f"AI challenge generation failed: {e}")
-        return generate_fallback_challenge(difficulty)
+        challenges_generated.inc(source="fallback", reason="error")
+        return generate_fallback_challenge(difficulty, user_id)
 
-def generate_fallback_challenge(difficulty: str) -> Challenge:
+def generate_fallback_challenge(difficulty: str, user_id: str = "default") -> Challenge:
     """Fallback challenge generation when AI is unavailable"""
     import random
     
@@ -210,6 +656,7 @@ def generate_fallback_challenge(difficulty: str) -> Challenge:
     selected = random.choice(challenges[difficulty_key])
     
     return Challenge(
+        userId=user_id,
         question=selected["question"],
         answer=selected["answer"],
         difficulty=difficulty_key,
@@ -227,7 +674,8 @@ async def generate_challenge(request: ChallengeRequest):
     try:
         challenge = await generate_ai_challenge(
             request.difficulty or "medium",
-            request.user_performance or []
+            request.user_performance or [],
+            request.userId
         )
         return challenge
     except Exception as e:
@@ -235,20 +683,22 @@ async def generate_challenge(request: ChallengeRequest):
         raise HTTPException(status_code=500, detail="Failed to generate challenge")
 
 @api_router.post("/challenges/{challenge_id}/submit")
-async def submit_challenge(challenge_id: str, answer: int):
+async def submit_challenge(challenge_id: str, answer: int, user_id: str = "default"):
     """Submit an answer for a challenge"""
     try:
-        challenge = await db.challenges.find_one({"id": challenge_id})
+        challenge = await storage.challenges.get(user_id, challenge_id)
         if not challenge:
             raise HTTPException(status_code=404, detail="Challenge not found")
         
         correct = answer == challenge["answer"]
         
         # Update challenge in database
-        await db.challenges.update_one(
-            {"id": challenge_id},
-            {"$set": {"completed": True, "correct": correct}}
-        )
+        await storage.challenges.set_result(user_id, challenge_id, correct)
+        invalidate_cached_reads("challenges", user_id)
+        versions.bump("challenges", user_id)
+        publish_invalidation("challenges", user_id)
+        if correct:
+            await record_changes(user_id, ("reward", challenge_id))
         
         return {
             "correct": correct,
@@ -268,35 +718,40 @@ async def submit_challenge(challenge_id: str, answer: int):
 async def register_app(app_info: AppInfo):
     """Register a new app detected on the device"""
     try:
-        # Check if app already exists
-        existing_app = await db.app_registry.find_one({"packageName": app_info.packageName})
-        if existing_app:
-            # Update existing app info
-            await db.app_registry.update_one(
-                {"packageName": app_info.packageName},
-                {"$set": app_info.dict()}
-            )
-        else:
-            # Insert new app
-            await db.app_registry.insert_one(app_info.dict())
+        # Insert, or update the existing entry for this package
+        await storage.app_registry.upsert(app_info.dict())
         
+        invalidate_cached_reads("app_registry", app_info.userId)
+        versions.bump("app_registry", app_info.userId)
+        publish_invalidation("app_registry", app_info.userId)
         return app_info
     except Exception as e:
         logger.error(f"Failed to register app: {e}")
         raise HTTPException(status_code=500, detail="Failed to register app")
 
 @api_router.get("/apps/registry")
-async def get_app_registry():
+async def get_app_registry(
+    user_id: str = "default",
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(default=None)
+):
     """Get all registered apps from device scan"""
+    projection = parse_fields(fields, AppInfo, REGISTRY_DEFAULT_FIELDS)
     try:
-        apps = await db.app_registry.find({}).to_list(1000)
+        key = projection_key(projection)
+        def current_etag() -> str:
+            return versions.etag(("app_registry", user_id), variant=key)
+        etag = current_etag()
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
         
-        # Convert ObjectId to string for JSON serialization
-        for app in apps:
-            if "_id" in app:
-                app["_id"] = str(app["_id"])
+        etag, apps = await load_cached(
+            user_id, "app_registry", key, current_etag,
+            lambda: storage.app_registry.list(user_id, projection),
+            flight=flight_key("/apps/registry", user_id=user_id, fields=key)
+        )
         
-        return apps
+        return json_response(apps, headers=validator_headers(etag))
     except Exception as e:
         logger.error(f"Failed to get app registry: {e}")
         raise HTTPException(status_code=500, detail="Failed to get app registry")
@@ -305,17 +760,18 @@ async def get_app_registry():
 async def add_monitored_app(monitored_app: MonitoredApp):
     """Add an app to monitoring list"""
     try:
-        # Check if already being monitored
-        existing = await db.monitored_apps.find_one({
-            "packageName": monitored_app.packageName,
-            "userId": monitored_app.userId,
-            "isActive": True
-        })
+        # Counters start fresh in the owner's local day
+        monitored_app.timezone = await get_user_timezone(monitored_app.userId)
+        monitored_app.lastResetDate = local_today(monitored_app.timezone).isoformat()
         
-        if existing:
+        try:
+            await storage.monitored_apps.insert(monitored_app.dict())
+        except DuplicateAppError:
             raise HTTPException(status_code=400, detail="App is already being monitored")
         
-        await db.monitored_apps.insert_one(monitored_app.dict())
+        block_state.set_blocked(monitored_app.userId, monitored_app.packageName, monitored_app.isBlocked)
+        invalidate_user_reads(monitored_app.userId)
+        await record_changes(monitored_app.userId, ("app", monitored_app.id))
         return monitored_app
     except HTTPException:
         raise
@@ -323,43 +779,151 @@ async def add_monitored_app(monitored_app: MonitoredApp):
         logger.error(f"Failed to add monitored app: {e}")
         raise HTTPException(status_code=500, detail="Failed to add monitored app")
 
+@api_router.post("/apps/monitored/bulk")
+async def bulk_configure_monitored_apps(request: BulkMonitoredAppRequest):
+    """Add, re-limit and remove monitored apps in a single unordered bulk write"""
+    # (position in request.operations, storage operation)
+    requests = []
+    added_apps = []
+    errors = []
+    
+    timezone_name = await get_user_timezone(request.userId)
+    now = datetime.utcnow()
+    
+    for index, operation in enumerate(request.operations):
+        if operation.op == "add":
+            if operation.app is None:
+                errors.append({"index": index, "op": operation.op, "detail": "app is required"})
+                continue
+            monitored_app = operation.app
+            monitored_app.userId = request.userId
+            monitored_app.timezone = timezone_name
+            monitored_app.lastResetDate = local_today(timezone_name).isoformat()
+            requests.append((index, ("add", monitored_app.dict())))
+            added_apps.append((index, monitored_app))
+        elif operation.op == "update_limit":
+            if not operation.id or operation.dailyLimit is None:
+                errors.append({"index": index, "op": operation.op, "detail": "id and dailyLimit are required"})
+                continue
+            # isBlocked is recomputed against the stored timeUsed
+            requests.append((index, ("update_limit", operation.id, operation.dailyLimit)))
+        else:
+            if not operation.id:
+                errors.append({"index": index, "op": operation.op, "detail": "id is required"})
+                continue
+            requests.append((index, ("remove", operation.id)))
+    
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+    
+    if not requests:
+        return {"success": True, "added": [], "inserted": 0, "modified": 0, "errors": []}
+    
+    try:
+        result = await storage.monitored_apps.bulk_write(
+            request.userId, [op for _, op in requests], now
+        )
+        
+        # Map storage positions back to indexes in the request
+        failed = set()
+        for err in result.errors:
+            index = requests[err["index"]][0]
+            failed.add(index)
+            detail = "App is already being monitored" if err["duplicate"] else err["errmsg"]
+            errors.append({"index": index, "op": request.operations[index].op, "detail": detail})
+        # Same answer as the single-app routes give with 404
+        for position in result.unmatched:
+            index = requests[position][0]
+            failed.add(index)
+            errors.append({"index": index, "op": request.operations[index].op, "detail": "Monitored app not found"})
+        errors.sort(key=lambda error: error["index"])
+        
+        # Block state for this user may have changed in several places at once
+        block_state.invalidate(request.userId)
+        invalidate_user_reads(request.userId)
+        await record_changes(request.userId, *[
+            ("app", op[1]["id"] if op[0] == "add" else op[1])
+            for index, op in requests if index not in failed
+        ])
+        
+        return {
+            "success": not errors,
+            "added": [app for position, app in added_apps if position not in failed],
+            "inserted": result.inserted,
+            "modified": result.modified,
+            "errors": errors
+        }
+    except Exception as e:
+        logger.error(f"Failed to bulk configure monitored apps: {e}")
+        raise HTTPException(status_code=500, detail="Failed to bulk configure monitored apps")
+
 @api_router.get("/apps/monitored")
-async def get_monitored_apps(user_id: str = "default"):
+async def get_monitored_apps(
+    user_id: str = "default",
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(default=None)
+):
     """Get all monitored apps for a user"""
+    projection = parse_fields(fields, MonitoredApp, MONITORED_DEFAULT_FIELDS)
     try:
-        apps = await db.monitored_apps.find({
-            "userId": user_id,
-            "isActive": True
-        }).to_list(100)
+        key = projection_key(projection)
+        def current_etag() -> str:
+            return versions.etag(("monitored_apps", user_id), variant=key)
+        etag = current_etag()
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
         
-        # Convert ObjectId to string for JSON serialization
-        for app in apps:
-            if "_id" in app:
-                app["_id"] = str(app["_id"])
+        etag, apps = await load_cached(
+            user_id, "monitored_apps", key, current_etag,
+            lambda: storage.monitored_apps.list_active(user_id, projection)
+        )
         
-        return apps
+        return json_response(apps, headers=validator_headers(etag))
     except Exception as e:
         logger.error(f"Failed to get monitored apps: {e}")
         raise HTTPException(status_code=500, detail="Failed to get monitored apps")
 
+async def load_block_snapshot(user_id: str):
+    snapshot = block_state.get(user_id)
+    if snapshot is None:
+        token = block_state.begin_load(user_id)
+        blocked = await storage.monitored_apps.blocked_packages(user_id)
+        snapshot = block_state.finish_load(user_id, token, blocked)
+    return snapshot
+
+@api_router.get("/apps/blocked")
+async def get_blocked_apps(
+    user_id: str = "default",
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """Compact, versioned list of currently blocked package names for the enforcer"""
+    try:
+        snapshot = await load_block_snapshot(user_id)
+        
+        if etag_matches(if_none_match, snapshot.etag):
+            return not_modified(snapshot.etag)
+        
+        return json_response(snapshot.to_payload(), headers=validator_headers(snapshot.etag))
+    except Exception as e:
+        logger.error(f"Failed to get blocked apps: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get blocked apps")
+
 @api_router.put("/apps/monitored/{app_id}/usage")
-async def update_app_usage(app_id: str, time_used: int):
+async def update_app_usage(app_id: str, time_used: int, user_id: str = "default"):
     """Update app usage time"""
     try:
-        result = await db.monitored_apps.update_one(
-            {"id": app_id},
-            {
-                "$set": {
-                    "timeUsed": time_used,
-                    "isBlocked": time_used >= await get_app_daily_limit(app_id),
-                    "updatedAt": datetime.utcnow()
-                }
-            }
-        )
-        
-        if result.matched_count == 0:
+        app = await storage.monitored_apps.get(user_id, app_id)
+        if not app:
             raise HTTPException(status_code=404, detail="Monitored app not found")
         
+        is_blocked = time_used >= app.get("dailyLimit", 60)
+        await storage.monitored_apps.set_usage(user_id, app_id, time_used, is_blocked, datetime.utcnow())
+        
+        if app.get("isActive", True):
+            block_state.set_blocked(user_id, app["packageName"], is_blocked)
+        invalidate_user_reads(user_id)
+        await record_changes(user_id, ("app", app_id))
+        
         return {"success": True, "timeUsed": time_used}
     except HTTPException:
         raise
@@ -368,17 +932,17 @@ async def update_app_usage(app_id: str, time_used: int):
         raise HTTPException(status_code=500, detail="Failed to update app usage")
 
 @api_router.delete("/apps/monitored/{app_id}")
-async def remove_monitored_app(app_id: str):
+async def remove_monitored_app(app_id: str, user_id: str = "default"):
     """Remove app from monitoring"""
     try:
-        result = await db.monitored_apps.update_one(
-            {"id": app_id},
-            {"$set": {"isActive": False, "updatedAt": datetime.utcnow()}}
-        )
+        app = await storage.monitored_apps.deactivate(user_id, app_id, datetime.utcnow())
         
-        if result.matched_count == 0:
+        if not app:
             raise HTTPException(status_code=404, detail="Monitored app not found")
         
+        block_state.set_blocked(user_id, app["packageName"], False)
+        invalidate_user_reads(user_id)
+        await record_changes(user_id, ("app", app_id))
         return {"success": True}
     except HTTPException:
         raise
@@ -386,40 +950,51 @@ async def remove_monitored_app(app_id: str):
         logger.error(f"Failed to remove monitored app: {e}")
         raise HTTPException(status_code=500, detail="Failed to remove monitored app")
 
-async def get_app_daily_limit(app_id: str) -> int:
-    """Helper function to get app's daily limit"""
-    app = await db.monitored_apps.find_one({"id": app_id})
-    return app.get("dailyLimit", 60) if app else 60
+def record_session_written(user_id: str):
+    """Invalidate reads that depend on a user's usage sessions (and the usage totals on their apps)"""
+    invalidate_user_reads(user_id)
+    invalidate_cached_reads("usage_sessions", user_id)
+    versions.bump("usage_sessions", user_id)
+    publish_invalidation("usage_sessions", user_id)
 
 @api_router.post("/usage/session", response_model=UsageSession)
 async def log_usage_session(session: UsageSession):
     """Log a usage session with enhanced tracking"""
+    if ingest_buffer is not None:
+        # Write-behind: acknowledge once queued, the buffer flushes in batches
+        if not await ingest_buffer.submit(session.dict()):
+            raise HTTPException(
+                status_code=503,
+                detail="Ingest queue is full",
+                headers={"Retry-After": "1"}
+            )
+        return json_response(session.model_dump(), status_code=202)
+    
     try:
         # Update monitored app usage if this is for a monitored app
-        monitored_app = await db.monitored_apps.find_one({
-            "packageName": session.packageName,
-            "userId": session.userId,
-            "isActive": True
-        })
+        monitored_app = await storage.monitored_apps.find_active(session.userId, session.packageName)
         
         if monitored_app:
+            # A session after local midnight starts the new day even before the scheduled reset
+            today = local_today(monitored_app.get("timezone")).isoformat()
             current_usage = monitored_app.get("timeUsed", 0)
+            if reset_pending(monitored_app.get("lastResetDate"), today):
+                current_usage = 0
             new_usage = current_usage + session.duration
+            is_blocked = new_usage >= monitored_app.get("dailyLimit", 60)
             
-            await db.monitored_apps.update_one(
-                {"packageName": session.packageName, "userId": session.userId},
-                {
-                    "$set": {
-                        "timeUsed": new_usage,
-                        "isBlocked": new_usage >= monitored_app.get("dailyLimit", 60),
-                        "updatedAt": datetime.utcnow()
-                    }
-                }
+            await storage.monitored_apps.set_package_usage(
+                session.userId, session.packageName, new_usage, is_blocked, datetime.utcnow(), today
             )
+            block_state.set_blocked(session.userId, session.packageName, is_blocked)
         
         # Store the usage session
-        await db.usage_sessions.insert_one(session.dict())
-        return session
+        await storage.usage_sessions.insert(session.dict())
+        
+        record_session_written(session.userId)
+        if monitored_app:
+            await record_changes(session.userId, ("app", monitored_app["id"]))
+        return json_response(session.model_dump())
     except Exception as e:
         logger.error(f"Failed to log usage session: {e}")
         raise HTTPException(status_code=500, detail="Failed to log usage session")
@@ -428,16 +1003,9 @@ async def log_usage_session(session: UsageSession):
 async def get_daily_app_usage(package_name: str, user_id: str = "default"):
     """Get daily usage for a specific app"""
     try:
-        from datetime import timedelta
-        today = datetime.utcnow().date()
-        start_date = datetime.combine(today, datetime.min.time())
-        end_date = start_date + timedelta(days=1)
+        today, start_date, end_date = local_day_window(await get_user_timezone(user_id))
         
-        sessions = await db.usage_sessions.find({
-            "packageName": package_name,
-            "userId": user_id,
-            "timestamp": {"$gte": start_date, "$lt": end_date}
-        }).to_list(1000)
+        sessions = await storage.usage_sessions.list_for_app(user_id, package_name, start_date, end_date)
         
         total_usage = sum(session.get("duration", 0) for session in sessions)
         
@@ -451,168 +1019,427 @@ async def get_daily_app_usage(package_name: str, user_id: str = "default"):
         logger.error(f"Failed to get daily app usage: {e}")
         raise HTTPException(status_code=500, detail="Failed to get daily app usage")
 
+async def compute_realtime_usage(user_id: str) -> List[Dict[str, Any]]:
+    monitored_apps = await storage.monitored_apps.list_active(
+        user_id, {"_id": 0, "id": 1, "packageName": 1, "appName": 1, "dailyLimit": 1}
+    )
+    
+    # "Today" is the user's local calendar day
+    _, start_date, end_date = local_day_window(await get_user_timezone(user_id))
+    
+    usage_data = []
+    for app in monitored_apps:
+        # Get today's usage from sessions
+        sessions = await storage.usage_sessions.list_for_app(
+            user_id, app["packageName"], start_date, end_date, {"_id": 0, "duration": 1}
+        )
+        
+        daily_usage = sum(session.get("duration", 0) for session in sessions)
+        
+        usage_data.append({
+            "id": app["id"],
+            "packageName": app["packageName"],
+            "appName": app["appName"],
+            "dailyLimit": app["dailyLimit"],
+            "timeUsed": daily_usage,
+            "isBlocked": daily_usage >= app["dailyLimit"],
+            "percentage": min((daily_usage / app["dailyLimit"]) * 100, 100)
+        })
+    return usage_data
+
 @api_router.get("/usage/realtime")
-async def get_realtime_usage(user_id: str = "default"):
+async def get_realtime_usage(user_id: str = "default", if_none_match: Optional[str] = Header(default=None)):
     """Get real-time usage data for all monitored apps"""
     try:
-        monitored_apps = await db.monitored_apps.find({
-            "userId": user_id,
-            "isActive": True
-        }).to_list(100)
-        
-        usage_data = []
-        for app in monitored_apps:
-            # Get today's usage from sessions
-            from datetime import timedelta
-            today = datetime.utcnow().date()
-            start_date = datetime.combine(today, datetime.min.time())
-            end_date = start_date + timedelta(days=1)
-            
-            sessions = await db.usage_sessions.find({
-                "packageName": app["packageName"],
-                "userId": user_id,
-                "timestamp": {"$gte": start_date, "$lt": end_date}
-            }).to_list(1000)
-            
-            daily_usage = sum(session.get("duration", 0) for session in sessions)
-            
-            usage_data.append({
-                "id": app["id"],
-                "packageName": app["packageName"],
-                "appName": app["appName"],
-                "dailyLimit": app["dailyLimit"],
-                "timeUsed": daily_usage,
-                "isBlocked": daily_usage >= app["dailyLimit"],
-                "percentage": min((daily_usage / app["dailyLimit"]) * 100, 100)
-            })
-        
-        return usage_data
+        def current_etag() -> str:
+            return versions.etag(("monitored_apps", user_id), ("usage_sessions", user_id))
+        etag = current_etag()
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        
+        etag, usage_data = await load_cached(
+            user_id, "realtime_usage", (), current_etag, lambda: compute_realtime_usage(user_id)
+        )
+        return json_response(usage_data, headers=validator_headers(etag))
     except Exception as e:
         logger.error(f"Failed to get realtime usage: {e}")
         raise HTTPException(status_code=500, detail="Failed to get realtime usage")
 
 @api_router.get("/usage/sessions")
-async def get_usage_sessions(days: int = 30):
+async def get_usage_sessions(
+    user_id: str = "default",
+    days: int = 30,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(default=None)
+):
     """Get usage sessions for analytics"""
+    projection = parse_fields(fields, UsageSession, SESSION_DEFAULT_FIELDS)
     try:
+        # The window slides with the calendar, so the date is part of the validator
+        etag = versions.etag(
+            ("usage_sessions", user_id),
+            variant=(days, projection_key(projection), datetime.utcnow().date().isoformat())
+        )
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        
         # Get sessions from last N days
         from datetime import timedelta
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        sessions = await db.usage_sessions.find({
-            "timestamp": {"$gte": start_date}
-        }).to_list(1000)
+        sessions = await reader("/api/usage/sessions").usage_sessions.list_since(user_id, start_date, projection)
         
-        # Convert ObjectId to string for JSON serialization
-        for session in sessions:
-            if "_id" in session:
-                session["_id"] = str(session["_id"])
-        
-        return sessions
+        return json_response(sessions, headers=validator_headers(etag))
     except Exception as e:
         logger.error(f"Failed to get usage sessions: {e}")
         raise HTTPException(status_code=500, detail="Failed to get usage sessions")
 
+async def compute_analytics(user_id: str) -> Dict[str, Any]:
+    # Get challenges from last 30 days
+    from datetime import timedelta
+    start_date = datetime.utcnow() - timedelta(days=30)
+    
+    source = reader("/api/analytics")
+    challenges = await source.challenges.list(user_id, {"_id": 0, "completed": 1, "correct": 1, "timeReward": 1})
+    
+    usage_sessions = await source.usage_sessions.list_since(user_id, start_date, {"_id": 0, "appName": 1, "duration": 1})
+    
+    # Calculate analytics
+    total_time_used = sum(session.get("duration", 0) for session in usage_sessions)
+    challenges_completed = len([c for c in challenges if c.get("completed", False)])
+    time_earned = sum(c.get("timeReward", 0) for c in challenges if c.get("correct", False))
+    
+    # Calculate most used app
+    app_usage = {}
+    for session in usage_sessions:
+        app_name = session.get("appName", "Unknown")
+        app_usage[app_name] = app_usage.get(app_name, 0) + session.get("duration", 0)
+    
+    most_used_app = max(app_usage.keys(), key=app_usage.get) if app_usage else "None"
+    
+    # Values are computed here, so skip validation
+    analytics = Analytics.model_construct(
+        totalTimeUsed=total_time_used,
+        averageDaily=total_time_used / 30,
+        mostUsedApp=most_used_app,
+        streakDays=7,  # TODO: Calculate actual streak
+        challengesCompleted=challenges_completed,
+        timeEarned=time_earned
+    ).model_dump()
+    return analytics
+
 @api_router.get("/analytics", response_model=Analytics)
-async def get_analytics():
+async def get_analytics(user_id: str = "default", if_none_match: Optional[str] = Header(default=None)):
     """Get usage analytics"""
     try:
-        # Get challenges from last 30 days
-        from datetime import timedelta
-        start_date = datetime.utcnow() - timedelta(days=30)
-        
-        challenges = await db.challenges.find({}).to_list(1000)
-        
-        usage_sessions = await db.usage_sessions.find({
-            "timestamp": {"$gte": start_date}
-        }).to_list(1000)
-        
-        # Calculate analytics
-        total_time_used = sum(session.get("duration", 0) for session in usage_sessions)
-        challenges_completed = len([c for c in challenges if c.get("completed", False)])
-        time_earned = sum(c.get("timeReward", 0) for c in challenges if c.get("correct", False))
-        
-        # Calculate most used app
-        app_usage = {}
-        for session in usage_sessions:
-            app_name = session.get("appName", "Unknown")
-            app_usage[app_name] = app_usage.get(app_name, 0) + session.get("duration", 0)
-        
-        most_used_app = max(app_usage.keys(), key=app_usage.get) if app_usage else "None"
-        
-        return Analytics(
-            totalTimeUsed=total_time_used,
-            averageDaily=total_time_used / 30,
-            mostUsedApp=most_used_app,
-            streakDays=7,  # TODO: Calculate actual streak
-            challengesCompleted=challenges_completed,
-            timeEarned=time_earned
+        def current_etag() -> str:
+            return versions.etag(
+                ("usage_sessions", user_id),
+                ("challenges", user_id),
+                variant=datetime.utcnow().date().isoformat()
+            )
+        etag = current_etag()
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        
+        etag, analytics = await load_cached(
+            user_id, "analytics", (), current_etag,
+            lambda: compute_analytics(user_id),
+            flight=flight_key("/analytics", user_id=user_id)
         )
+        
+        return json_response(analytics, headers=validator_headers(etag))
     except Exception as e:
         logger.error(f"Failed to get analytics: {e}")
         raise HTTPException(status_code=500, detail="Failed to get analytics")
 
+# Longest history the chart endpoints aggregate over, and the most apps a timeseries breaks out
+ANALYTICS_MAX_DAYS = 90
+TIMESERIES_MAX_APPS = 10
+
+def check_analytics_window(days: int):
+    if not 1 <= days <= ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {ANALYTICS_MAX_DAYS}")
+
+async def compute_heatmap(user_id: str, days: int, timezone_name: str) -> Dict[str, Any]:
+    _, start_date, end_date = local_day_window(timezone_name, days=days)
+    buckets = await reader("/api/analytics").usage_sessions.usage_by_hour(user_id, start_date, end_date, timezone_name)
+    
+    # Rows are ISO weekdays (Monday first), columns local hours
+    minutes = [[0] * 24 for _ in range(7)]
+    sessions = [[0] * 24 for _ in range(7)]
+    for bucket in buckets:
+        minutes[bucket["weekday"] - 1][bucket["hour"]] = bucket["minutes"]
+        sessions[bucket["weekday"] - 1][bucket["hour"]] = bucket["sessions"]
+    
+    peak = max(buckets, key=lambda b: b["minutes"], default=None)
+    heatmap = {
+        "timezone": timezone_name,
+        "days": days,
+        "minutes": minutes,
+        "sessions": sessions,
+        "peak": {"weekday": peak["weekday"], "hour": peak["hour"], "minutes": peak["minutes"]} if peak else None,
+        "totalMinutes": sum(b["minutes"] for b in buckets),
+    }
+    return heatmap
+
+async def compute_timeseries(user_id: str, days: int, top: int, timezone_name: str) -> Dict[str, Any]:
+    from datetime import timedelta
+    today, start_date, end_date = local_day_window(timezone_name, days=days)
+    buckets = await reader("/api/analytics").usage_sessions.usage_by_day(user_id, start_date, end_date, timezone_name)
+    
+    dates = [(today - timedelta(days=offset)).isoformat() for offset in range(days - 1, -1, -1)]
+    index = {day: position for position, day in enumerate(dates)}
+    totals: Dict[str, int] = {}
+    names: Dict[str, str] = {}
+    for bucket in buckets:
+        totals[bucket["packageName"]] = totals.get(bucket["packageName"], 0) + bucket["minutes"]
+        if bucket.get("appName"):
+            names[bucket["packageName"]] = bucket["appName"]
+    
+    # The top apps get their own series; everything else is folded into "other"
+    ranked = sorted(totals, key=lambda package: (-totals[package], package))[:top]
+    series = {package: [0] * days for package in ranked}
+    other = [0] * days
+    total = [0] * days
+    for bucket in buckets:
+        position = index.get(bucket["date"])
+        if position is None:
+            continue
+        series.get(bucket["packageName"], other)[position] += bucket["minutes"]
+        total[position] += bucket["minutes"]
+    
+    timeseries = {
+        "timezone": timezone_name,
+        "dates": dates,
+        "apps": [
+            {
+                "packageName": package,
+                "appName": names.get(package, package),
+                "totalMinutes": totals[package],
+                "minutes": series[package],
+            }
+            for package in ranked
+        ],
+        "other": other,
+        "total": total,
+    }
+    return timeseries
+
+@api_router.get("/analytics/heatmap")
+async def get_usage_heatmap(
+    user_id: str = "default",
+    days: int = 28,
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """Usage minutes and sessions per local weekday and hour (7 x 24), whatever the history length"""
+    check_analytics_window(days)
+    try:
+        timezone_name = await get_user_timezone(user_id)
+        # The window ends today in the user's zone, so the local date is part of the validator
+        def current_etag() -> str:
+            return versions.etag(
+                ("usage_sessions", user_id),
+                variant=(days, timezone_name, local_today(timezone_name).isoformat())
+            )
+        etag = current_etag()
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        
+        etag, heatmap = await load_cached(
+            user_id, "analytics_heatmap", (days, timezone_name), current_etag,
+            lambda: compute_heatmap(user_id, days, timezone_name),
+            flight=flight_key("/analytics/heatmap", user_id=user_id, days=days, tz=timezone_name)
+        )
+        
+        return json_response(heatmap, headers=validator_headers(etag))
+    except Exception as e:
+        logger.error(f"Failed to get usage heatmap: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get usage heatmap")
+
+@api_router.get("/analytics/timeseries")
+async def get_usage_timeseries(
+    user_id: str = "default",
+    days: int = 14,
+    top: int = 5,
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """Daily usage minutes for the top apps plus "other", one value per local day"""
+    check_analytics_window(days)
+    if not 1 <= top <= TIMESERIES_MAX_APPS:
+        raise HTTPException(status_code=400, detail=f"top must be between 1 and {TIMESERIES_MAX_APPS}")
+    try:
+        timezone_name = await get_user_timezone(user_id)
+        def current_etag() -> str:
+            return versions.etag(
+                ("usage_sessions", user_id),
+                variant=(days, top, timezone_name, local_today(timezone_name).isoformat())
+            )
+        etag = current_etag()
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        
+        etag, timeseries = await load_cached(
+            user_id, "analytics_timeseries", (days, top, timezone_name), current_etag,
+            lambda: compute_timeseries(user_id, days, top, timezone_name),
+            flight=flight_key("/analytics/timeseries", user_id=user_id, days=days, top=top, tz=timezone_name)
+        )
+        
+        return json_response(timeseries, headers=validator_headers(etag))
+    except Exception as e:
+        logger.error(f"Failed to get usage timeseries: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get usage timeseries")
+
+def parse_sync_cursor(cursor: Optional[str]) -> Tuple[Optional[int], Optional[str]]:
+    """(sequence number, local date) from a "<seq>.<date>" cursor; (None, None) forces a full sync"""
+    seq, _, day = (cursor or "").partition(".")
+    try:
+        return int(seq), day
+    except ValueError:
+        return None, None
+
+@api_router.get("/sync")
+async def sync_changes(user_id: str = "default", since: Optional[str] = None):
+    """Monitored-app changes, daily totals, block state and rewards since a previous sync"""
+    try:
+        today = local_today(await get_user_timezone(user_id)).isoformat()
+        after, day = parse_sync_cursor(since)
+        change_set = await storage.sync_log.since(user_id, after or 0)
+        
+        # Totals restart at local midnight, so a cursor from another day gets everything again
+        full = after is None or day != today or not change_set.complete
+        app_ids = {key for kind, key in change_set.changes if kind == "app"}
+        
+        apps, removed, blocked = [], [], None
+        if full or app_ids:
+            active = await storage.monitored_apps.list_active(user_id, SYNC_APP_PROJECTION)
+            if full:
+                apps = active
+                # Until the daily reset has reached every app, keep asking for a full sync
+                if any(reset_pending(app.get("lastResetDate"), today) for app in active):
+                    today = ""
+            else:
+                apps = [app for app in active if app["id"] in app_ids]
+                removed = sorted(app_ids - {app["id"] for app in active})
+            blocked = (await load_block_snapshot(user_id)).to_payload()
+        
+        # Rewards come from the change log alone: a full resend of the apps
+        # (new day, pending reset) must not drop the ones earned since the cursor
+        rewards = []
+        if after is not None and change_set.complete:
+            reward_ids = dict.fromkeys(key for kind, key in change_set.changes if kind == "reward")
+            for challenge_id in reward_ids:
+                challenge = await storage.challenges.get(user_id, challenge_id)
+                if challenge and challenge.get("correct"):
+                    rewards.append({"challengeId": challenge_id, "timeReward": challenge.get("timeReward", 0)})
+        
+        return json_response({
+            "cursor": f"{change_set.seq}.{today}",
+            "full": full,
+            "apps": apps,
+            "removed": removed,
+            "blocked": blocked,
+            "rewards": rewards,
+        })
+    except Exception as e:
+        logger.error(f"Failed to sync changes: {e}")
+        raise HTTPException(status_code=500, detail="Failed to sync changes")
+
+@api_router.get("/users/{user_id}/settings", response_model=UserSettings)
+async def get_user_settings(user_id: str):
+    """Get per-user settings such as timezone"""
+    try:
+        settings = await storage.user_settings.get(user_id)
+        return UserSettings(**settings) if settings else UserSettings(userId=user_id)
+    except Exception as e:
+        logger.error(f"Failed to get user settings: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get user settings")
+
+@api_router.put("/users/{user_id}/settings", response_model=UserSettings)
+async def update_user_settings(user_id: str, update: UserSettingsUpdate):
+    """Update per-user settings; the timezone is copied onto the user's monitored apps"""
+    if not is_valid_timezone(update.timezone):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {update.timezone}")
+    
+    try:
+        settings = UserSettings(userId=user_id, timezone=update.timezone)
+        await storage.user_settings.upsert(settings.dict())
+        
+        # Denormalized so the daily reset can target a whole zone with one update
+        await storage.monitored_apps.set_timezone(user_id, update.timezone, datetime.utcnow())
+        invalidate_user_reads(user_id)
+        
+        return settings
+    except Exception as e:
+        logger.error(f"Failed to update user settings: {e}")
+        raise HTTPException(status_code=500, detail="Failed to update user settings")
+
 @api_router.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
-        "ai_enabled": bool(llm_api_key)
+        "ai_enabled": bool(llm_api_key),
+        "read_cache": read_cache.stats(),
+        "challenge_cache": challenge_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "ingest": ingest_buffer.stats() if ingest_buffer is not None else None,
+        "slow_queries": slow_query_log.stats() if slow_query_log is not None else None,
+        "admission": admission.stats(),
+        "invalidation": invalidation_bus.stats() if invalidation_bus is not None else None
     }
 
 @api_router.get("/apps/search")
-async def search_apps(query: Optional[str] = None, category: Optional[str] = None, limit: int = 50):
+async def search_apps(
+    user_id: str = "default",
+    query: Optional[str] = None,
+    category: Optional[str] = None,
+    limit: int = 50,
+    fields: Optional[str] = None
+):
     """Search and filter apps in registry"""
+    projection = parse_fields(fields, AppInfo, REGISTRY_DEFAULT_FIELDS)
     try:
-        # Build search query
-        search_filter = {}
-        
-        if query:
-            search_filter["$or"] = [
-                {"appName": {"$regex": query, "$options": "i"}},
-                {"displayName": {"$regex": query, "$options": "i"}},
-                {"packageName": {"$regex": query, "$options": "i"}}
-            ]
-        
-        if category:
-            search_filter["category"] = category
-        
-        apps = await db.app_registry.find(search_filter).limit(limit).to_list(limit)
+        apps = await reader("/api/apps/search").app_registry.search(user_id, query, category, projection, limit)
         
-        # Convert ObjectId to string for JSON serialization
-        for app in apps:
-            if "_id" in app:
-                app["_id"] = str(app["_id"])
-        
-        return {
+        return json_response({
             "apps": apps,
             "count": len(apps),
             "query": query,
             "category": category
-        }
+        })
     except Exception as e:
         logger.error(f"Failed to search apps: {e}")
         raise HTTPException(status_code=500, detail="Failed to search apps")
 
+async def count_app_categories(user_id: str) -> List[Dict[str, Any]]:
+    # Count apps per category in the user's registry
+    category_counts = []
+    for category, count in (await storage.app_registry.category_counts(user_id)).items():
+        if not category:
+            continue
+        category_counts.append({
+            "name": category,
+            "count": count,
+            "displayName": category.replace("_", " ").title()
+        })
+    
+    return sorted(category_counts, key=lambda x: x["count"], reverse=True)
+
 @api_router.get("/apps/categories")
-async def get_app_categories():
+async def get_app_categories(user_id: str = "default", if_none_match: Optional[str] = Header(default=None)):
     """Get all available app categories"""
     try:
-        # Get unique categories from registry
-        categories = await db.app_registry.distinct("category")
-        
-        # Count apps per category
-        category_counts = []
-        for category in categories:
-            count = await db.app_registry.count_documents({"category": category})
-            category_counts.append({
-                "name": category,
-                "count": count,
-                "displayName": category.replace("_", " ").title()
-            })
-        
-        return sorted(category_counts, key=lambda x: x["count"], reverse=True)
+        etag = versions.etag(("app_registry", user_id), variant="categories")
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        
+        categories = await single_flight.do(
+            flight_key("/apps/categories", user_id=user_id),
+            lambda: count_app_categories(user_id)
+        )
+        return json_response(categories, headers=validator_headers(etag))
     except Exception as e:
         logger.error(f"Failed to get app categories: {e}")
         raise HTTPException(status_code=500, detail="Failed to get app categories")
@@ -625,19 +1452,15 @@ async def bulk_register_apps(apps: List[AppInfo]):
         updated_count = 0
         
         for app_info in apps:
-            existing_app = await db.app_registry.find_one({"packageName": app_info.packageName})
-            
-            if existing_app:
-                # Update existing app
-                await db.app_registry.update_one(
-                    {"packageName": app_info.packageName},
-                    {"$set": app_info.dict()}
-                )
-                updated_count += 1
-            else:
-                # Insert new app
-                await db.app_registry.insert_one(app_info.dict())
+            if await storage.app_registry.upsert(app_info.dict()):
                 registered_count += 1
+            else:
+                updated_count += 1
+        
+        for user_id in {app_info.userId for app_info in apps}:
+            invalidate_cached_reads("app_registry", user_id)
+            versions.bump("app_registry", user_id)
+            publish_invalidation("app_registry", user_id)
         
         return {
             "success": True,
@@ -649,20 +1472,231 @@ async def bulk_register_apps(apps: List[AppInfo]):
         logger.error(f"Failed to bulk register apps: {e}")
         raise HTTPException(status_code=500, detail="Failed to bulk register apps")
 
-# Include the router in the main app
-app.include_router(api_router)
+@api_router.get("/admin/profiler")
+async def get_profiler_status(x_admin_token: Optional[str] = Header(default=None)):
+    """Current profiling session"""
+    require_admin(x_admin_token)
+    return profiler.status()
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+@api_router.post("/admin/profiler")
+async def configure_profiler(
+    request: Request,
+    config: ProfilerRequest,
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """Start or stop a sampling session for one route or a share of all requests"""
+    require_admin(x_admin_token)
+    if not config.enabled:
+        profiler.stop()
+        return profiler.status()
+    
+    try:
+        profiler.start(
+            request.app.routes,
+            route=config.route,
+            sample_rate=config.sampleRate,
+            interval_ms=config.intervalMs,
+            duration_seconds=config.durationSeconds
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return profiler.status()
+
+@api_router.get("/admin/profiler/folded")
+async def get_profiler_stacks(x_admin_token: Optional[str] = Header(default=None)):
+    """Collected stacks in folded format, ready for flamegraph.pl or speedscope"""
+    require_admin(x_admin_token)
+    return PlainTextResponse(profiler.folded())
+
+async def on_daily_reset(tz_name: str, local_date: str):
+    # A zone-wide reset unblocks many users at once; reload snapshots lazily.
+    # Every worker runs its own scheduler, so this is not published.
+    block_state.invalidate()
+    invalidate_cached_reads("monitored_apps")
+    versions.bump("monitored_apps")
+
+async def on_ingest_flush(user_ids: List[str], updated_apps: Optional[List[Dict[str, Any]]]):
+    for user_id in user_ids:
+        record_session_written(user_id)
+        if updated_apps is None:
+            # The apps could not be read back; reload block state from storage
+            block_state.invalidate(user_id)
+    changes: Dict[str, List[Change]] = {}
+    for app_doc in updated_apps or []:
+        block_state.set_blocked(app_doc["userId"], app_doc["packageName"], app_doc.get("isBlocked", False))
+        changes.setdefault(app_doc["userId"], []).append(("app", app_doc["id"]))
+    for user_id, user_changes in changes.items():
+        await record_changes(user_id, *user_changes)
+
+daily_reset_scheduler: Optional[DailyResetScheduler] = None
+
+# Optional write-behind ingest for /usage/session (INGEST_BUFFER_ENABLED=true)
+ingest_buffer: Optional[IngestBuffer] = None
+slow_query_log: Optional[SlowQueryLog] = None
+admin_token: Optional[str] = None
+
+# Carries invalidations between uvicorn workers (INVALIDATION_BUS)
+invalidation_bus: Optional[InvalidationBus] = None
+
+async def init_resources(settings: Settings):
+    global storage, llm_api_key, read_cache, challenge_cache, daily_reset_scheduler, ingest_buffer, slow_query_log, admin_token
+    global invalidation_bus
+    
+    if settings.storage_backend == "mongo":
+        options = {}
+        if settings.mongo_max_pool_size is not None:
+            options["maxPoolSize"] = settings.mongo_max_pool_size
+        if settings.mongo_min_pool_size is not None:
+            options["minPoolSize"] = settings.mongo_min_pool_size
+        
+        listeners = [mongo_metrics]
+        if settings.slow_query_threshold_ms is not None:
+            slow_query_log = SlowQueryLog(
+                threshold_ms=settings.slow_query_threshold_ms,
+                explain=settings.slow_query_explain,
+                log_file=settings.slow_query_log_file,
+                capped_size_bytes=settings.slow_query_capped_size_mb * 1024 * 1024
+            )
+            listeners.append(slow_query_log)
+        
+        storage = create_storage(
+            "mongo",
+            mongo_url=settings.mongo_url,
+            db_name=settings.db_name,
+            event_listeners=listeners,
+            schema=settings.mongo_schema,
+            **options
+        )
+    elif settings.storage_backend == "sqlite":
+        storage = create_storage("sqlite", path=settings.sqlite_path)
+    else:
+        storage = create_storage("memory")
+    
+    read_storages.clear()
+    for route, mode in parse_read_routes(settings.read_routes).items():
+        read_storages[route] = storage.with_read_preference(mode, settings.read_max_staleness_seconds)
+    
+    if await storage.start(settings.mongo_warmup_timeout_seconds) and slow_query_log is not None:
+        await slow_query_log.start(storage.client, storage.db)
+    
+    llm_api_key = settings.llm_api_key
+    admin_token = settings.admin_token
+    admission.configure(
+        enabled=settings.admission_enabled,
+        limits=settings.admission_limits,
+        max_wait=settings.admission_max_wait_seconds,
+        poll_rate=settings.poll_rate_per_second,
+        poll_burst=settings.poll_burst
+    )
+    if not llm_api_key:
+        logger.warning("EMERGENT_LLM_KEY not found, using fallback challenge generation")
+    
+    read_cache = ReadCache(
+        max_entries=settings.read_cache_max_entries,
+        ttl_seconds=settings.read_cache_ttl_seconds
+    )
+    challenge_cache = ChallengeCache(max_per_key=settings.challenge_cache_size)
+    
+    invalidation_bus = create_bus(
+        settings.invalidation_transport,
+        socket_dir=settings.invalidation_socket_dir,
+        db=storage.db if storage.name == "mongo" else None
+    )
+    if invalidation_bus is not None:
+        await invalidation_bus.start(apply_invalidations)
+    
+    daily_reset_scheduler = DailyResetScheduler(
+        storage.monitored_apps,
+        on_reset=on_daily_reset,
+        interval_seconds=settings.daily_reset_interval_seconds
+    )
+    daily_reset_scheduler.start()
+    
+    if settings.ingest_buffer_enabled:
+        ingest_buffer = IngestBuffer(
+            storage,
+            max_queue=settings.ingest_max_queue,
+            flush_size=settings.ingest_flush_size,
+            flush_interval=settings.ingest_flush_interval_seconds,
+            write_concern=parse_write_concern(settings.ingest_write_concern),
+            on_flush=on_ingest_flush,
+            drain_timeout=settings.ingest_drain_timeout_seconds
+        )
+        ingest_buffer.start()
+
+async def close_resources():
+    global ingest_buffer, daily_reset_scheduler, slow_query_log, invalidation_bus
+    
+    profiler.stop()
+    if daily_reset_scheduler is not None:
+        await daily_reset_scheduler.stop()
+        daily_reset_scheduler = None
+    if ingest_buffer is not None:
+        # Write out every acknowledged session before the client goes away
+        await ingest_buffer.drain()
+        ingest_buffer = None
+    if slow_query_log is not None:
+        await slow_query_log.stop()
+        slow_query_log = None
+    if invalidation_bus is not None:
+        await invalidation_bus.stop()
+        invalidation_bus = None
+    if storage is not None:
+        await storage.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_resources(Settings.from_env())
+    try:
+        yield
+    finally:
+        await close_resources()
+
+def create_app() -> FastAPI:
+    """Build the ASGI app; connections are opened by the lifespan handler, not here"""
+    load_dotenv(ROOT_DIR / '.env')
+    
+    # Create the main app without a prefix
+    app = FastAPI(
+        title="Brain Rot Reduction API",
+        default_response_class=ORJSONResponse,
+        lifespan=lifespan
+    )
+    
+    # Include the router in the main app
+    app.include_router(api_router)
+    admission.bind(app.routes)
+    
+    # Innermost, so profiled stacks start at the route handler
+    app.add_middleware(ProfilerMiddleware, profiler=profiler)
+    
+    # Compress responses above the size threshold (the registry is the big one)
+    app.add_middleware(GZipMiddleware, minimum_size=int(os.environ.get("GZIP_MINIMUM_SIZE", "1024")))
+    
+    # Sheds load before the router; inside CORS so 503/429 responses carry its headers
+    app.add_middleware(AdmissionMiddleware, controller=admission)
+    
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    # Lets the slow-query log attribute commands to the route that issued them
+    app.add_middleware(RequestScopeMiddleware)
+    
+    # Outermost, so timings include compression and CORS handling
+    app.add_middleware(HttpMetricsMiddleware, in_flight=http_in_flight, latency=http_latency)
+    
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+    
+    return app
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
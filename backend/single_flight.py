@@ -0,0 +1,44 @@
+"""
+Single-flight coalescing of concurrent identical reads.
+
+The first caller for a key starts the computation as a task; callers that
+arrive while it is running await the same task instead of issuing their own
+database scan.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def flight_key(route: str, **params: Any) -> Tuple:
+    """Key on the route plus its parameters, ignoring order and unset values"""
+    return (route, tuple(sorted((k, v) for k, v in params.items() if v is not None)))
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            self.executed += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        # Shielded so one caller disconnecting does not cancel the shared work
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "inFlight": len(self._inflight),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+        }
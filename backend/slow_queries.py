@@ -0,0 +1,317 @@
+"""
+Opt-in slow-operation log for MongoDB commands.
+
+A PyMongo command listener flags every command slower than the threshold.
+Flagged commands are handed to a background task on the event loop, which
+re-runs them under explain("executionStats") and writes one record per
+command: the route that issued it, the filter shape with values redacted and
+a plan summary (stages, index used, keys/documents examined vs returned).
+Records go to a capped collection or, if a file is configured, to a rotating
+JSON-lines log.
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import logging.handlers
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Set per request by RequestScopeMiddleware. Motor copies the context into its
+# executor threads, so command listeners can see which request issued a command.
+request_scope: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("request_scope", default=None)
+
+# Set while the log runs its own explain commands so they are not logged in turn
+_capturing: contextvars.ContextVar[bool] = contextvars.ContextVar("slow_query_capturing", default=False)
+
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+
+# Command fields the server rejects (or ignores) inside an explain
+_SESSION_FIELDS = {"lsid", "txnNumber", "writeConcern", "readConcern", "autocommit", "startTransaction"}
+
+# Where each command keeps its filter
+_SHAPE_FIELDS = {
+    "find": ("filter", "sort", "projection"),
+    "aggregate": ("pipeline",),
+    "count": ("query",),
+    "distinct": ("key", "query"),
+    "findAndModify": ("query", "sort"),
+}
+
+REDACTED = "?"
+
+
+class RequestScopeMiddleware:
+    """Expose the ASGI scope of the current request to driver-side listeners"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_scope.reset(token)
+
+
+def current_route() -> Optional[str]:
+    scope = request_scope.get()
+    if scope is None:
+        return None
+    route = scope.get("route")
+    return f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+
+
+def redact(value: Any) -> Any:
+    """Keep keys and operators, replace every literal with "?" and collapse lists of the same shape"""
+    if isinstance(value, dict):
+        return {k: redact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = redact(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return REDACTED
+
+
+def filter_shape(command_name: str, command: Dict[str, Any]) -> Dict[str, Any]:
+    if command_name in ("update", "delete"):
+        statements = command.get(f"{command_name}s") or []
+        return {"q": redact([s.get("q", {}) for s in statements])}
+    if command_name in _SHAPE_FIELDS:
+        return {
+            field: (command[field] if field == "key" else redact(command[field]))
+            for field in _SHAPE_FIELDS[command_name]
+            if field in command
+        }
+    return {}
+
+
+def _find_key(document: Any, key: str) -> Optional[Any]:
+    """Depth-first search for a key; aggregate explains nest the plan under $cursor"""
+    if isinstance(document, dict):
+        if key in document:
+            return document[key]
+        children = document.values()
+    elif isinstance(document, list):
+        children = document
+    else:
+        return None
+    for child in children:
+        found = _find_key(child, key)
+        if found is not None:
+            return found
+    return None
+
+
+def _plan_stages(plan: Any, stages: List[str], indexes: List[str]):
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        stages.append(plan["stage"])
+        if plan.get("indexName"):
+            indexes.append(plan["indexName"])
+    for child in ("inputStage", "queryPlan"):
+        _plan_stages(plan.get(child), stages, indexes)
+    for child in plan.get("inputStages", []):
+        _plan_stages(child, stages, indexes)
+
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    stages: List[str] = []
+    indexes: List[str] = []
+    _plan_stages(_find_key(explain, "winningPlan"), stages, indexes)
+    execution = _find_key(explain, "executionStats") or {}
+    return {
+        "stages": stages,
+        "indexes": indexes,
+        "collectionScan": "COLLSCAN" in stages,
+        "keysExamined": execution.get("totalKeysExamined"),
+        "docsExamined": execution.get("totalDocsExamined"),
+        "nReturned": execution.get("nReturned"),
+        "executionTimeMillis": execution.get("executionTimeMillis"),
+    }
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    def __init__(
+        self,
+        threshold_ms: float,
+        explain: bool = True,
+        log_file: Optional[str] = None,
+        collection_name: str = "slow_queries",
+        capped_size_bytes: int = 16 * 1024 * 1024,
+        max_pending: int = 1000,
+        explain_cooldown_seconds: float = 60.0,
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self.log_file = log_file
+        self.collection_name = collection_name
+        self.capped_size_bytes = capped_size_bytes
+        self.max_pending = max_pending
+        # One explain per (collection, command, shape) per cooldown; repeats reuse the summary
+        self.explain_cooldown_seconds = explain_cooldown_seconds
+
+        self._started: Dict[Tuple[int, int], Tuple[Dict[str, Any], Optional[str]]] = {}
+        self._explained: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._client = None
+        self._db = None
+        self._file_logger: Optional[logging.Logger] = None
+        self.logged = 0
+        self.dropped = 0
+
+    # Listener callbacks run on driver threads; keep them to dict operations
+
+    def started(self, event):
+        if self._queue is None or _capturing.get():
+            return
+        self._started[(event.request_id, event.operation_id)] = (event.command, current_route())
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+    def _finish(self, event, outcome: str):
+        started = self._started.pop((event.request_id, event.operation_id), None)
+        if started is None or self._queue is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms:
+            return
+        command, route = started
+        collection = command.get(event.command_name)
+        if collection == self.collection_name:
+            return
+        record = {
+            "ts": datetime.utcnow(),
+            "database": event.database_name,
+            "command": event.command_name,
+            "collection": collection if isinstance(collection, str) else None,
+            "route": route,
+            "durationMs": round(duration_ms, 3),
+            "outcome": outcome,
+            "shape": filter_shape(event.command_name, command),
+        }
+        self._loop.call_soon_threadsafe(self._enqueue, record, command)
+
+    def _enqueue(self, record: Dict[str, Any], command: Dict[str, Any]):
+        try:
+            self._queue.put_nowait((record, command))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _explain(self, record: Dict[str, Any], command: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if not self.explain or record["outcome"] != "success" or record["command"] not in EXPLAINABLE_COMMANDS:
+            return None
+
+        key = json.dumps([record["collection"], record["command"], record["shape"]], sort_keys=True, default=str)
+        now = time.monotonic()
+        cached = self._explained.get(key)
+        if cached and now - cached[0] < self.explain_cooldown_seconds:
+            return cached[1]
+
+        explained = {k: v for k, v in command.items() if not k.startswith("$") and k not in _SESSION_FIELDS}
+        token = _capturing.set(True)
+        try:
+            result = await self._client[record["database"]].command(
+                {"explain": explained, "verbosity": "executionStats"}
+            )
+            summary = summarize_explain(result)
+        except Exception as e:
+            summary = {"error": str(e)}
+        finally:
+            _capturing.reset(token)
+
+        self._explained[key] = (now, summary)
+        if len(self._explained) > self.max_pending:
+            self._explained.clear()
+        return summary
+
+    async def _write(self, record: Dict[str, Any]):
+        if self._file_logger is not None:
+            self._file_logger.info(json.dumps(record, default=str))
+            return
+        token = _capturing.set(True)
+        try:
+            await self._db[self.collection_name].insert_one(record)
+        finally:
+            _capturing.reset(token)
+
+    async def _run(self):
+        while True:
+            record, command = await self._queue.get()
+            try:
+                plan = await self._explain(record, command)
+                if plan is not None:
+                    record["plan"] = plan
+                await self._write(record)
+                self.logged += 1
+            except Exception as e:
+                logger.error(f"Failed to record slow query: {e}")
+
+    async def _ensure_collection(self):
+        token = _capturing.set(True)
+        try:
+            if self.collection_name not in await self._db.list_collection_names():
+                await self._db.create_collection(self.collection_name, capped=True, size=self.capped_size_bytes)
+        except Exception as e:
+            logger.error(f"Could not create capped collection {self.collection_name}: {e}")
+        finally:
+            _capturing.reset(token)
+
+    async def start(self, client, db):
+        self._client = client
+        self._db = db
+        if self.log_file:
+            handler = logging.handlers.RotatingFileHandler(self.log_file, maxBytes=10 * 1024 * 1024, backupCount=5)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._file_logger = logging.getLogger(f"{__name__}.file")
+            self._file_logger.propagate = False
+            self._file_logger.setLevel(logging.INFO)
+            self._file_logger.addHandler(handler)
+        else:
+            await self._ensure_collection()
+
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._queue = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._started.clear()
+        if self._file_logger is not None:
+            for handler in list(self._file_logger.handlers):
+                handler.close()
+                self._file_logger.removeHandler(handler)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "thresholdMs": self.threshold_ms,
+            "logged": self.logged,
+            "dropped": self.dropped,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+        }
@@ -0,0 +1,275 @@
+"""
+Repository layer between the API handlers and the database.
+
+Handlers talk to a Storage object with one repository per collection instead
+of the Motor database. Three backends implement it:
+
+- mongo:  MongoDB through Motor (storage_mongo.py), the production backend
+- sqlite: an embedded SQLite file in WAL mode (storage_local.py), for the
+          single-device local mode without a database daemon
+- memory: plain dicts (storage_local.py), for tests and benchmarks
+
+Documents cross this boundary as plain dicts shaped like the API models.
+Projections use the Mongo form ({"_id": 0, "field": 1, ...}) on every backend.
+
+Every document carries a userId and every request-path method takes the user
+first, so on a sharded cluster each request is routed to a single shard (see
+SHARD_KEYS in storage_mongo.py). Only the background daily reset spans users.
+"""
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+AppKey = Tuple[str, str]
+
+# Read preference modes accepted by with_read_preference (MongoDB names)
+READ_PREFERENCES = ("primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest")
+
+# Bulk operations on monitored apps, in request order:
+#   ("add", app_doc)
+#   ("update_limit", app_id, daily_limit)
+#   ("remove", app_id)
+MonitoredAppOp = Tuple[Any, ...]
+
+# (kind, key) recorded in a user's change log: ("app", monitored app id) or ("reward", challenge id)
+Change = Tuple[str, str]
+
+# Entries kept per user; a client further behind than this gets a full resync
+CHANGE_LOG_SIZE = 500
+
+
+class DuplicateAppError(Exception):
+    """An active monitoring entry already exists for this user and package"""
+
+
+@dataclass
+class BulkResult:
+    inserted: int = 0
+    modified: int = 0
+    # {"index": position in the operation list, "duplicate": bool, "errmsg": str}
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    # Positions of update_limit/remove operations whose app the user does not have
+    unmatched: List[int] = field(default_factory=list)
+
+
+@dataclass
+class ChangeSet:
+    # Latest sequence number for the user
+    seq: int
+    # Changes after the requested sequence number, oldest first
+    changes: List[Change] = field(default_factory=list)
+    # False if entries after the requested number were discarded (or it is from elsewhere)
+    complete: bool = True
+
+
+def change_set(seq: int, entries: List[Dict[str, Any]], after: int) -> ChangeSet:
+    """Build a ChangeSet from retained {"seq", "kind", "key"} entries"""
+    if after > seq:
+        return ChangeSet(seq, complete=False)
+    newer = [entry for entry in entries if entry["seq"] > after]
+    # Sequence numbers are consecutive, so a gap means entries were trimmed
+    complete = after == seq or (bool(newer) and newer[0]["seq"] == after + 1)
+    return ChangeSet(seq, [(entry["kind"], entry["key"]) for entry in newer], complete)
+
+
+def unmatched_operations(operations: List[MonitoredAppOp], found: Dict[str, bool]) -> List[int]:
+    """
+    Positions of update_limit/remove operations with nothing to act on, given
+    the user's apps among the operation ids ({app id: isActive}). A limit needs
+    an active app; removing an app that is already inactive still succeeds.
+    """
+    return [
+        index for index, operation in enumerate(operations)
+        if (operation[0] == "update_limit" and not found.get(operation[1]))
+        or (operation[0] == "remove" and operation[1] not in found)
+    ]
+
+
+def project(document: Dict[str, Any], projection: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    """Apply a Mongo-style inclusion projection to a plain document"""
+    included = [k for k, v in (projection or {}).items() if v and k != "_id"]
+    if not included:
+        return {k: v for k, v in document.items() if k != "_id"}
+    return {k: document[k] for k in included if k in document}
+
+
+class ChallengeRepository(ABC):
+    @abstractmethod
+    async def insert(self, challenge: Dict[str, Any]): ...
+
+    @abstractmethod
+    async def get(self, user_id: str, challenge_id: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def set_result(self, user_id: str, challenge_id: str, correct: bool): ...
+
+    @abstractmethod
+    async def list(self, user_id: str, projection: Dict[str, int], limit: int = 1000) -> List[Dict[str, Any]]: ...
+
+
+class AppRegistryRepository(ABC):
+    @abstractmethod
+    async def upsert(self, app: Dict[str, Any]) -> bool:
+        """Insert or overwrite by userId and packageName; returns True if the app was new"""
+
+    @abstractmethod
+    async def list(self, user_id: str, projection: Dict[str, int], limit: int = 1000) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def search(
+        self, user_id: str, query: Optional[str], category: Optional[str], projection: Dict[str, int], limit: int
+    ) -> List[Dict[str, Any]]:
+        """Case-insensitive substring match on appName, displayName or packageName"""
+
+    @abstractmethod
+    async def category_counts(self, user_id: str) -> Dict[str, int]: ...
+
+
+class MonitoredAppRepository(ABC):
+    @abstractmethod
+    async def insert(self, app: Dict[str, Any]):
+        """Raises DuplicateAppError if the package is already actively monitored for the user"""
+
+    @abstractmethod
+    async def bulk_write(self, user_id: str, operations: List[MonitoredAppOp], now: datetime) -> BulkResult:
+        """
+        Apply operations unordered; one failing operation does not stop the
+        others. Updates and removals of apps the user does not have are
+        skipped and reported in BulkResult.unmatched.
+        """
+
+    @abstractmethod
+    async def get(self, user_id: str, app_id: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def find_active(self, user_id: str, package_name: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def list_active(self, user_id: str, projection: Dict[str, int], limit: int = 100) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def blocked_packages(self, user_id: str) -> List[str]: ...
+
+    @abstractmethod
+    async def set_usage(self, user_id: str, app_id: str, time_used: int, is_blocked: bool, now: datetime): ...
+
+    @abstractmethod
+    async def set_package_usage(
+        self, user_id: str, package_name: str, time_used: int, is_blocked: bool, now: datetime, local_date: str
+    ):
+        """Set today's usage on the user's active app for the package; removed entries are left alone"""
+
+    @abstractmethod
+    async def add_usage(self, durations: Dict[AppKey, int], now: datetime):
+        """
+        Add minutes to active apps and recompute isBlocked, one update per app.
+        An app whose daily reset is still pending at `now` in its own timezone
+        starts the new day from these minutes instead of adding to yesterday's.
+        """
+
+    @abstractmethod
+    async def find_by_keys(self, keys: Iterable[AppKey], projection: Dict[str, int]) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def deactivate(self, user_id: str, app_id: str, now: datetime) -> Optional[Dict[str, Any]]:
+        """Mark an app inactive; returns its userId and packageName, or None if not found"""
+
+    @abstractmethod
+    async def set_timezone(self, user_id: str, timezone_name: str, now: datetime): ...
+
+    @abstractmethod
+    async def active_timezones(self) -> List[str]:
+        """Zones of active apps; apps without a timezone count as DEFAULT_TIMEZONE"""
+
+    @abstractmethod
+    async def reset_zone(self, timezone_name: str, local_date: str, now: datetime) -> int:
+        """Zero counters of active apps in a zone last reset before local_date; returns the count"""
+
+
+class UsageSessionRepository(ABC):
+    @abstractmethod
+    async def insert(self, session: Dict[str, Any]): ...
+
+    @abstractmethod
+    async def insert_many(self, sessions: List[Dict[str, Any]]): ...
+
+    @abstractmethod
+    async def unsaved(self, sessions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """The sessions (by id) not stored yet; lets a failed insert_many be retried without duplicates"""
+
+    @abstractmethod
+    async def list_for_app(
+        self, user_id: str, package_name: str, start: datetime, end: datetime,
+        projection: Optional[Dict[str, int]] = None, limit: int = 1000
+    ) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def list_since(self, user_id: str, start: datetime, projection: Dict[str, int], limit: int = 1000) -> List[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def usage_by_hour(self, user_id: str, start: datetime, end: datetime, timezone_name: str) -> List[Dict[str, Any]]:
+        """Minutes and sessions per local ISO weekday (1-7) and hour: [{"weekday", "hour", "minutes", "sessions"}]"""
+
+    @abstractmethod
+    async def usage_by_day(self, user_id: str, start: datetime, end: datetime, timezone_name: str) -> List[Dict[str, Any]]:
+        """Minutes per local date and app: [{"date": "YYYY-MM-DD", "packageName", "appName", "minutes"}]"""
+
+
+class UserSettingsRepository(ABC):
+    @abstractmethod
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    async def upsert(self, settings: Dict[str, Any]): ...
+
+
+class ChangeLogRepository(ABC):
+    """Per-user change sequence appended by the write paths and read by /api/sync"""
+
+    @abstractmethod
+    async def append(self, user_id: str, changes: List[Change]) -> int:
+        """Record changes under the user's next consecutive sequence numbers; returns the last one"""
+
+    @abstractmethod
+    async def since(self, user_id: str, after: int) -> ChangeSet: ...
+
+
+class Storage(ABC):
+    name = ""
+    challenges: ChallengeRepository
+    app_registry: AppRegistryRepository
+    monitored_apps: MonitoredAppRepository
+    usage_sessions: UsageSessionRepository
+    user_settings: UserSettingsRepository
+    sync_log: ChangeLogRepository
+
+    @abstractmethod
+    async def start(self, timeout: float) -> bool:
+        """Connect and create indexes; returns False if the backend is unreachable"""
+
+    @abstractmethod
+    async def close(self): ...
+
+    def with_write_concern(self, write_concern) -> "Storage":
+        """Storage whose writes use a different durability level; backends without one return self"""
+        return self
+
+    def with_read_preference(self, mode: str, max_staleness_seconds: int = -1) -> "Storage":
+        """Storage whose reads go to the members selected by mode; single-node backends return self"""
+        return self
+
+
+def create_storage(backend: str, **options) -> Storage:
+    """Build the configured backend; drivers are imported only for the one in use"""
+    if backend == "mongo":
+        from storage_mongo import MongoStorage
+        return MongoStorage(**options)
+    if backend == "sqlite":
+        from storage_local import SQLiteStorage
+        return SQLiteStorage(**options)
+    if backend == "memory":
+        from storage_local import MemoryStorage
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,723 @@
+"""
+Compact MongoDB schema for the two high-volume collections.
+
+usage_sessions_v2 and monitored_apps_v2 hold the same data as usage_sessions
+and monitored_apps in a smaller persisted form:
+
+- UUID ids are stored as 16-byte BSON binary in _id (no separate id field)
+- packageName is a small integer reference into app_refs, which also keeps
+  the app's canonical appName/displayName; a document stores its own name
+  only when it differs
+- sessionType and category are integer codes; unknown values are kept as-is
+- a session's date is a day offset from its timestamp, omitted when 0
+- field names are one or two letters (see SESSION_FIELDS / APP_FIELDS)
+
+The repositories here encode on write and decode on read, so the API keeps
+seeing the documented shapes. MONGO_SCHEMA selects legacy, dual (read legacy,
+mirror every write to v2 while backend_migrate_compact_schema.py copies the
+history) or compact.
+
+Shard keys: usage_sessions_v2 {u: 1, t: 1}, monitored_apps_v2 {u: 1};
+app_refs is small and stays unsharded.
+"""
+
+import logging
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson.binary import Binary, UUID_SUBTYPE
+from pymongo import IndexModel, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from daily_reset import DEFAULT_TIMEZONE
+from storage import (
+    AppKey,
+    BulkResult,
+    DuplicateAppError,
+    MonitoredAppOp,
+    MonitoredAppRepository,
+    UsageSessionRepository,
+    project,
+    unmatched_operations,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def zone_filter(timezone_name: str) -> Any:
+    """Match a timezone field; apps created before it existed belong to the default zone"""
+    return {"$in": [timezone_name, None]} if timezone_name == DEFAULT_TIMEZONE else timezone_name
+
+
+def local_date_expression(now: datetime, timezone_field: str) -> Dict[str, Any]:
+    """Aggregation expression for the ISO date of `now` in the document's timezone"""
+    return {"$dateToString": {
+        "format": "%Y-%m-%d",
+        "date": now,
+        "timezone": {"$ifNull": [timezone_field, DEFAULT_TIMEZONE]},
+    }}
+
+# API field -> compact fields it is decoded from
+SESSION_FIELDS = {
+    "id": ("_id",),
+    "userId": ("u",),
+    "appId": ("a",),
+    "packageName": ("p",),
+    "appName": ("p", "an"),
+    "duration": ("m",),
+    "timestamp": ("t",),
+    "date": ("t", "d"),
+    "sessionType": ("k",),
+}
+
+APP_FIELDS = {
+    "id": ("_id",),
+    "userId": ("u",),
+    "packageName": ("p",),
+    "appName": ("p", "an"),
+    "displayName": ("p", "dn"),
+    "icon": ("i",),
+    "dailyLimit": ("l",),
+    "timeUsed": ("tu",),
+    "isBlocked": ("b",),
+    "category": ("c",),
+    "isActive": ("on",),
+    "timezone": ("z",),
+    "lastResetDate": ("r",),
+    "createdAt": ("ca",),
+    "updatedAt": ("ua",),
+}
+
+# Code = position; append only, never reorder
+SESSION_TYPES = ("active", "background", "foreground")
+CATEGORIES = (
+    "social", "entertainment", "games", "communication", "music",
+    "news", "productivity", "shopping", "finance",
+)
+
+COMPACT_INDEXES = {
+    "app_refs": [
+        IndexModel([("n", 1)], unique=True, name="package"),
+    ],
+    "usage_sessions_v2": [
+        IndexModel([("u", 1), ("t", 1)], name="user_time"),
+        IndexModel([("u", 1), ("p", 1), ("t", 1)], name="user_app_time"),
+    ],
+    "monitored_apps_v2": [
+        IndexModel(
+            [("u", 1), ("p", 1)],
+            unique=True,
+            partialFilterExpression={"on": True},
+            name="uniq_active_user_app"
+        ),
+    ],
+}
+
+
+def encode_id(value: Any) -> Any:
+    """Canonical UUID strings become 16-byte binary; anything else is stored unchanged"""
+    if isinstance(value, str) and len(value) == 36:
+        try:
+            parsed = uuid.UUID(value)
+        except ValueError:
+            return value
+        if str(parsed) == value:
+            return Binary.from_uuid(parsed)
+    return value
+
+
+def decode_id(value: Any) -> Any:
+    if isinstance(value, Binary) and value.subtype == UUID_SUBTYPE:
+        return str(value.as_uuid())
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def encode_code(value: Any, codes: Tuple[str, ...]) -> Any:
+    try:
+        return codes.index(value)
+    except ValueError:
+        return value
+
+
+def decode_code(value: Any, codes: Tuple[str, ...]) -> Any:
+    if isinstance(value, int) and 0 <= value < len(codes):
+        return codes[value]
+    return value
+
+
+def encode_date(value: Any, timestamp: datetime) -> Any:
+    """Local date as a day offset from the UTC timestamp; other strings are kept verbatim"""
+    try:
+        parsed = date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value
+    if parsed.isoformat() != value:
+        return value
+    return (parsed - timestamp.date()).days
+
+
+def decode_date(value: Any, timestamp: datetime) -> Any:
+    if isinstance(value, int):
+        return (timestamp.date() + timedelta(days=value)).isoformat()
+    return value
+
+
+def compact_projection(projection: Optional[Dict[str, int]], fields: Dict[str, Tuple[str, ...]]) -> Optional[Dict[str, int]]:
+    """Translate an API inclusion projection into the compact fields needed to decode it"""
+    included = [k for k, v in (projection or {}).items() if v and k != "_id"]
+    if not included:
+        return None
+    needed = {"_id": 0}
+    for name in included:
+        for field in fields.get(name, (name,)):
+            needed[field] = 1
+    return needed
+
+
+class AppRefs:
+    """packageName <-> integer reference, with the canonical names of the app"""
+
+    def __init__(self, collection, counters):
+        self.collection = collection
+        self.counters = counters
+        self._by_package: Dict[str, int] = {}
+        self._by_ref: Dict[int, Dict[str, Any]] = {}
+
+    def _remember(self, doc: Dict[str, Any]):
+        self._by_package[doc["n"]] = doc["_id"]
+        self._by_ref[doc["_id"]] = doc
+
+    async def lookup(self, package_name: str) -> Optional[int]:
+        """Reference for a package, or None if nothing was ever stored for it"""
+        ref = self._by_package.get(package_name)
+        if ref is None:
+            doc = await self.collection.find_one({"n": package_name})
+            if doc is None:
+                return None
+            self._remember(doc)
+            ref = doc["_id"]
+        return ref
+
+    async def ref(self, package_name: str, app_name: Optional[str] = None, display_name: Optional[str] = None) -> int:
+        """Reference for a package, creating it (with these names as canonical) on first use"""
+        ref = await self.lookup(package_name)
+        if ref is not None:
+            return ref
+
+        counter = await self.counters.find_one_and_update(
+            {"_id": "app_refs"}, {"$inc": {"seq": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        doc = {"_id": counter["seq"], "n": package_name, "an": app_name, "dn": display_name or app_name}
+        try:
+            await self.collection.insert_one(doc)
+        except DuplicateKeyError:
+            # Another writer registered the package first; use theirs
+            doc = await self.collection.find_one({"n": package_name})
+        self._remember(doc)
+        return doc["_id"]
+
+    async def refs(self, package_names: Iterable[str]) -> Dict[str, int]:
+        found = {}
+        for package_name in package_names:
+            ref = await self.lookup(package_name)
+            if ref is not None:
+                found[package_name] = ref
+        return found
+
+    async def resolve(self, refs: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        refs = set(refs)
+        missing = [r for r in refs if r not in self._by_ref]
+        if missing:
+            async for doc in self.collection.find({"_id": {"$in": missing}}):
+                self._remember(doc)
+        return {r: self._by_ref[r] for r in refs if r in self._by_ref}
+
+    def canonical(self, ref: Optional[int]) -> Dict[str, Any]:
+        return self._by_ref.get(ref, {})
+
+
+def _copy_extra(source: Dict[str, Any], target: Dict[str, Any], known: Dict[str, Tuple[str, ...]]):
+    # Fields outside the model are stored under their own names
+    for key, value in source.items():
+        if key not in known and key != "_id":
+            target[key] = value
+
+
+def _extra(doc: Dict[str, Any], compact_fields: Iterable[str]) -> Dict[str, Any]:
+    return {k: v for k, v in doc.items() if k not in compact_fields}
+
+
+SESSION_COMPACT = {field for fields in SESSION_FIELDS.values() for field in fields}
+APP_COMPACT = {field for fields in APP_FIELDS.values() for field in fields}
+
+
+class SessionCodec:
+    def __init__(self, refs: AppRefs):
+        self.refs = refs
+
+    async def encode(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        ref = await self.refs.ref(session["packageName"], session.get("appName"))
+        timestamp = session["timestamp"]
+        doc = {
+            "_id": encode_id(session["id"]),
+            "u": session["userId"],
+            "a": encode_id(session["appId"]),
+            "p": ref,
+            "m": session["duration"],
+            "t": timestamp,
+        }
+        if session.get("appName") != self.refs.canonical(ref).get("an"):
+            doc["an"] = session.get("appName")
+        offset = encode_date(session.get("date"), timestamp)
+        if offset != 0:
+            doc["d"] = offset
+        kind = encode_code(session.get("sessionType", "active"), SESSION_TYPES)
+        if kind != 0:
+            doc["k"] = kind
+        _copy_extra(session, doc, SESSION_FIELDS)
+        return doc
+
+    def decode(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Full API document; fields the read did not fetch are dropped by project()"""
+        canonical = self.refs.canonical(doc.get("p"))
+        timestamp = doc.get("t")
+        return {
+            "id": decode_id(doc.get("_id")),
+            "userId": doc.get("u"),
+            "appId": decode_id(doc.get("a")),
+            "packageName": canonical.get("n"),
+            "appName": doc.get("an", canonical.get("an")),
+            "duration": doc.get("m"),
+            "timestamp": timestamp,
+            "date": decode_date(doc.get("d", 0), timestamp) if timestamp else doc.get("d"),
+            "sessionType": decode_code(doc.get("k", 0), SESSION_TYPES),
+            **_extra(doc, SESSION_COMPACT),
+        }
+
+    async def decode_all(self, docs: List[Dict[str, Any]], projection: Optional[Dict[str, int]]) -> List[Dict[str, Any]]:
+        await self.refs.resolve(doc["p"] for doc in docs if "p" in doc)
+        return [project(self.decode(doc), projection) for doc in docs]
+
+
+class AppCodec:
+    def __init__(self, refs: AppRefs):
+        self.refs = refs
+
+    async def encode(self, app: Dict[str, Any]) -> Dict[str, Any]:
+        ref = await self.refs.ref(app["packageName"], app.get("appName"), app.get("displayName"))
+        canonical = self.refs.canonical(ref)
+        doc = {
+            "_id": encode_id(app["id"]),
+            "u": app["userId"],
+            "p": ref,
+            "l": app["dailyLimit"],
+            "tu": app.get("timeUsed", 0),
+            "b": app.get("isBlocked", False),
+            "on": app.get("isActive", True),
+            "z": app.get("timezone"),
+            "ca": app.get("createdAt"),
+            "ua": app.get("updatedAt"),
+        }
+        if app.get("appName") != canonical.get("an"):
+            doc["an"] = app.get("appName")
+        if app.get("displayName") != canonical.get("dn"):
+            doc["dn"] = app.get("displayName")
+        if app.get("icon") is not None:
+            doc["i"] = app["icon"]
+        if app.get("category") is not None:
+            doc["c"] = encode_code(app["category"], CATEGORIES)
+        if app.get("lastResetDate") is not None:
+            doc["r"] = app["lastResetDate"]
+        _copy_extra(app, doc, APP_FIELDS)
+        return doc
+
+    def decode(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Full API document; fields the read did not fetch are dropped by project()"""
+        canonical = self.refs.canonical(doc.get("p"))
+        return {
+            "id": decode_id(doc.get("_id")),
+            "userId": doc.get("u"),
+            "packageName": canonical.get("n"),
+            "appName": doc.get("an", canonical.get("an")),
+            "displayName": doc.get("dn", canonical.get("dn")),
+            "icon": doc.get("i"),
+            "dailyLimit": doc.get("l"),
+            "timeUsed": doc.get("tu"),
+            "isBlocked": doc.get("b"),
+            "category": decode_code(doc.get("c"), CATEGORIES),
+            "isActive": doc.get("on"),
+            "timezone": doc.get("z"),
+            "lastResetDate": doc.get("r"),
+            "createdAt": doc.get("ca"),
+            "updatedAt": doc.get("ua"),
+            **_extra(doc, APP_COMPACT),
+        }
+
+    async def decode_all(self, docs: List[Dict[str, Any]], projection: Optional[Dict[str, int]]) -> List[Dict[str, Any]]:
+        await self.refs.resolve(doc["p"] for doc in docs if "p" in doc)
+        return [project(self.decode(doc), projection) for doc in docs]
+
+
+class CompactUsageSessions(UsageSessionRepository):
+    def __init__(self, collection, refs: AppRefs):
+        self.collection = collection
+        self.codec = SessionCodec(refs)
+
+    async def insert(self, session: Dict[str, Any]):
+        await self.collection.insert_one(await self.codec.encode(session))
+
+    async def insert_many(self, sessions: List[Dict[str, Any]]):
+        docs = [await self.codec.encode(s) for s in sessions]
+        await self.collection.insert_many(docs, ordered=False)
+
+    async def unsaved(self, sessions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not sessions:
+            return []
+        saved = {
+            doc["_id"]
+            async for doc in self.collection.find(
+                {"u": {"$in": list({s["userId"] for s in sessions})}, "_id": {"$in": [encode_id(s["id"]) for s in sessions]}},
+                {"_id": 1}
+            )
+        }
+        return [s for s in sessions if encode_id(s["id"]) not in saved]
+
+    async def list_for_app(
+        self, user_id: str, package_name: str, start: datetime, end: datetime,
+        projection: Optional[Dict[str, int]] = None, limit: int = 1000
+    ) -> List[Dict[str, Any]]:
+        ref = await self.codec.refs.lookup(package_name)
+        if ref is None:
+            return []
+        docs = await self.collection.find(
+            {"u": user_id, "p": ref, "t": {"$gte": start, "$lt": end}},
+            compact_projection(projection, SESSION_FIELDS)
+        ).to_list(limit)
+        return await self.codec.decode_all(docs, projection)
+
+    async def list_since(self, user_id: str, start: datetime, projection: Dict[str, int], limit: int = 1000) -> List[Dict[str, Any]]:
+        docs = await self.collection.find(
+            {"u": user_id, "t": {"$gte": start}},
+            compact_projection(projection, SESSION_FIELDS)
+        ).to_list(limit)
+        return await self.codec.decode_all(docs, projection)
+
+    async def usage_by_hour(self, user_id: str, start: datetime, end: datetime, timezone_name: str) -> List[Dict[str, Any]]:
+        local = {"date": "$t", "timezone": timezone_name}
+        return await self.collection.aggregate([
+            {"$match": {"u": user_id, "t": {"$gte": start, "$lt": end}}},
+            {"$project": {"m": 1, "parts": {"$dateToParts": local}, "weekday": {"$isoDayOfWeek": local}}},
+            {"$group": {
+                "_id": {"weekday": "$weekday", "hour": "$parts.hour"},
+                "minutes": {"$sum": "$m"},
+                "sessions": {"$sum": 1},
+            }},
+            {"$project": {"_id": 0, "weekday": "$_id.weekday", "hour": "$_id.hour", "minutes": 1, "sessions": 1}},
+        ]).to_list(None)
+
+    async def usage_by_day(self, user_id: str, start: datetime, end: datetime, timezone_name: str) -> List[Dict[str, Any]]:
+        # Grouped on the app reference; names come from app_refs afterwards
+        groups = await self.collection.aggregate([
+            {"$match": {"u": user_id, "t": {"$gte": start, "$lt": end}}},
+            {"$project": {"m": 1, "p": 1, "parts": {"$dateToParts": {"date": "$t", "timezone": timezone_name}}}},
+            {"$group": {
+                "_id": {"year": "$parts.year", "month": "$parts.month", "day": "$parts.day", "p": "$p"},
+                "minutes": {"$sum": "$m"},
+            }},
+        ]).to_list(None)
+        names = await self.codec.refs.resolve(g["_id"]["p"] for g in groups)
+        return [
+            {
+                "date": f"{g['_id']['year']:04d}-{g['_id']['month']:02d}-{g['_id']['day']:02d}",
+                "packageName": names.get(g["_id"]["p"], {}).get("n"),
+                "appName": names.get(g["_id"]["p"], {}).get("an"),
+                "minutes": g["minutes"],
+            }
+            for g in groups
+        ]
+
+
+class CompactMonitoredApps(MonitoredAppRepository):
+    def __init__(self, collection, refs: AppRefs):
+        self.collection = collection
+        self.codec = AppCodec(refs)
+        self.refs = refs
+
+    async def _decode_one(self, doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if doc is None:
+            return None
+        return (await self.codec.decode_all([doc], None))[0]
+
+    async def insert(self, app: Dict[str, Any]):
+        try:
+            await self.collection.insert_one(await self.codec.encode(app))
+        except DuplicateKeyError:
+            raise DuplicateAppError(app["packageName"])
+
+    async def bulk_write(self, user_id: str, operations: List[MonitoredAppOp], now: datetime) -> BulkResult:
+        ids = [operation[1] for operation in operations if operation[0] != "add"]
+        found = {}
+        if ids:
+            docs = await self.collection.find(
+                {"u": user_id, "_id": {"$in": [encode_id(app_id) for app_id in ids]}}, {"_id": 1, "on": 1}
+            ).to_list(None)
+            found = {decode_id(doc["_id"]): bool(doc.get("on")) for doc in docs}
+        unmatched = unmatched_operations(operations, found)
+
+        # Position in `operations` of each request, so errors refer to the caller's list
+        positions, requests = [], []
+        for index, operation in enumerate(operations):
+            if index in unmatched:
+                continue
+            positions.append(index)
+            if operation[0] == "add":
+                requests.append(InsertOne(await self.codec.encode(operation[1])))
+            elif operation[0] == "update_limit":
+                _, app_id, daily_limit = operation
+                requests.append(UpdateOne(
+                    {"_id": encode_id(app_id), "u": user_id, "on": True},
+                    [{"$set": {"l": daily_limit, "b": {"$gte": ["$tu", daily_limit]}, "ua": now}}]
+                ))
+            else:
+                requests.append(UpdateOne(
+                    {"_id": encode_id(operation[1]), "u": user_id},
+                    {"$set": {"on": False, "ua": now}}
+                ))
+
+        if not requests:
+            return BulkResult(unmatched=unmatched)
+        try:
+            result = await self.collection.bulk_write(requests, ordered=False)
+            return BulkResult(inserted=result.inserted_count, modified=result.modified_count, unmatched=unmatched)
+        except BulkWriteError as bwe:
+            return BulkResult(
+                inserted=bwe.details.get("nInserted", 0),
+                modified=bwe.details.get("nModified", 0),
+                unmatched=unmatched,
+                errors=[
+                    {
+                        "index": positions[err["index"]],
+                        "duplicate": err.get("code") == 11000,
+                        "errmsg": err.get("errmsg", "Write failed"),
+                    }
+                    for err in bwe.details.get("writeErrors", [])
+                ]
+            )
+
+    async def get(self, user_id: str, app_id: str) -> Optional[Dict[str, Any]]:
+        return await self._decode_one(await self.collection.find_one({"_id": encode_id(app_id), "u": user_id}))
+
+    async def find_active(self, user_id: str, package_name: str) -> Optional[Dict[str, Any]]:
+        ref = await self.refs.lookup(package_name)
+        if ref is None:
+            return None
+        return await self._decode_one(await self.collection.find_one({"u": user_id, "p": ref, "on": True}))
+
+    async def list_active(self, user_id: str, projection: Dict[str, int], limit: int = 100) -> List[Dict[str, Any]]:
+        docs = await self.collection.find(
+            {"u": user_id, "on": True}, compact_projection(projection, APP_FIELDS)
+        ).to_list(limit)
+        return await self.codec.decode_all(docs, projection)
+
+    async def blocked_packages(self, user_id: str) -> List[str]:
+        docs = await self.collection.find({"u": user_id, "on": True, "b": True}, {"_id": 0, "p": 1}).to_list(100)
+        names = await self.refs.resolve(doc["p"] for doc in docs)
+        return [names[doc["p"]]["n"] for doc in docs if doc["p"] in names]
+
+    async def set_usage(self, user_id: str, app_id: str, time_used: int, is_blocked: bool, now: datetime):
+        await self.collection.update_one(
+            {"_id": encode_id(app_id), "u": user_id},
+            {"$set": {"tu": time_used, "b": is_blocked, "ua": now}}
+        )
+
+    async def set_package_usage(
+        self, user_id: str, package_name: str, time_used: int, is_blocked: bool, now: datetime, local_date: str
+    ):
+        ref = await self.refs.lookup(package_name)
+        if ref is not None:
+            await self.collection.update_one(
+                {"u": user_id, "p": ref, "on": True},
+                {"$set": {"tu": time_used, "b": is_blocked, "r": local_date, "ua": now}}
+            )
+
+    async def add_usage(self, durations: Dict[AppKey, int], now: datetime):
+        refs = await self.refs.refs({package_name for _, package_name in durations})
+        requests = [
+            UpdateOne(
+                {"u": user_id, "p": refs[package_name], "on": True},
+                [
+                    {"$set": {"_today": local_date_expression(now, "$z")}},
+                    {"$set": {
+                        "tu": {"$cond": [
+                            {"$lt": [{"$ifNull": ["$r", ""]}, "$_today"]},
+                            duration,
+                            {"$add": [{"$ifNull": ["$tu", 0]}, duration]},
+                        ]},
+                        "r": {"$max": [{"$ifNull": ["$r", ""]}, "$_today"]},
+                    }},
+                    {"$set": {"b": {"$gte": ["$tu", {"$ifNull": ["$l", 60]}]}, "ua": now}},
+                    {"$project": {"_today": 0}},
+                ],
+            )
+            for (user_id, package_name), duration in durations.items()
+            if package_name in refs
+        ]
+        if requests:
+            await self.collection.bulk_write(requests, ordered=False)
+
+    async def find_by_keys(self, keys: Iterable[AppKey], projection: Dict[str, int]) -> List[Dict[str, Any]]:
+        keys = list(keys)
+        refs = await self.refs.refs({package_name for _, package_name in keys})
+        clauses = [{"u": u, "p": refs[p], "on": True} for u, p in keys if p in refs]
+        if not clauses:
+            return []
+        docs = await self.collection.find(
+            {"$or": clauses}, compact_projection(projection, APP_FIELDS)
+        ).to_list(len(clauses))
+        return await self.codec.decode_all(docs, projection)
+
+    async def deactivate(self, user_id: str, app_id: str, now: datetime) -> Optional[Dict[str, Any]]:
+        doc = await self.collection.find_one_and_update(
+            {"_id": encode_id(app_id), "u": user_id},
+            {"$set": {"on": False, "ua": now}},
+            projection={"_id": 0, "u": 1, "p": 1}
+        )
+        if doc is None:
+            return None
+        return (await self.codec.decode_all([doc], {"userId": 1, "packageName": 1}))[0]
+
+    async def set_timezone(self, user_id: str, timezone_name: str, now: datetime):
+        await self.collection.update_many({"u": user_id}, {"$set": {"z": timezone_name, "ua": now}})
+
+    async def active_timezones(self) -> List[str]:
+        zones = await self.collection.aggregate([
+            {"$match": {"on": True}},
+            {"$group": {"_id": {"$ifNull": ["$z", DEFAULT_TIMEZONE]}}},
+        ]).to_list(None)
+        return [zone["_id"] for zone in zones]
+
+    async def reset_zone(self, timezone_name: str, local_date: str, now: datetime) -> int:
+        result = await self.collection.update_many(
+            {"z": zone_filter(timezone_name), "on": True, "r": {"$not": {"$gte": local_date}}},
+            {"$set": {"tu": 0, "b": False, "r": local_date, "ua": now}},
+        )
+        return result.modified_count
+
+
+async def _mirror(operation, description: str):
+    # The compact copy must never fail a request that succeeded on the legacy one;
+    # duplicates are expected where the migration already copied a document
+    try:
+        await operation
+    except (DuplicateKeyError, DuplicateAppError):
+        pass
+    except BulkWriteError as bwe:
+        if any(err.get("code") != 11000 for err in bwe.details.get("writeErrors", [])):
+            logger.warning(f"Compact mirror of {description} failed: {bwe.details.get('writeErrors')}")
+    except Exception as e:
+        logger.warning(f"Compact mirror of {description} failed: {e}")
+
+
+class DualWriteUsageSessions(UsageSessionRepository):
+    """Reads from the legacy collection; writes also go to the compact one"""
+
+    def __init__(self, legacy: UsageSessionRepository, compact: UsageSessionRepository):
+        self.legacy = legacy
+        self.compact = compact
+
+    async def insert(self, session: Dict[str, Any]):
+        await self.legacy.insert(session)
+        await _mirror(self.compact.insert(session), "session insert")
+
+    async def insert_many(self, sessions: List[Dict[str, Any]]):
+        await self.legacy.insert_many(sessions)
+        await _mirror(self.compact.insert_many(sessions), "session batch")
+
+    async def unsaved(self, sessions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # The compact copy is a mirror; legacy decides what was stored
+        return await self.legacy.unsaved(sessions)
+
+    async def list_for_app(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        return await self.legacy.list_for_app(*args, **kwargs)
+
+    async def list_since(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        return await self.legacy.list_since(*args, **kwargs)
+
+    async def usage_by_hour(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        return await self.legacy.usage_by_hour(*args, **kwargs)
+
+    async def usage_by_day(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        return await self.legacy.usage_by_day(*args, **kwargs)
+
+
+class DualWriteMonitoredApps(MonitoredAppRepository):
+    """Reads from the legacy collection; writes also go to the compact one"""
+
+    def __init__(self, legacy: MonitoredAppRepository, compact: MonitoredAppRepository):
+        self.legacy = legacy
+        self.compact = compact
+
+    async def insert(self, app: Dict[str, Any]):
+        await self.legacy.insert(app)
+        await _mirror(self.compact.insert(app), "app insert")
+
+    async def bulk_write(self, user_id: str, operations: List[MonitoredAppOp], now: datetime) -> BulkResult:
+        result = await self.legacy.bulk_write(user_id, operations, now)
+        # Only replay what the legacy collection accepted, so both stay in step
+        failed = {err["index"] for err in result.errors} | set(result.unmatched)
+        accepted = [op for index, op in enumerate(operations) if index not in failed]
+        if accepted:
+            await _mirror(self.compact.bulk_write(user_id, accepted, now), "bulk configure")
+        return result
+
+    async def get(self, user_id: str, app_id: str) -> Optional[Dict[str, Any]]:
+        return await self.legacy.get(user_id, app_id)
+
+    async def find_active(self, user_id: str, package_name: str) -> Optional[Dict[str, Any]]:
+        return await self.legacy.find_active(user_id, package_name)
+
+    async def list_active(self, user_id: str, projection: Dict[str, int], limit: int = 100) -> List[Dict[str, Any]]:
+        return await self.legacy.list_active(user_id, projection, limit)
+
+    async def blocked_packages(self, user_id: str) -> List[str]:
+        return await self.legacy.blocked_packages(user_id)
+
+    async def set_usage(self, user_id: str, app_id: str, time_used: int, is_blocked: bool, now: datetime):
+        await self.legacy.set_usage(user_id, app_id, time_used, is_blocked, now)
+        await _mirror(self.compact.set_usage(user_id, app_id, time_used, is_blocked, now), "usage update")
+
+    async def set_package_usage(
+        self, user_id: str, package_name: str, time_used: int, is_blocked: bool, now: datetime, local_date: str
+    ):
+        await self.legacy.set_package_usage(user_id, package_name, time_used, is_blocked, now, local_date)
+        await _mirror(
+            self.compact.set_package_usage(user_id, package_name, time_used, is_blocked, now, local_date),
+            "usage update"
+        )
+
+    async def add_usage(self, durations: Dict[AppKey, int], now: datetime):
+        await self.legacy.add_usage(durations, now)
+        await _mirror(self.compact.add_usage(durations, now), "usage batch")
+
+    async def find_by_keys(self, keys: Iterable[AppKey], projection: Dict[str, int]) -> List[Dict[str, Any]]:
+        return await self.legacy.find_by_keys(keys, projection)
+
+    async def deactivate(self, user_id: str, app_id: str, now: datetime) -> Optional[Dict[str, Any]]:
+        app = await self.legacy.deactivate(user_id, app_id, now)
+        await _mirror(self.compact.deactivate(user_id, app_id, now), "deactivate")
+        return app
+
+    async def set_timezone(self, user_id: str, timezone_name: str, now: datetime):
+        await self.legacy.set_timezone(user_id, timezone_name, now)
+        await _mirror(self.compact.set_timezone(user_id, timezone_name, now), "timezone update")
+
+    async def active_timezones(self) -> List[str]:
+        return await self.legacy.active_timezones()
+
+    async def reset_zone(self, timezone_name: str, local_date: str, now: datetime) -> int:
+        modified = await self.legacy.reset_zone(timezone_name, local_date, now)
+        await _mirror(self.compact.reset_zone(timezone_name, local_date, now), "daily reset")
+        return modified
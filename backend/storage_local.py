@@ -0,0 +1,557 @@
+"""
+Embedded backends for the repository layer: in-memory and SQLite.
+
+Both share the repository logic below and differ only in the Table they keep
+documents in. MemoryTable holds dicts. SQLiteTable stores each document as
+JSON next to a few indexed columns (key, userId, packageName, isActive,
+timestamp) and runs every statement on one dedicated thread.
+
+Read-modify-write sequences (uniqueness of active apps, upserts, usage
+counters) hold a per-repository asyncio.Lock. That only excludes other tasks
+in the same process, so a SQLite file must be served by exactly one worker;
+start_backend.py refuses --prod with SQLite and more than one worker.
+"""
+
+import asyncio
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from daily_reset import DEFAULT_TIMEZONE, local_today, reset_pending, resolve_timezone
+from storage import (
+    CHANGE_LOG_SIZE,
+    AppKey,
+    AppRegistryRepository,
+    BulkResult,
+    Change,
+    ChangeLogRepository,
+    ChangeSet,
+    ChallengeRepository,
+    DuplicateAppError,
+    MonitoredAppOp,
+    MonitoredAppRepository,
+    Storage,
+    UsageSessionRepository,
+    UserSettingsRepository,
+    change_set,
+    project,
+)
+
+Document = Dict[str, Any]
+
+
+def _matches(document: Document, where: Dict[str, Any]) -> bool:
+    return all(document.get(k) == v for k, v in where.items())
+
+
+def _in_range(document: Document, start: Optional[datetime], end: Optional[datetime]) -> bool:
+    timestamp = document.get("timestamp")
+    if timestamp is None:
+        return start is None and end is None
+    return (start is None or timestamp >= start) and (end is None or timestamp < end)
+
+
+class Table(ABC):
+    def __init__(self, key_field: Union[str, Tuple[str, ...]] = "id"):
+        # A single field, or several whose values are joined into one key
+        self.key_field = key_field
+
+    def key(self, document: Document) -> Any:
+        if isinstance(self.key_field, str):
+            return document[self.key_field]
+        return "\x1f".join(str(document.get(f)) for f in self.key_field)
+
+    @abstractmethod
+    async def find(
+        self, where: Optional[Dict[str, Any]] = None, start: Optional[datetime] = None,
+        end: Optional[datetime] = None, limit: Optional[int] = None
+    ) -> List[Document]:
+        """Documents matching equality filters and an optional [start, end) timestamp window"""
+
+    @abstractmethod
+    async def insert(self, documents: List[Document]): ...
+
+    @abstractmethod
+    async def replace(self, documents: List[Document]):
+        """Overwrite documents by key"""
+
+
+class MemoryTable(Table):
+    def __init__(self, key_field: Union[str, Tuple[str, ...]] = "id"):
+        super().__init__(key_field)
+        self._documents: Dict[Any, Document] = {}
+
+    async def find(self, where=None, start=None, end=None, limit=None) -> List[Document]:
+        found = []
+        for document in self._documents.values():
+            if _matches(document, where or {}) and _in_range(document, start, end):
+                found.append(dict(document))
+                if limit is not None and len(found) >= limit:
+                    break
+        return found
+
+    async def insert(self, documents: List[Document]):
+        for document in documents:
+            self._documents[self.key(document)] = dict(document)
+
+    async def replace(self, documents: List[Document]):
+        await self.insert(documents)
+
+
+def _encode(value: Any):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"Cannot store {type(value).__name__}")
+
+
+def _decode(document: Dict[str, Any]):
+    if len(document) == 1 and "$date" in document:
+        return datetime.fromisoformat(document["$date"])
+    return document
+
+
+def _timestamp_column(value: Optional[datetime]) -> Optional[str]:
+    # Fixed-width so string comparison orders like datetime comparison
+    return value.isoformat(timespec="microseconds") if value is not None else None
+
+
+class SQLiteTable(Table):
+    # Filter fields with their own column; others are filtered after loading
+    COLUMNS = ("userId", "packageName", "isActive")
+
+    def __init__(self, database: "SQLiteDatabase", name: str, key_field: Union[str, Tuple[str, ...]] = "id"):
+        super().__init__(key_field)
+        self.database = database
+        self.name = name
+
+    def create(self, connection: sqlite3.Connection):
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.name} ("
+            "key TEXT PRIMARY KEY, userId TEXT, packageName TEXT, isActive INTEGER, ts TEXT, doc TEXT NOT NULL)"
+        )
+        connection.execute(f"CREATE INDEX IF NOT EXISTS {self.name}_user ON {self.name} (userId, packageName, isActive)")
+        connection.execute(f"CREATE INDEX IF NOT EXISTS {self.name}_user_ts ON {self.name} (userId, ts)")
+
+    def _row(self, document: Document) -> Tuple:
+        is_active = document.get("isActive")
+        return (
+            self.key(document),
+            document.get("userId"),
+            document.get("packageName"),
+            None if is_active is None else int(is_active),
+            _timestamp_column(document.get("timestamp")),
+            json.dumps(document, default=_encode),
+        )
+
+    async def find(self, where=None, start=None, end=None, limit=None) -> List[Document]:
+        clauses, params, remaining = [], [], {}
+        for field, value in (where or {}).items():
+            if field == self.key_field:
+                clauses.append("key = ?")
+                params.append(value)
+            elif field in self.COLUMNS:
+                clauses.append(f"{field} = ?")
+                params.append(int(value) if isinstance(value, bool) else value)
+            else:
+                remaining[field] = value
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(_timestamp_column(start))
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(_timestamp_column(end))
+
+        sql = f"SELECT doc FROM {self.name}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY rowid"
+        if limit is not None and not remaining:
+            sql += f" LIMIT {int(limit)}"
+
+        rows = await self.database.run(lambda c: c.execute(sql, params).fetchall())
+        documents = [json.loads(row[0], object_hook=_decode) for row in rows]
+        if remaining:
+            documents = [d for d in documents if _matches(d, remaining)]
+            if limit is not None:
+                documents = documents[:limit]
+        return documents
+
+    async def insert(self, documents: List[Document]):
+        rows = [self._row(d) for d in documents]
+        await self.database.run(
+            # Upsert in place so rowid (and therefore insertion order) is kept
+            lambda c: c.executemany(
+                f"INSERT INTO {self.name} VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                "userId = excluded.userId, packageName = excluded.packageName, "
+                "isActive = excluded.isActive, ts = excluded.ts, doc = excluded.doc",
+                rows
+            ),
+            commit=True
+        )
+
+    async def replace(self, documents: List[Document]):
+        await self.insert(documents)
+
+
+class SQLiteDatabase:
+    """One connection used from one thread, so statements never interleave"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _open(self, tables: List[SQLiteTable]):
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL lets readers proceed during writes; NORMAL sync is durable across app crashes
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        for table in tables:
+            table.create(self._connection)
+        self._connection.commit()
+
+    async def open(self, tables: List[SQLiteTable]):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._open, tables)
+
+    async def run(self, statement, commit: bool = False):
+        def execute():
+            result = statement(self._connection)
+            if commit:
+                self._connection.commit()
+            return result
+        return await asyncio.get_running_loop().run_in_executor(self._executor, execute)
+
+    async def close(self):
+        if self._connection is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._connection.close)
+            self._connection = None
+        self._executor.shutdown(wait=True)
+
+
+class LocalChallenges(ChallengeRepository):
+    def __init__(self, table: Table):
+        self.table = table
+
+    async def insert(self, challenge: Document):
+        await self.table.insert([challenge])
+
+    async def get(self, user_id: str, challenge_id: str) -> Optional[Document]:
+        found = await self.table.find({"userId": user_id, "id": challenge_id}, limit=1)
+        return found[0] if found else None
+
+    async def set_result(self, user_id: str, challenge_id: str, correct: bool):
+        challenge = await self.get(user_id, challenge_id)
+        if challenge is not None:
+            challenge.update(completed=True, correct=correct)
+            await self.table.replace([challenge])
+
+    async def list(self, user_id: str, projection: Dict[str, int], limit: int = 1000) -> List[Document]:
+        return [project(c, projection) for c in await self.table.find({"userId": user_id}, limit=limit)]
+
+
+class LocalAppRegistry(AppRegistryRepository):
+    def __init__(self, table: Table):
+        # Keyed by (userId, packageName), the registry's natural key
+        self.table = table
+        self._lock = asyncio.Lock()
+
+    async def upsert(self, app: Document) -> bool:
+        async with self._lock:
+            existing = await self.table.find({"userId": app["userId"], "packageName": app["packageName"]}, limit=1)
+            await self.table.replace([{**existing[0], **app} if existing else app])
+            return not existing
+
+    async def list(self, user_id: str, projection: Dict[str, int], limit: int = 1000) -> List[Document]:
+        return [project(a, projection) for a in await self.table.find({"userId": user_id}, limit=limit)]
+
+    async def search(self, user_id, query, category, projection, limit) -> List[Document]:
+        needle = query.lower() if query else None
+        where = {"userId": user_id}
+        if category:
+            where["category"] = category
+        found = []
+        for app in await self.table.find(where):
+            if needle and not any(needle in (app.get(f) or "").lower() for f in ("appName", "displayName", "packageName")):
+                continue
+            found.append(project(app, projection))
+            if len(found) >= limit:
+                break
+        return found
+
+    async def category_counts(self, user_id: str) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for app in await self.table.find({"userId": user_id}):
+            counts[app.get("category")] = counts.get(app.get("category"), 0) + 1
+        return counts
+
+
+class LocalMonitoredApps(MonitoredAppRepository):
+    def __init__(self, table: Table):
+        self.table = table
+        self._lock = asyncio.Lock()
+
+    async def _insert(self, app: Document):
+        if await self.table.find({"userId": app.get("userId"), "packageName": app["packageName"], "isActive": True}, limit=1):
+            raise DuplicateAppError(app["packageName"])
+        await self.table.insert([app])
+
+    async def insert(self, app: Document):
+        async with self._lock:
+            await self._insert(app)
+
+    async def bulk_write(self, user_id: str, operations: List[MonitoredAppOp], now: datetime) -> BulkResult:
+        result = BulkResult()
+        async with self._lock:
+            for index, operation in enumerate(operations):
+                if operation[0] == "add":
+                    try:
+                        await self._insert(operation[1])
+                        result.inserted += 1
+                    except DuplicateAppError:
+                        result.errors.append({"index": index, "duplicate": True, "errmsg": "duplicate key"})
+                    continue
+
+                where = {"id": operation[1], "userId": user_id}
+                if operation[0] == "update_limit":
+                    where["isActive"] = True
+                found = await self.table.find(where, limit=1)
+                if not found:
+                    result.unmatched.append(index)
+                    continue
+                app = found[0]
+                if operation[0] == "update_limit":
+                    app.update(
+                        dailyLimit=operation[2],
+                        isBlocked=app.get("timeUsed", 0) >= operation[2],
+                        updatedAt=now
+                    )
+                else:
+                    app.update(isActive=False, updatedAt=now)
+                await self.table.replace([app])
+                result.modified += 1
+        return result
+
+    async def get(self, user_id: str, app_id: str) -> Optional[Document]:
+        found = await self.table.find({"userId": user_id, "id": app_id}, limit=1)
+        return found[0] if found else None
+
+    async def find_active(self, user_id: str, package_name: str) -> Optional[Document]:
+        found = await self.table.find({"userId": user_id, "packageName": package_name, "isActive": True}, limit=1)
+        return found[0] if found else None
+
+    async def list_active(self, user_id: str, projection: Dict[str, int], limit: int = 100) -> List[Document]:
+        apps = await self.table.find({"userId": user_id, "isActive": True}, limit=limit)
+        return [project(a, projection) for a in apps]
+
+    async def blocked_packages(self, user_id: str) -> List[str]:
+        apps = await self.table.find({"userId": user_id, "isActive": True, "isBlocked": True}, limit=100)
+        return [app["packageName"] for app in apps]
+
+    async def _update(self, where: Dict[str, Any], limit: Optional[int] = None, **changes) -> List[Document]:
+        async with self._lock:
+            apps = await self.table.find(where, limit=limit)
+            for app in apps:
+                app.update(changes)
+            if apps:
+                await self.table.replace(apps)
+            return apps
+
+    async def set_usage(self, user_id: str, app_id: str, time_used: int, is_blocked: bool, now: datetime):
+        await self._update({"userId": user_id, "id": app_id}, timeUsed=time_used, isBlocked=is_blocked, updatedAt=now)
+
+    async def set_package_usage(
+        self, user_id: str, package_name: str, time_used: int, is_blocked: bool, now: datetime, local_date: str
+    ):
+        await self._update(
+            {"userId": user_id, "packageName": package_name, "isActive": True}, limit=1,
+            timeUsed=time_used, isBlocked=is_blocked, lastResetDate=local_date, updatedAt=now
+        )
+
+    async def add_usage(self, durations: Dict[AppKey, int], now: datetime):
+        async with self._lock:
+            updated = []
+            for (user_id, package_name), duration in durations.items():
+                for app in await self.table.find({"userId": user_id, "packageName": package_name, "isActive": True}, limit=1):
+                    # The first minutes of a new local day land before the scheduler's reset
+                    local_date = local_today(app.get("timezone"), now.replace(tzinfo=timezone.utc)).isoformat()
+                    if reset_pending(app.get("lastResetDate"), local_date):
+                        app.update(timeUsed=0, lastResetDate=local_date)
+                    app["timeUsed"] = (app.get("timeUsed") or 0) + duration
+                    app["isBlocked"] = app["timeUsed"] >= (app.get("dailyLimit") or 60)
+                    app["updatedAt"] = now
+                    updated.append(app)
+            if updated:
+                await self.table.replace(updated)
+
+    async def find_by_keys(self, keys: Iterable[AppKey], projection: Dict[str, int]) -> List[Document]:
+        found = []
+        for user_id, package_name in keys:
+            app = await self.find_active(user_id, package_name)
+            if app is not None:
+                found.append(project(app, projection))
+        return found
+
+    async def deactivate(self, user_id: str, app_id: str, now: datetime) -> Optional[Document]:
+        apps = await self._update({"userId": user_id, "id": app_id}, limit=1, isActive=False, updatedAt=now)
+        return {"userId": apps[0].get("userId"), "packageName": apps[0]["packageName"]} if apps else None
+
+    async def set_timezone(self, user_id: str, timezone_name: str, now: datetime):
+        await self._update({"userId": user_id}, timezone=timezone_name, updatedAt=now)
+
+    async def active_timezones(self) -> List[str]:
+        return list({app.get("timezone") or DEFAULT_TIMEZONE for app in await self.table.find({"isActive": True})})
+
+    async def reset_zone(self, timezone_name: str, local_date: str, now: datetime) -> int:
+        async with self._lock:
+            apps = [
+                app for app in await self.table.find({"isActive": True})
+                if (app.get("timezone") or DEFAULT_TIMEZONE) == timezone_name
+                and reset_pending(app.get("lastResetDate"), local_date)
+            ]
+            for app in apps:
+                app.update(timeUsed=0, isBlocked=False, lastResetDate=local_date, updatedAt=now)
+            if apps:
+                await self.table.replace(apps)
+            return len(apps)
+
+
+class LocalUsageSessions(UsageSessionRepository):
+    def __init__(self, table: Table):
+        self.table = table
+
+    async def insert(self, session: Document):
+        await self.table.insert([session])
+
+    async def insert_many(self, sessions: List[Document]):
+        await self.table.insert(sessions)
+
+    async def unsaved(self, sessions: List[Document]) -> List[Document]:
+        saved = set()
+        for user_id in {s["userId"] for s in sessions}:
+            timestamps = [s["timestamp"] for s in sessions if s["userId"] == user_id]
+            found = await self.table.find(
+                {"userId": user_id}, start=min(timestamps), end=max(timestamps) + timedelta(microseconds=1)
+            )
+            saved.update(s["id"] for s in found)
+        return [s for s in sessions if s["id"] not in saved]
+
+    async def list_for_app(self, user_id, package_name, start, end, projection=None, limit=1000) -> List[Document]:
+        sessions = await self.table.find({"userId": user_id, "packageName": package_name}, start=start, end=end, limit=limit)
+        return [project(s, projection) for s in sessions]
+
+    async def list_since(self, user_id: str, start: datetime, projection: Dict[str, int], limit: int = 1000) -> List[Document]:
+        return [project(s, projection) for s in await self.table.find({"userId": user_id}, start=start, limit=limit)]
+
+    async def _local_sessions(self, user_id: str, start: datetime, end: datetime, timezone_name: str):
+        # Stored timestamps are naive UTC
+        tz = resolve_timezone(timezone_name)
+        for session in await self.table.find({"userId": user_id}, start=start, end=end):
+            yield session, session["timestamp"].replace(tzinfo=timezone.utc).astimezone(tz)
+
+    async def usage_by_hour(self, user_id: str, start: datetime, end: datetime, timezone_name: str) -> List[Document]:
+        buckets: Dict[Tuple[int, int], Document] = {}
+        async for session, local in self._local_sessions(user_id, start, end, timezone_name):
+            key = (local.isoweekday(), local.hour)
+            bucket = buckets.setdefault(key, {"weekday": key[0], "hour": key[1], "minutes": 0, "sessions": 0})
+            bucket["minutes"] += session.get("duration", 0)
+            bucket["sessions"] += 1
+        return list(buckets.values())
+
+    async def usage_by_day(self, user_id: str, start: datetime, end: datetime, timezone_name: str) -> List[Document]:
+        buckets: Dict[Tuple[str, str], Document] = {}
+        async for session, local in self._local_sessions(user_id, start, end, timezone_name):
+            key = (local.date().isoformat(), session["packageName"])
+            bucket = buckets.setdefault(key, {"date": key[0], "packageName": key[1], "minutes": 0})
+            bucket["appName"] = session.get("appName")
+            bucket["minutes"] += session.get("duration", 0)
+        return list(buckets.values())
+
+
+class LocalUserSettings(UserSettingsRepository):
+    def __init__(self, table: Table):
+        self.table = table
+
+    async def get(self, user_id: str) -> Optional[Document]:
+        found = await self.table.find({"userId": user_id}, limit=1)
+        return found[0] if found else None
+
+    async def upsert(self, settings: Document):
+        await self.table.replace([settings])
+
+
+class LocalChangeLog(ChangeLogRepository):
+    def __init__(self, table: Table):
+        # One document per user: {"userId", "seq", "changes": [{"seq", "kind", "key"}, ...]}
+        self.table = table
+        self._lock = asyncio.Lock()
+
+    async def _load(self, user_id: str) -> Document:
+        found = await self.table.find({"userId": user_id}, limit=1)
+        return found[0] if found else {"userId": user_id, "seq": 0, "changes": []}
+
+    async def append(self, user_id: str, changes: List[Change]) -> int:
+        async with self._lock:
+            log = await self._load(user_id)
+            for kind, key in changes:
+                log["seq"] += 1
+                log["changes"].append({"seq": log["seq"], "kind": kind, "key": key})
+            log["changes"] = log["changes"][-CHANGE_LOG_SIZE:]
+            await self.table.replace([log])
+            return log["seq"]
+
+    async def since(self, user_id: str, after: int) -> ChangeSet:
+        log = await self._load(user_id)
+        return change_set(log["seq"], log["changes"], after)
+
+
+class LocalStorage(Storage):
+    def _bind(self, tables: Dict[str, Table]):
+        self.challenges = LocalChallenges(tables["challenges"])
+        self.app_registry = LocalAppRegistry(tables["app_registry"])
+        self.monitored_apps = LocalMonitoredApps(tables["monitored_apps"])
+        self.usage_sessions = LocalUsageSessions(tables["usage_sessions"])
+        self.user_settings = LocalUserSettings(tables["user_settings"])
+        self.sync_log = LocalChangeLog(tables["sync_log"])
+
+
+# Key field per table; the registry is keyed by user and package, settings and sync log by user
+KEY_FIELDS = {
+    "challenges": "id",
+    "app_registry": ("userId", "packageName"),
+    "monitored_apps": "id",
+    "usage_sessions": "id",
+    "user_settings": "userId",
+    "sync_log": "userId",
+}
+
+
+class MemoryStorage(LocalStorage):
+    name = "memory"
+
+    def __init__(self):
+        self._bind({name: MemoryTable(key) for name, key in KEY_FIELDS.items()})
+
+    async def start(self, timeout: float) -> bool:
+        return True
+
+    async def close(self):
+        pass
+
+
+class SQLiteStorage(LocalStorage):
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.database = SQLiteDatabase(path)
+        self.tables = [SQLiteTable(self.database, name, key) for name, key in KEY_FIELDS.items()]
+        self._bind({table.name: table for table in self.tables})
+
+    async def start(self, timeout: float) -> bool:
+        await self.database.open(self.tables)
+        return True
+
+    async def close(self):
+        await self.database.close()
@@ -0,0 +1,551 @@
+"""
+MongoDB implementation of the repository layer (the production backend).
+
+Shard-key layout for a sharded cluster. Every request-path query filters on
+userId, so with these keys mongos routes it to one shard:
+
+    challenges      {userId: 1, id: 1}
+    app_registry    {userId: 1, packageName: 1}
+    monitored_apps  {userId: 1}          (unique active (userId, packageName) must be shard-key prefixed)
+    usage_sessions  {userId: 1, timestamp: 1}
+    user_settings   {userId: 1}
+    sync_log        {_id: 1}             (one document per user, _id is the userId)
+
+Each shard key is the prefix of a non-partial index in INDEXES (or _id). Ranged rather
+than hashed keys let a heavy user's sessions split into chunks by time.
+backend_migrate_user_keys.py backfills userId, builds the indexes and can
+shard the collections.
+
+MONGO_SCHEMA=dual|compact moves usage_sessions and monitored_apps to the
+compact layout in storage_compact.py.
+"""
+
+import asyncio
+import logging
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+from daily_reset import DEFAULT_TIMEZONE
+from storage import (
+    CHANGE_LOG_SIZE,
+    AppKey,
+    AppRegistryRepository,
+    BulkResult,
+    Change,
+    ChangeLogRepository,
+    ChangeSet,
+    ChallengeRepository,
+    DuplicateAppError,
+    MonitoredAppOp,
+    MonitoredAppRepository,
+    Storage,
+    UsageSessionRepository,
+    UserSettingsRepository,
+    change_set,
+    unmatched_operations,
+)
+from storage_compact import (
+    COMPACT_INDEXES,
+    AppRefs,
+    CompactMonitoredApps,
+    CompactUsageSessions,
+    DualWriteMonitoredApps,
+    DualWriteUsageSessions,
+    local_date_expression,
+    zone_filter,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Compound indexes lead with userId, matching the shard keys below
+INDEXES = {
+    "challenges": [
+        IndexModel([("userId", 1), ("id", 1)], unique=True, name="user_id"),
+    ],
+    "app_registry": [
+        IndexModel([("userId", 1), ("packageName", 1)], unique=True, name="user_package"),
+    ],
+    "monitored_apps": [
+        # At most one active monitoring entry per user and package
+        IndexModel(
+            [("userId", 1), ("packageName", 1)],
+            unique=True,
+            partialFilterExpression={"isActive": True},
+            name="uniq_active_user_package"
+        ),
+        IndexModel([("userId", 1), ("id", 1)], name="user_id"),
+    ],
+    "usage_sessions": [
+        IndexModel([("userId", 1), ("timestamp", 1)], name="user_timestamp"),
+        IndexModel([("userId", 1), ("packageName", 1), ("timestamp", 1)], name="user_package_timestamp"),
+    ],
+    "user_settings": [
+        IndexModel([("userId", 1)], unique=True, name="user"),
+    ],
+}
+
+SHARD_KEYS = {
+    "challenges": {"userId": 1, "id": 1},
+    "app_registry": {"userId": 1, "packageName": 1},
+    "monitored_apps": {"userId": 1},
+    "usage_sessions": {"userId": 1, "timestamp": 1},
+    "user_settings": {"userId": 1},
+    "sync_log": {"_id": 1},
+}
+
+_READ_PREFERENCE_CLASSES = {
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def read_preference(mode: str, max_staleness_seconds: int = -1):
+    """Build a PyMongo read preference; -1 leaves staleness unbounded (the server minimum is 90s)"""
+    if mode == "primary":
+        return Primary()
+    try:
+        return _READ_PREFERENCE_CLASSES[mode](max_staleness=max_staleness_seconds)
+    except KeyError:
+        raise ValueError(f"Unknown read preference: {mode}")
+
+
+class MongoChallenges(ChallengeRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, challenge: Dict[str, Any]):
+        await self.collection.insert_one(challenge)
+
+    async def get(self, user_id: str, challenge_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"userId": user_id, "id": challenge_id}, {"_id": 0})
+
+    async def set_result(self, user_id: str, challenge_id: str, correct: bool):
+        await self.collection.update_one(
+            {"userId": user_id, "id": challenge_id},
+            {"$set": {"completed": True, "correct": correct}}
+        )
+
+    async def list(self, user_id: str, projection: Dict[str, int], limit: int = 1000) -> List[Dict[str, Any]]:
+        return await self.collection.find({"userId": user_id}, projection).to_list(limit)
+
+
+class MongoAppRegistry(AppRegistryRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def upsert(self, app: Dict[str, Any]) -> bool:
+        result = await self.collection.update_one(
+            {"userId": app["userId"], "packageName": app["packageName"]},
+            {"$set": app},
+            upsert=True
+        )
+        return result.upserted_id is not None
+
+    async def list(self, user_id: str, projection: Dict[str, int], limit: int = 1000) -> List[Dict[str, Any]]:
+        return await self.collection.find({"userId": user_id}, projection).to_list(limit)
+
+    async def search(
+        self, user_id: str, query: Optional[str], category: Optional[str], projection: Dict[str, int], limit: int
+    ) -> List[Dict[str, Any]]:
+        search_filter = {"userId": user_id}
+        if query:
+            pattern = re.escape(query)
+            search_filter["$or"] = [
+                {"appName": {"$regex": pattern, "$options": "i"}},
+                {"displayName": {"$regex": pattern, "$options": "i"}},
+                {"packageName": {"$regex": pattern, "$options": "i"}}
+            ]
+        if category:
+            search_filter["category"] = category
+        return await self.collection.find(search_filter, projection).limit(limit).to_list(limit)
+
+    async def category_counts(self, user_id: str) -> Dict[str, int]:
+        groups = await self.collection.aggregate([
+            {"$match": {"userId": user_id}},
+            {"$group": {"_id": "$category", "count": {"$sum": 1}}}
+        ]).to_list(None)
+        return {group["_id"]: group["count"] for group in groups}
+
+
+class MongoMonitoredApps(MonitoredAppRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, app: Dict[str, Any]):
+        # Duplicates are rejected by the unique partial index on active apps
+        try:
+            await self.collection.insert_one(dict(app))
+        except DuplicateKeyError:
+            raise DuplicateAppError(app["packageName"])
+
+    async def bulk_write(self, user_id: str, operations: List[MonitoredAppOp], now: datetime) -> BulkResult:
+        ids = [operation[1] for operation in operations if operation[0] != "add"]
+        found = {}
+        if ids:
+            docs = await self.collection.find(
+                {"userId": user_id, "id": {"$in": ids}}, {"_id": 0, "id": 1, "isActive": 1}
+            ).to_list(None)
+            found = {doc["id"]: bool(doc.get("isActive")) for doc in docs}
+        unmatched = unmatched_operations(operations, found)
+
+        # Position in `operations` of each request, so errors refer to the caller's list
+        positions, requests = [], []
+        for index, operation in enumerate(operations):
+            if index in unmatched:
+                continue
+            positions.append(index)
+            if operation[0] == "add":
+                requests.append(InsertOne(dict(operation[1])))
+            elif operation[0] == "update_limit":
+                _, app_id, daily_limit = operation
+                # Pipeline update so isBlocked is recomputed against the stored timeUsed
+                requests.append(UpdateOne(
+                    {"id": app_id, "userId": user_id, "isActive": True},
+                    [{"$set": {
+                        "dailyLimit": daily_limit,
+                        "isBlocked": {"$gte": ["$timeUsed", daily_limit]},
+                        "updatedAt": now
+                    }}]
+                ))
+            else:
+                requests.append(UpdateOne(
+                    {"id": operation[1], "userId": user_id},
+                    {"$set": {"isActive": False, "updatedAt": now}}
+                ))
+
+        if not requests:
+            return BulkResult(unmatched=unmatched)
+        try:
+            result = await self.collection.bulk_write(requests, ordered=False)
+            return BulkResult(inserted=result.inserted_count, modified=result.modified_count, unmatched=unmatched)
+        except BulkWriteError as bwe:
+            return BulkResult(
+                inserted=bwe.details.get("nInserted", 0),
+                modified=bwe.details.get("nModified", 0),
+                unmatched=unmatched,
+                errors=[
+                    {
+                        "index": positions[err["index"]],
+                        "duplicate": err.get("code") == 11000,
+                        "errmsg": err.get("errmsg", "Write failed"),
+                    }
+                    for err in bwe.details.get("writeErrors", [])
+                ]
+            )
+
+    async def get(self, user_id: str, app_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"userId": user_id, "id": app_id}, {"_id": 0})
+
+    async def find_active(self, user_id: str, package_name: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one(
+            {"packageName": package_name, "userId": user_id, "isActive": True},
+            {"_id": 0}
+        )
+
+    async def list_active(self, user_id: str, projection: Dict[str, int], limit: int = 100) -> List[Dict[str, Any]]:
+        return await self.collection.find({"userId": user_id, "isActive": True}, projection).to_list(limit)
+
+    async def blocked_packages(self, user_id: str) -> List[str]:
+        blocked = await self.collection.find(
+            {"userId": user_id, "isActive": True, "isBlocked": True},
+            {"_id": 0, "packageName": 1}
+        ).to_list(100)
+        return [app["packageName"] for app in blocked]
+
+    async def set_usage(self, user_id: str, app_id: str, time_used: int, is_blocked: bool, now: datetime):
+        await self.collection.update_one(
+            {"userId": user_id, "id": app_id},
+            {"$set": {"timeUsed": time_used, "isBlocked": is_blocked, "updatedAt": now}}
+        )
+
+    async def set_package_usage(
+        self, user_id: str, package_name: str, time_used: int, is_blocked: bool, now: datetime, local_date: str
+    ):
+        await self.collection.update_one(
+            {"packageName": package_name, "userId": user_id, "isActive": True},
+            {"$set": {"timeUsed": time_used, "isBlocked": is_blocked, "lastResetDate": local_date, "updatedAt": now}}
+        )
+
+    async def add_usage(self, durations: Dict[AppKey, int], now: datetime):
+        await self.collection.bulk_write(
+            [
+                UpdateOne(
+                    {"userId": user_id, "packageName": package_name, "isActive": True},
+                    [
+                        {"$set": {"_today": local_date_expression(now, "$timezone")}},
+                        # The first minutes of a new local day land before the scheduler's reset
+                        {"$set": {
+                            "timeUsed": {"$cond": [
+                                {"$lt": [{"$ifNull": ["$lastResetDate", ""]}, "$_today"]},
+                                duration,
+                                {"$add": [{"$ifNull": ["$timeUsed", 0]}, duration]},
+                            ]},
+                            "lastResetDate": {"$max": [{"$ifNull": ["$lastResetDate", ""]}, "$_today"]},
+                        }},
+                        {"$set": {
+                            "isBlocked": {"$gte": ["$timeUsed", {"$ifNull": ["$dailyLimit", 60]}]},
+                            "updatedAt": now,
+                        }},
+                        {"$project": {"_today": 0}},
+                    ],
+                )
+                for (user_id, package_name), duration in durations.items()
+            ],
+            ordered=False,
+        )
+
+    async def find_by_keys(self, keys: Iterable[AppKey], projection: Dict[str, int]) -> List[Dict[str, Any]]:
+        keys = list(keys)
+        if not keys:
+            return []
+        return await self.collection.find(
+            {"$or": [{"userId": u, "packageName": p, "isActive": True} for u, p in keys]},
+            projection,
+        ).to_list(len(keys))
+
+    async def deactivate(self, user_id: str, app_id: str, now: datetime) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one_and_update(
+            {"userId": user_id, "id": app_id},
+            {"$set": {"isActive": False, "updatedAt": now}},
+            projection={"_id": 0, "userId": 1, "packageName": 1}
+        )
+
+    async def set_timezone(self, user_id: str, timezone_name: str, now: datetime):
+        await self.collection.update_many(
+            {"userId": user_id},
+            {"$set": {"timezone": timezone_name, "updatedAt": now}}
+        )
+
+    async def active_timezones(self) -> List[str]:
+        zones = await self.collection.aggregate([
+            {"$match": {"isActive": True}},
+            {"$group": {"_id": {"$ifNull": ["$timezone", DEFAULT_TIMEZONE]}}},
+        ]).to_list(None)
+        return [zone["_id"] for zone in zones]
+
+    async def reset_zone(self, timezone_name: str, local_date: str, now: datetime) -> int:
+        result = await self.collection.update_many(
+            {
+                "timezone": zone_filter(timezone_name),
+                "isActive": True,
+                "lastResetDate": {"$not": {"$gte": local_date}},
+            },
+            {
+                "$set": {
+                    "timeUsed": 0,
+                    "isBlocked": False,
+                    "lastResetDate": local_date,
+                    "updatedAt": now,
+                }
+            },
+        )
+        return result.modified_count
+
+
+class MongoUsageSessions(UsageSessionRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, session: Dict[str, Any]):
+        await self.collection.insert_one(dict(session))
+
+    async def insert_many(self, sessions: List[Dict[str, Any]]):
+        # insert_many adds _id to the dicts it is given
+        await self.collection.insert_many([dict(s) for s in sessions], ordered=False)
+
+    async def unsaved(self, sessions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not sessions:
+            return []
+        # Each branch is served by the (userId, timestamp) index
+        saved = {
+            doc["id"]
+            async for doc in self.collection.find(
+                {"$or": [{"userId": s["userId"], "timestamp": s["timestamp"], "id": s["id"]} for s in sessions]},
+                {"_id": 0, "id": 1}
+            )
+        }
+        return [s for s in sessions if s["id"] not in saved]
+
+    async def list_for_app(
+        self, user_id: str, package_name: str, start: datetime, end: datetime,
+        projection: Optional[Dict[str, int]] = None, limit: int = 1000
+    ) -> List[Dict[str, Any]]:
+        return await self.collection.find({
+            "packageName": package_name,
+            "userId": user_id,
+            "timestamp": {"$gte": start, "$lt": end}
+        }, projection or {"_id": 0}).to_list(limit)
+
+    async def list_since(self, user_id: str, start: datetime, projection: Dict[str, int], limit: int = 1000) -> List[Dict[str, Any]]:
+        return await self.collection.find({"userId": user_id, "timestamp": {"$gte": start}}, projection).to_list(limit)
+
+    async def usage_by_hour(self, user_id: str, start: datetime, end: datetime, timezone_name: str) -> List[Dict[str, Any]]:
+        local = {"date": "$timestamp", "timezone": timezone_name}
+        # At most 7 x 24 groups, whatever the history length
+        return await self.collection.aggregate([
+            {"$match": {"userId": user_id, "timestamp": {"$gte": start, "$lt": end}}},
+            {"$project": {"duration": 1, "parts": {"$dateToParts": local}, "weekday": {"$isoDayOfWeek": local}}},
+            {"$group": {
+                "_id": {"weekday": "$weekday", "hour": "$parts.hour"},
+                "minutes": {"$sum": "$duration"},
+                "sessions": {"$sum": 1},
+            }},
+            {"$project": {"_id": 0, "weekday": "$_id.weekday", "hour": "$_id.hour", "minutes": 1, "sessions": 1}},
+        ]).to_list(None)
+
+    async def usage_by_day(self, user_id: str, start: datetime, end: datetime, timezone_name: str) -> List[Dict[str, Any]]:
+        groups = await self.collection.aggregate([
+            {"$match": {"userId": user_id, "timestamp": {"$gte": start, "$lt": end}}},
+            {"$project": {
+                "duration": 1, "packageName": 1, "appName": 1,
+                "parts": {"$dateToParts": {"date": "$timestamp", "timezone": timezone_name}},
+            }},
+            {"$group": {
+                "_id": {"year": "$parts.year", "month": "$parts.month", "day": "$parts.day", "packageName": "$packageName"},
+                "appName": {"$last": "$appName"},
+                "minutes": {"$sum": "$duration"},
+            }},
+        ]).to_list(None)
+        return [
+            {
+                "date": f"{g['_id']['year']:04d}-{g['_id']['month']:02d}-{g['_id']['day']:02d}",
+                "packageName": g["_id"]["packageName"],
+                "appName": g["appName"],
+                "minutes": g["minutes"],
+            }
+            for g in groups
+        ]
+
+
+class MongoUserSettings(UserSettingsRepository):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"userId": user_id}, {"_id": 0})
+
+    async def upsert(self, settings: Dict[str, Any]):
+        await self.collection.update_one(
+            {"userId": settings["userId"]},
+            {"$set": settings},
+            upsert=True
+        )
+
+
+class MongoChangeLog(ChangeLogRepository):
+    def __init__(self, collection):
+        # One document per user: {_id: userId, seq, changes: [{seq, kind, key}, ...]}
+        self.collection = collection
+
+    async def append(self, user_id: str, changes: List[Change]) -> int:
+        # Pipeline upsert: numbering and trimming happen atomically in one round trip
+        count = len(changes)
+        entries = [
+            {"seq": {"$add": ["$seq", index - count + 1]}, "kind": {"$literal": kind}, "key": {"$literal": key}}
+            for index, (kind, key) in enumerate(changes)
+        ]
+        log = await self.collection.find_one_and_update(
+            {"_id": user_id},
+            [
+                {"$set": {"seq": {"$add": [{"$ifNull": ["$seq", 0]}, count]}}},
+                {"$set": {"changes": {"$slice": [
+                    {"$concatArrays": [{"$ifNull": ["$changes", []]}, entries]}, -CHANGE_LOG_SIZE
+                ]}}},
+            ],
+            projection={"seq": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return log["seq"]
+
+    async def since(self, user_id: str, after: int) -> ChangeSet:
+        log = await self.collection.find_one({"_id": user_id}) or {}
+        return change_set(log.get("seq", 0), log.get("changes", []), after)
+
+
+class MongoStorage(Storage):
+    name = "mongo"
+    SCHEMAS = ("legacy", "dual", "compact")
+
+    def __init__(self, mongo_url: str, db_name: str, event_listeners=None, write_concern=None,
+                 schema: str = "legacy", **client_options):
+        if schema not in self.SCHEMAS:
+            raise ValueError(f"Unknown Mongo schema {schema!r}, expected one of {', '.join(self.SCHEMAS)}")
+        self.client = AsyncIOMotorClient(mongo_url, event_listeners=event_listeners or [], **client_options)
+        self.db = self.client[db_name]
+        self.schema = schema
+        # Package references are always read and allocated on the primary
+        self.refs = AppRefs(self.db.app_refs, self.db.counters)
+        self._bind(self.db if write_concern is None else self.db.with_options(write_concern=write_concern))
+
+    def _bind(self, db):
+        self.challenges = MongoChallenges(db.challenges)
+        self.app_registry = MongoAppRegistry(db.app_registry)
+        self.user_settings = MongoUserSettings(db.user_settings)
+        self.sync_log = MongoChangeLog(db.sync_log)
+        if self.schema == "compact":
+            self.monitored_apps = CompactMonitoredApps(db.monitored_apps_v2, self.refs)
+            self.usage_sessions = CompactUsageSessions(db.usage_sessions_v2, self.refs)
+        elif self.schema == "dual":
+            self.monitored_apps = DualWriteMonitoredApps(
+                MongoMonitoredApps(db.monitored_apps), CompactMonitoredApps(db.monitored_apps_v2, self.refs)
+            )
+            self.usage_sessions = DualWriteUsageSessions(
+                MongoUsageSessions(db.usage_sessions), CompactUsageSessions(db.usage_sessions_v2, self.refs)
+            )
+        else:
+            self.monitored_apps = MongoMonitoredApps(db.monitored_apps)
+            self.usage_sessions = MongoUsageSessions(db.usage_sessions)
+
+    def _clone(self, **options) -> "MongoStorage":
+        clone = object.__new__(MongoStorage)
+        clone.client = self.client
+        clone.db = self.db
+        clone.schema = self.schema
+        clone.refs = self.refs
+        clone._bind(self.db.with_options(**options))
+        return clone
+
+    def with_write_concern(self, write_concern) -> "MongoStorage":
+        return self._clone(write_concern=write_concern)
+
+    def with_read_preference(self, mode: str, max_staleness_seconds: int = -1) -> "MongoStorage":
+        return self._clone(read_preference=read_preference(mode, max_staleness_seconds))
+
+    async def start(self, timeout: float) -> bool:
+        # Open the first pooled connection during startup rather than on the first request
+        try:
+            await asyncio.wait_for(self.client.admin.command("ping"), timeout=timeout)
+        except Exception as e:
+            logger.error(f"MongoDB warm-up failed: {e}")
+            return False
+
+        await self.ensure_indexes()
+        return True
+
+    async def ensure_indexes(self):
+        indexes_by_collection = dict(INDEXES)
+        if self.schema != "legacy":
+            indexes_by_collection.update(COMPACT_INDEXES)
+        for name, indexes in indexes_by_collection.items():
+            try:
+                await self.db[name].create_indexes(indexes)
+            except Exception as e:
+                # Duplicate entries are rejected only by the unique indexes, so do not serve without them
+                if any(index.document.get("unique") for index in indexes):
+                    raise RuntimeError(
+                        f"Failed to create unique {name} indexes ({e}); remove duplicate documents and restart"
+                    ) from e
+                logger.error(f"Failed to create {name} indexes: {e}")
+
+    async def close(self):
+        self.client.close()
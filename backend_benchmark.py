@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite for Brain Rot Reduction Backend
+Runs the FastAPI app in-process (no uvicorn, no network) against a local
+MongoDB or the in-memory storage backend, with the LLM replaced by a stub of fixed
+latency. Workers drive a weighted mix of ingest, polling, analytics and
+registry traffic and the run reports p50/p95/p99 and throughput per endpoint.
+
+Results can be saved as a baseline and later runs compared against it; any
+endpoint whose p95 or throughput regresses beyond the tolerance fails the run.
+Baselines depend on the machine, so none is committed: record one locally
+from the reference commit first. Comparing without a baseline exits with 2.
+
+Requires httpx.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+DEFAULT_BASELINE = Path(__file__).parent / "backend_benchmark_baseline.json"
+
+# Relative request weights; override with --mix ingest=60,realtime=20,...
+DEFAULT_MIX = {
+    "ingest": 40,
+    "realtime": 20,
+    "blocked": 15,
+    "monitored": 10,
+    "analytics": 5,
+    "registry": 5,
+    "search": 4,
+    "challenge": 1,
+}
+
+CATEGORIES = ["social", "entertainment", "games", "productivity", "news", "shopping"]
+
+
+class StubUserMessage:
+    def __init__(self, text: str):
+        self.text = text
+
+
+def stub_llm(latency: float):
+    """LlmChat stand-in that answers after a fixed delay with a valid challenge"""
+
+    class StubLlmChat:
+        def __init__(self, **kwargs):
+            pass
+
+        def with_model(self, provider: str, model: str):
+            return self
+
+        async def send_message(self, message: StubUserMessage) -> str:
+            await asyncio.sleep(latency)
+            a, b = random.randint(2, 99), random.randint(2, 99)
+            return json.dumps({"question": f"{a} + {b} = ?", "answer": a + b, "timeReward": 8})
+
+    return lambda: (StubLlmChat, StubUserMessage)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values), max(1, math.ceil(pct / 100 * len(sorted_values)))) - 1
+    return sorted_values[rank]
+
+
+def parse_mix(value: Optional[str]) -> Dict[str, int]:
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"❌ Unknown scenario in --mix: {name} (known: {', '.join(DEFAULT_MIX)})")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+class Workload:
+    """Seeded fleet state shared by the workers, plus one coroutine per scenario"""
+
+    def __init__(self, client, users: int, apps: int, apps_per_user: int, seed: int):
+        self.client = client
+        self.rng = random.Random(seed)
+        self.user_ids = [f"bench-user-{i}" for i in range(users)]
+        self.packages = [f"com.bench.app{i}" for i in range(apps)]
+        self.apps_per_user = apps_per_user
+        self.monitored: Dict[str, List[Dict[str, Any]]] = {}
+        # Polling clients keep the last ETag they saw, like the mobile app does
+        self.etags: Dict[tuple, str] = {}
+
+    async def seed(self):
+        for user_id in self.user_ids:
+            chosen = self.rng.sample(range(len(self.packages)), min(self.apps_per_user, len(self.packages)))
+            # Each user's registry holds the apps found on their device
+            registry = [
+                {
+                    "userId": user_id,
+                    "packageName": self.packages[i],
+                    "appName": f"Bench App {i}",
+                    "displayName": f"Bench App {i}",
+                    "category": CATEGORIES[i % len(CATEGORIES)],
+                }
+                for i in chosen
+            ]
+            response = await self.client.post("/api/apps/bulk-register", json=registry)
+            response.raise_for_status()
+
+            chosen = [self.packages[i] for i in chosen]
+            operations = [
+                {"op": "add", "app": {
+                    "userId": user_id,
+                    "packageName": package,
+                    "appName": package.rsplit(".", 1)[-1],
+                    "displayName": package.rsplit(".", 1)[-1],
+                    "dailyLimit": self.rng.choice([30, 60, 90, 120]),
+                }}
+                for package in chosen
+            ]
+            response = await self.client.post(
+                "/api/apps/monitored/bulk", json={"userId": user_id, "operations": operations}
+            )
+            response.raise_for_status()
+            response = await self.client.get(
+                "/api/apps/monitored", params={"user_id": user_id, "fields": "id,packageName,appName"},
+                headers={"X-Device-Id": user_id}
+            )
+            response.raise_for_status()
+            self.monitored[user_id] = response.json()
+
+    async def conditional_get(self, key: tuple, url: str, params: Dict[str, Any]):
+        # One device per simulated user, so a polling cap applies per user as it would in the field
+        headers = {"X-Device-Id": params["user_id"]}
+        if key in self.etags:
+            headers["If-None-Match"] = self.etags[key]
+        response = await self.client.get(url, params=params, headers=headers)
+        if "etag" in response.headers:
+            self.etags[key] = response.headers["etag"]
+        return response
+
+    async def ingest(self):
+        user_id = self.rng.choice(self.user_ids)
+        app = self.rng.choice(self.monitored[user_id])
+        return await self.client.post("/api/usage/session", json={
+            "userId": user_id,
+            "appId": app["id"],
+            "packageName": app["packageName"],
+            "appName": app["appName"],
+            "duration": self.rng.randint(1, 15),
+            "date": datetime.utcnow().date().isoformat(),
+        })
+
+    async def realtime(self):
+        user_id = self.rng.choice(self.user_ids)
+        return await self.conditional_get(("realtime", user_id), "/api/usage/realtime", {"user_id": user_id})
+
+    async def blocked(self):
+        user_id = self.rng.choice(self.user_ids)
+        return await self.conditional_get(("blocked", user_id), "/api/apps/blocked", {"user_id": user_id})
+
+    async def monitored_apps(self):
+        user_id = self.rng.choice(self.user_ids)
+        return await self.conditional_get(("monitored", user_id), "/api/apps/monitored", {"user_id": user_id})
+
+    async def analytics(self):
+        return await self.client.get("/api/analytics", params={"user_id": self.rng.choice(self.user_ids)})
+
+    async def registry(self):
+        return await self.client.get("/api/apps/registry", params={"user_id": self.rng.choice(self.user_ids)})
+
+    async def search(self):
+        return await self.client.get("/api/apps/search", params={
+            "user_id": self.rng.choice(self.user_ids),
+            "query": f"app{self.rng.randint(0, 99)}",
+            "category": self.rng.choice(CATEGORIES),
+        })
+
+    async def challenge(self):
+        return await self.client.post("/api/challenges/generate", json={
+            "userId": self.rng.choice(self.user_ids), "difficulty": "auto"
+        })
+
+    def scenarios(self) -> Dict[str, Callable]:
+        return {
+            "ingest": self.ingest,
+            "realtime": self.realtime,
+            "blocked": self.blocked,
+            "monitored": self.monitored_apps,
+            "analytics": self.analytics,
+            "registry": self.registry,
+            "search": self.search,
+            "challenge": self.challenge,
+        }
+
+
+async def drive(workload: Workload, mix: Dict[str, int], concurrency: int, duration: float,
+                warmup: float) -> Dict[str, Dict[str, Any]]:
+    scenarios = workload.scenarios()
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    latencies: Dict[str, List[float]] = {n: [] for n in names}
+    errors: Dict[str, int] = {n: 0 for n in names}
+    shed: Dict[str, int] = {n: 0 for n in names}
+
+    loop = asyncio.get_running_loop()
+    measure_from = loop.time() + warmup
+    deadline = measure_from + duration
+
+    async def worker(worker_rng: random.Random):
+        while True:
+            now = loop.time()
+            if now >= deadline:
+                return
+            name = worker_rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await scenarios[name]()
+                status = response.status_code
+            except Exception:
+                status = None
+            elapsed = time.perf_counter() - started
+            if now < measure_from:
+                continue
+            if status in (429, 503):
+                shed[name] += 1
+            elif status is None or status >= 400:
+                errors[name] += 1
+            else:
+                latencies[name].append(elapsed)
+
+    await asyncio.gather(*(worker(random.Random(workload.rng.random())) for _ in range(concurrency)))
+
+    results = {}
+    for name in names:
+        values = sorted(latencies[name])
+        results[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "shed": shed[name],
+            "throughput": len(values) / duration,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+        }
+    return results
+
+
+def print_results(results: Dict[str, Dict[str, Any]]):
+    print(f"{'endpoint':<12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'shed':>8}")
+    for name, r in results.items():
+        print(
+            f"{name:<12}{r['throughput']:>10.1f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+            f"{r['p99_ms']:>10.2f}{r['errors']:>8}{r['shed']:>8}"
+        )
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> bool:
+    """Print one line per endpoint against the baseline; returns False on any regression"""
+    ok = True
+    for name, r in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"⚠️  {name}: not in baseline")
+            continue
+        problems = []
+        if r["errors"] > base.get("errors", 0):
+            problems.append(f"errors {base.get('errors', 0)} → {r['errors']}")
+        if base["p95_ms"] > 0 and r["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            problems.append(f"p95 {base['p95_ms']:.2f} → {r['p95_ms']:.2f} ms")
+        if base["throughput"] > 0 and r["throughput"] < base["throughput"] * (1 - tolerance):
+            problems.append(f"throughput {base['throughput']:.1f} → {r['throughput']:.1f} req/s")
+        if problems:
+            ok = False
+            print(f"❌ REGRESSION {name}: {'; '.join(problems)}")
+        else:
+            print(f"✅ PASS {name}: p95 {r['p95_ms']:.2f} ms (baseline {base['p95_ms']:.2f})")
+    return ok
+
+
+def prepare_environment(args) -> str:
+    """Point the app at the benchmark database before server.py is imported"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    db_name = f"benchmark_{uuid.uuid4().hex[:8]}"
+    os.environ["STORAGE_BACKEND"] = "memory" if args.in_memory else "mongo"
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = db_name
+    # Any non-empty key takes the LLM path; the client itself is stubbed below
+    os.environ["EMERGENT_LLM_KEY"] = "benchmark-stub"
+    os.environ.setdefault("READ_CACHE_TTL_SECONDS", "30")
+    # Simulated users poll far faster than real clients, so the cap is opt-in here too
+    os.environ["POLL_RATE_PER_SECOND"] = str(args.poll_rate)
+    # httpx logs every request at INFO, which would land inside the measured latencies
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    return db_name
+
+
+async def run(args) -> Dict[str, Dict[str, Any]]:
+    import httpx
+
+    db_name = prepare_environment(args)
+    import server
+
+    server.load_llm_client = stub_llm(args.llm_latency_ms / 1000)
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with server.lifespan(server.app):
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+                workload = Workload(client, args.users, args.apps, args.apps_per_user, args.seed)
+                print(f"🌱 Seeding {args.users} users × {args.apps_per_user} apps from a catalog of {args.apps}")
+                await workload.seed()
+                print(f"🏃 {args.concurrency} workers for {args.duration:.0f}s (+{args.warmup:.0f}s warm-up)")
+                return await drive(workload, args.mix, args.concurrency, args.duration, args.warmup)
+        finally:
+            if not args.in_memory:
+                await server.storage.client.drop_database(db_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--in-memory", action="store_true", help="use the in-memory storage backend instead of MongoDB")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before measuring")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--apps", type=int, default=300, help="registry size")
+    parser.add_argument("--apps-per-user", type=int, default=8)
+    parser.add_argument("--mix", type=parse_mix, default=None, help="e.g. ingest=60,realtime=30,analytics=10")
+    parser.add_argument("--llm-latency-ms", type=float, default=400.0)
+    parser.add_argument("--poll-rate", type=float, default=0.0,
+                        help="per-device polling cap in requests/s (POLL_RATE_PER_SECOND, 0 = off)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95/throughput regression (0.25 = 25%%)")
+    parser.add_argument("--json", type=Path, help="also write raw results to this file")
+    args = parser.parse_args()
+    args.mix = args.mix or dict(DEFAULT_MIX)
+
+    print("📊 Backend Benchmark")
+    print("=" * 40)
+
+    results = asyncio.run(run(args))
+    print()
+    print_results(results)
+
+    config = {
+        "mode": "in-memory" if args.in_memory else "mongodb",
+        "concurrency": args.concurrency,
+        "users": args.users,
+        "pollRate": args.poll_rate,
+        "mix": args.mix,
+    }
+    document = {"createdAt": datetime.utcnow().isoformat(), "config": config, "results": results}
+    if args.json:
+        args.json.write_text(json.dumps(document, indent=2))
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(document, indent=2))
+        print(f"\n💾 Baseline saved to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        # Baselines are per machine and not committed, so nothing was compared
+        print(f"\n❌ No baseline at {args.baseline}; nothing to compare against.")
+        print("   Record one on this machine from the reference commit with --save-baseline (see README)")
+        sys.exit(2)
+
+    baseline = json.loads(args.baseline.read_text())
+    print()
+    if baseline.get("config") != config:
+        print(f"⚠️  Baseline was recorded with {baseline.get('config')}; comparisons may not be meaningful")
+    if not compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
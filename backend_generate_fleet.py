@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Synthetic Fleet Generator for Brain Rot Reduction Backend
+Fills a MongoDB database with production-shaped data for scale testing:
+app_registry (AppInfo), monitored_apps (MonitoredApp), usage_sessions
+(UsageSession) and challenges (Challenge), every document keyed by userId.
+
+Distributions:
+- app popularity over a shared catalog is Zipf-like, so a few apps are
+  monitored by most users; each user's registry holds the apps they monitor
+- apps per user and challenges per user are negative binomial (over-dispersed)
+- sessions follow a diurnal curve in each user's local timezone
+- session durations are log-normal, giving a heavy tail of long sessions
+
+All sampling is vectorized with NumPy and seeded, so the same arguments always
+produce the same documents. Documents are written with insert_many batches
+from a thread pool.
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+
+CATEGORIES = np.array(["social", "entertainment", "games", "productivity", "news", "shopping", "communication"])
+CATEGORY_WEIGHTS = np.array([0.25, 0.2, 0.2, 0.1, 0.08, 0.07, 0.1])
+
+# Relative session starts per local hour, quiet overnight and peaking in the evening
+DIURNAL = np.array([
+    1.0, 0.6, 0.4, 0.3, 0.3, 0.5, 1.2, 2.5, 3.0, 2.6, 2.4, 2.6,
+    3.2, 3.0, 2.6, 2.6, 2.9, 3.4, 4.0, 4.6, 5.0, 4.8, 3.6, 2.0,
+])
+
+# (IANA name, UTC offset in hours, share of users); offsets ignore DST, which is fine for load shaping
+TIMEZONES = [
+    ("America/Los_Angeles", -8, 0.12), ("America/New_York", -5, 0.2), ("America/Sao_Paulo", -3, 0.08),
+    ("Europe/London", 0, 0.12), ("Europe/Berlin", 1, 0.12), ("Asia/Kolkata", 5.5, 0.18),
+    ("Asia/Tokyo", 9, 0.1), ("Australia/Sydney", 10, 0.08),
+]
+
+SESSION_TYPES = np.array(["active", "foreground", "background"])
+SESSION_TYPE_WEIGHTS = np.array([0.8, 0.15, 0.05])
+
+DAILY_LIMITS = np.array([15, 30, 45, 60, 90, 120])
+DIFFICULTIES = np.array(["easy", "medium", "hard"])
+DIFFICULTY_REWARDS = np.array([6, 9, 13])
+
+
+def uuids(rng: np.random.Generator, n: int) -> List[str]:
+    """Seeded version-4 UUID strings (uuid.uuid4 reads os.urandom and cannot be seeded)"""
+    raw = rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+    return [str(uuid.UUID(bytes=row.tobytes(), version=4)) for row in raw]
+
+
+def negative_binomial(rng: np.random.Generator, mean: float, dispersion: float, size: int) -> np.ndarray:
+    p = dispersion / (dispersion + mean)
+    return rng.negative_binomial(dispersion, p, size=size)
+
+
+def generate_registry(rng: np.random.Generator, apps: int, now: datetime) -> Dict[str, Any]:
+    categories = rng.choice(CATEGORIES, size=apps, p=CATEGORY_WEIGHTS).tolist()
+    system = rng.random(apps) < 0.1
+    install_days = rng.integers(0, 720, size=apps)
+    versions = rng.integers(1, 30, size=(apps, 2))
+    ids = uuids(rng, apps)
+    packages = [f"com.fleet.{c}.app{i}" for i, c in enumerate(categories)]
+    names = [f"{c.title()} App {i}" for i, c in enumerate(categories)]
+
+    documents = [
+        {
+            "id": ids[i],
+            "packageName": packages[i],
+            "appName": names[i],
+            "displayName": names[i],
+            "category": categories[i],
+            "icon": None,
+            "isSystemApp": bool(system[i]),
+            "version": f"{versions[i, 0]}.{versions[i, 1]}",
+            "installDate": now - timedelta(days=int(install_days[i])),
+            "lastUsed": None,
+        }
+        for i in range(apps)
+    ]
+    return {"documents": documents, "packages": packages, "names": names, "categories": categories}
+
+
+class FleetGenerator:
+    def __init__(self, args):
+        self.args = args
+        self.rng = np.random.default_rng(args.seed)
+        self.now = datetime.utcnow().replace(microsecond=0)
+
+        # Zipf-like app popularity over the registry
+        ranks = np.arange(1, args.apps + 1)
+        weights = 1.0 / ranks ** args.zipf
+        self.app_log_popularity = np.log(weights / weights.sum())
+        self.registry = generate_registry(self.rng, args.apps, self.now)
+
+        tz_weights = np.array([w for _, _, w in TIMEZONES])
+        self.tz_weights = tz_weights / tz_weights.sum()
+        self.diurnal = DIURNAL / DIURNAL.sum()
+
+    def user_chunk(self, start: int, count: int) -> Dict[str, List[Dict[str, Any]]]:
+        """Registry entries, monitored apps, sessions and challenges for users [start, start + count)"""
+        rng = self.rng
+        args = self.args
+        user_ids = np.array([f"user-{i:08d}" for i in range(start, start + count)])
+        tz_index = rng.choice(len(TIMEZONES), size=count, p=self.tz_weights)
+        tz_offsets = np.array([TIMEZONES[t][1] for t in tz_index])
+
+        # Apps per user, then k distinct apps per user by popularity (Gumbel top-k, no Python loop)
+        per_user = np.clip(negative_binomial(rng, args.apps_per_user, 2.0, count), 1, min(40, args.apps))
+        max_k = int(per_user.max())
+        keys = self.app_log_popularity + rng.gumbel(size=(count, args.apps))
+        top = np.argpartition(-keys, max_k - 1, axis=1)[:, :max_k]
+        mask = np.arange(max_k) < per_user[:, None]
+        owner = np.repeat(np.arange(count), per_user)
+        app_index = top[mask]
+        pairs = len(owner)
+
+        limits = rng.choice(DAILY_LIMITS, size=pairs)
+        monitored_ids = uuids(rng, pairs)
+        registry_ids = uuids(rng, pairs)
+
+        # Sessions per (user, app) over the window: heavier for popular apps
+        popularity = np.exp(self.app_log_popularity[app_index])
+        rate = args.sessions_per_day * args.days * popularity / popularity.mean() / args.apps_per_user
+        sessions_per_pair = rng.poisson(np.maximum(rate, 0.05))
+        session_pair = np.repeat(np.arange(pairs), sessions_per_pair)
+        n_sessions = len(session_pair)
+
+        day_offset = rng.integers(0, args.days, size=n_sessions)
+        local_hour = rng.choice(24, size=n_sessions, p=self.diurnal)
+        seconds = rng.integers(0, 3600, size=n_sessions)
+        durations = np.clip(np.rint(rng.lognormal(np.log(4), 1.0, size=n_sessions)), 1, 240).astype(int)
+        session_types = rng.choice(SESSION_TYPES, size=n_sessions, p=SESSION_TYPE_WEIGHTS)
+        session_ids = uuids(rng, n_sessions)
+
+        # Each zone's own calendar day: east of UTC it may already be tomorrow, west still yesterday
+        utc_offsets = (tz_offsets * 3600).astype("timedelta64[s]")
+        local_now = np.datetime64(self.now, "s") + utc_offsets
+        local_today = local_now.astype("datetime64[D]")
+
+        session_owner = owner[session_pair]
+        local_days = local_today[session_owner] - day_offset.astype("timedelta64[D]")
+        local_start = (
+            local_days.astype("datetime64[s]")
+            + (local_hour * 3600 + seconds).astype("timedelta64[s]")
+        )
+        # Today's sessions drawn after the current local time move to a random earlier point today
+        elapsed_today = (local_now - local_today.astype("datetime64[s]")).astype(np.int64)[session_owner]
+        earlier = (rng.random(n_sessions) * elapsed_today).astype(np.int64)
+        local_start = np.where(
+            local_start > local_now[session_owner],
+            local_days.astype("datetime64[s]") + earlier.astype("timedelta64[s]"),
+            local_start,
+        )
+        utc_start = local_start - utc_offsets[session_owner]
+
+        # Today's local usage drives timeUsed / isBlocked on the monitored entry
+        used_today = np.bincount(session_pair[day_offset == 0], weights=durations[day_offset == 0], minlength=pairs)
+        used_today = used_today.astype(int)
+
+        # Plain Python values for BSON encoding
+        packages = self.registry["packages"]
+        names = self.registry["names"]
+        categories = self.registry["categories"]
+        user_ids = user_ids.tolist()
+        reset_dates = local_today.astype(str).tolist()
+
+        # Each user's registry lists the catalog apps found on their device
+        catalog = self.registry["documents"]
+        registry = [
+            {**catalog[app_index[i]], "id": registry_ids[i], "userId": user_ids[owner[i]]}
+            for i in range(pairs)
+        ]
+
+        monitored = [
+            {
+                "id": monitored_ids[i],
+                "userId": user_ids[owner[i]],
+                "packageName": packages[app_index[i]],
+                "appName": names[app_index[i]],
+                "displayName": names[app_index[i]],
+                "icon": None,
+                "dailyLimit": int(limits[i]),
+                "timeUsed": int(used_today[i]),
+                "isBlocked": bool(used_today[i] >= limits[i]),
+                "isActive": True,
+                "category": categories[app_index[i]],
+                "createdAt": self.now - timedelta(days=args.days),
+                "updatedAt": self.now,
+                "timezone": TIMEZONES[tz_index[owner[i]]][0],
+                "lastResetDate": reset_dates[owner[i]],
+            }
+            for i in range(pairs)
+        ]
+
+        local_dates = local_days.astype(str).tolist()
+        session_types = session_types.tolist()
+        utc_datetimes = utc_start.astype("datetime64[ms]").astype(datetime)
+        sessions = [
+            {
+                "id": session_ids[j],
+                "userId": user_ids[session_owner[j]],
+                "appId": monitored_ids[session_pair[j]],
+                "packageName": packages[app_index[session_pair[j]]],
+                "appName": names[app_index[session_pair[j]]],
+                "duration": int(durations[j]),
+                "timestamp": utc_datetimes[j],
+                "date": local_dates[j],
+                "sessionType": session_types[j],
+            }
+            for j in range(n_sessions)
+        ]
+
+        # Challenges: over-dispersed per user, harder ones answered correctly less often
+        per_user_challenges = negative_binomial(rng, args.challenges_per_user, 1.5, count)
+        n_challenges = int(per_user_challenges.sum())
+        difficulty = rng.choice(3, size=n_challenges, p=[0.35, 0.45, 0.2])
+        scale = np.array([10, 100, 1000])[difficulty]
+        a = rng.integers(1, scale)
+        b = rng.integers(1, scale)
+        completed = rng.random(n_challenges) < 0.7
+        correct = rng.random(n_challenges) < np.array([0.9, 0.75, 0.55])[difficulty]
+        challenge_ids = uuids(rng, n_challenges)
+        challenge_owner = np.repeat(np.arange(count), per_user_challenges)
+        challenges = [
+            {
+                "id": challenge_ids[k],
+                "userId": user_ids[challenge_owner[k]],
+                "question": f"{a[k]} + {b[k]} = ?",
+                "answer": int(a[k] + b[k]),
+                "difficulty": str(DIFFICULTIES[difficulty[k]]),
+                "timeReward": int(DIFFICULTY_REWARDS[difficulty[k]]),
+                "completed": bool(completed[k]),
+                "correct": bool(correct[k]) if completed[k] else None,
+            }
+            for k in range(n_challenges)
+        ]
+
+        return {
+            "app_registry": registry,
+            "monitored_apps": monitored,
+            "usage_sessions": sessions,
+            "challenges": challenges,
+        }
+
+
+class BatchWriter:
+    """insert_many batches on a thread pool, with a bounded number in flight"""
+
+    def __init__(self, db, workers: int, batch_size: int, dry_run: bool):
+        self.db = db
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.max_in_flight = workers * 2
+        self.pending = set()
+        self.written: Dict[str, int] = {}
+
+    def _insert(self, collection: str, documents: List[Dict[str, Any]]):
+        if not self.dry_run:
+            self.db[collection].insert_many(documents, ordered=False)
+        return collection, len(documents)
+
+    def _collect(self, done):
+        for future in done:
+            collection, count = future.result()
+            self.written[collection] = self.written.get(collection, 0) + count
+
+    def write(self, collection: str, documents: List[Dict[str, Any]]):
+        for i in range(0, len(documents), self.batch_size):
+            if len(self.pending) >= self.max_in_flight:
+                done, self.pending = wait(self.pending, return_when=FIRST_COMPLETED)
+                self._collect(done)
+            self.pending.add(self.executor.submit(self._insert, collection, documents[i:i + self.batch_size]))
+
+    def close(self):
+        self._collect(wait(self.pending).done)
+        self.pending = set()
+        self.executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--apps", type=int, default=2000, help="app catalog size")
+    parser.add_argument("--apps-per-user", type=float, default=8, help="mean monitored apps per user")
+    parser.add_argument("--days", type=int, default=30, help="days of session history")
+    parser.add_argument("--sessions-per-day", type=float, default=12, help="mean sessions per user per day")
+    parser.add_argument("--challenges-per-user", type=float, default=20)
+    parser.add_argument("--zipf", type=float, default=1.1, help="app popularity exponent")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-users", type=int, default=500, help="users generated per step")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4, help="parallel insert_many threads")
+    parser.add_argument("--mongo-url", default=None)
+    parser.add_argument("--db-name", default=None)
+    parser.add_argument("--drop", action="store_true", help="drop the target collections first")
+    parser.add_argument("--dry-run", action="store_true", help="generate without writing")
+    args = parser.parse_args()
+
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(BACKEND_DIR / ".env")
+    except ImportError:
+        pass
+    mongo_url = args.mongo_url or os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+    db_name = args.db_name or os.environ.get("DB_NAME")
+    if not db_name and not args.dry_run:
+        print("❌ Set --db-name or DB_NAME")
+        sys.exit(1)
+
+    print("🏭 Synthetic Fleet Generator")
+    print("=" * 40)
+
+    db = None
+    if not args.dry_run:
+        import pymongo
+        db = pymongo.MongoClient(mongo_url)[db_name]
+        if args.drop:
+            for name in ("app_registry", "monitored_apps", "usage_sessions", "challenges"):
+                db.drop_collection(name)
+            print(f"🗑️  Dropped existing collections in {db_name}")
+
+    started = time.perf_counter()
+    generator = FleetGenerator(args)
+    writer = BatchWriter(db, args.workers, args.batch_size, args.dry_run)
+
+    for start in range(0, args.users, args.chunk_users):
+        chunk = generator.user_chunk(start, min(args.chunk_users, args.users - start))
+        for collection, documents in chunk.items():
+            writer.write(collection, documents)
+        done = min(start + args.chunk_users, args.users)
+        print(f"   {done}/{args.users} users", end="\r", flush=True)
+
+    writer.close()
+    elapsed = time.perf_counter() - started
+    total = sum(writer.written.values())
+
+    print()
+    for collection, count in writer.written.items():
+        print(f"✅ {collection}: {count:,} documents")
+    verb = "Generated" if args.dry_run else "Wrote"
+    print(f"⏱️  {verb} {total:,} documents in {elapsed:.1f}s ({total / elapsed:,.0f} docs/s)")
+
+
+if __name__ == "__main__":
+    main()
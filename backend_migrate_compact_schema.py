@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Compact-Schema Migration for Brain Rot Reduction Backend
+Copies usage_sessions and monitored_apps into the compact usage_sessions_v2
+and monitored_apps_v2 collections described in backend/storage_compact.py,
+and reports storage and index sizes before and after.
+
+Roll-out:
+  1. run the API with MONGO_SCHEMA=dual, so new writes reach both layouts
+  2. run this script; it is idempotent and can be re-run after interruption
+  3. switch to MONGO_SCHEMA=compact
+  4. re-run with --drop-legacy once nothing reads the old collections
+
+Sessions are immutable, so already-copied ones are skipped. A monitored app
+is only overwritten when the legacy copy is newer (updatedAt), so the
+dual-written compact document wins over a stale one. Run
+backend_migrate_user_keys.py first if documents may lack a userId.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+
+COLLECTIONS = {"usage_sessions": "usage_sessions_v2", "monitored_apps": "monitored_apps_v2"}
+
+
+async def sizes(db, name: str) -> dict:
+    try:
+        return await db.command("collStats", name)
+    except Exception:
+        return {"count": await db[name].estimated_document_count(), "size": 0, "storageSize": 0, "totalIndexSize": 0}
+
+
+def describe(name: str, stats: dict) -> str:
+    mb = 1024 * 1024
+    return (
+        f"{name}: {stats.get('count', 0):,} docs, "
+        f"data {stats.get('size', 0) / mb:.1f} MB, "
+        f"storage {stats.get('storageSize', 0) / mb:.1f} MB, "
+        f"indexes {stats.get('totalIndexSize', 0) / mb:.1f} MB"
+    )
+
+
+async def copy_sessions(legacy, compact, codec, batch_size: int) -> int:
+    from pymongo.errors import BulkWriteError
+
+    copied = 0
+    last_id = None
+    while True:
+        query = {"userId": {"$exists": True}} if last_id is None else {"userId": {"$exists": True}, "_id": {"$gt": last_id}}
+        batch = await legacy.find(query).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            return copied
+        last_id = batch[-1]["_id"]
+        docs = [await codec.encode(session) for session in batch]
+        try:
+            result = await compact.insert_many(docs, ordered=False)
+            copied += len(result.inserted_ids)
+        except BulkWriteError as bwe:
+            # Sessions already dual-written or copied by an earlier run
+            real = [err for err in bwe.details.get("writeErrors", []) if err.get("code") != 11000]
+            if real:
+                print(f"⚠️  {len(real)} sessions failed to copy: {real[0].get('errmsg')}")
+            copied += bwe.details.get("nInserted", 0)
+
+
+async def copy_apps(legacy, compact, codec, batch_size: int) -> int:
+    from pymongo import ReplaceOne
+    from pymongo.errors import BulkWriteError
+
+    copied = 0
+    last_id = None
+    while True:
+        query = {"userId": {"$exists": True}} if last_id is None else {"userId": {"$exists": True}, "_id": {"$gt": last_id}}
+        batch = await legacy.find(query).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            return copied
+        last_id = batch[-1]["_id"]
+        requests = []
+        for app in batch:
+            doc = await codec.encode(app)
+            # Upsert unless the compact copy is at least as new; the insert half of
+            # the upsert then hits the existing _id and is reported as a duplicate
+            requests.append(ReplaceOne(
+                {"_id": doc["_id"], "$or": [{"ua": {"$lt": doc["ua"]}}, {"ua": None}]},
+                doc,
+                upsert=True
+            ))
+        try:
+            result = await compact.bulk_write(requests, ordered=False)
+            copied += result.upserted_count + result.modified_count
+        except BulkWriteError as bwe:
+            real = [err for err in bwe.details.get("writeErrors", []) if err.get("code") != 11000]
+            if real:
+                print(f"⚠️  {len(real)} apps failed to copy: {real[0].get('errmsg')}")
+            copied += bwe.details.get("nUpserted", 0) + bwe.details.get("nModified", 0)
+
+
+async def migrate(args, mongo_url: str, db_name: str):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from storage_compact import COMPACT_INDEXES, AppCodec, AppRefs, SessionCodec
+
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+    started = time.perf_counter()
+
+    for name in [*COLLECTIONS, *COLLECTIONS.values()]:
+        print(f"📦 {describe(name, await sizes(db, name))}")
+
+    if args.dry_run:
+        for legacy_name, compact_name in COLLECTIONS.items():
+            count = await db[legacy_name].count_documents({"userId": {"$exists": True}})
+            print(f"   would copy {count:,} documents from {legacy_name} to {compact_name}")
+        client.close()
+        return
+
+    if not args.skip_indexes:
+        for name, indexes in COMPACT_INDEXES.items():
+            await db[name].create_indexes(indexes)
+        print("✅ Compact indexes ready")
+
+    refs = AppRefs(db.app_refs, db.counters)
+    copied = await copy_sessions(db.usage_sessions, db.usage_sessions_v2, SessionCodec(refs), args.batch_size)
+    print(f"✅ usage_sessions: copied {copied:,} sessions")
+    copied = await copy_apps(db.monitored_apps, db.monitored_apps_v2, AppCodec(refs), args.batch_size)
+    print(f"✅ monitored_apps: copied {copied:,} apps")
+
+    for legacy_name, compact_name in COLLECTIONS.items():
+        legacy_stats = await sizes(db, legacy_name)
+        compact_stats = await sizes(db, compact_name)
+        print(f"📦 {describe(compact_name, compact_stats)}")
+        legacy_total = legacy_stats.get("size", 0) + legacy_stats.get("totalIndexSize", 0)
+        compact_total = compact_stats.get("size", 0) + compact_stats.get("totalIndexSize", 0)
+        if legacy_total and compact_stats.get("count", 0) >= legacy_stats.get("count", 0):
+            print(f"   {compact_total / legacy_total:.0%} of {legacy_name} (data + indexes)")
+
+        if args.drop_legacy:
+            remaining = await db[legacy_name].count_documents({})
+            if await db[compact_name].count_documents({}) < remaining:
+                print(f"❌ Not dropping {legacy_name}: {compact_name} has fewer documents")
+                continue
+            await db.drop_collection(legacy_name)
+            print(f"🗑️  Dropped {legacy_name}")
+
+    client.close()
+    print(f"⏱️  Done in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=None)
+    parser.add_argument("--db-name", default=None)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--skip-indexes", action="store_true", help="only copy")
+    parser.add_argument("--drop-legacy", action="store_true", help="drop the old collections once fully copied")
+    parser.add_argument("--dry-run", action="store_true", help="report sizes and counts without writing")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(BACKEND_DIR / ".env")
+    except ImportError:
+        pass
+    mongo_url = args.mongo_url or os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+    db_name = args.db_name or os.environ.get("DB_NAME")
+    if not db_name:
+        print("❌ Set --db-name or DB_NAME")
+        sys.exit(1)
+
+    print("🗜️  Compact-Schema Migration")
+    print("=" * 40)
+    asyncio.run(migrate(args, mongo_url, db_name))
+
+
+if __name__ == "__main__":
+    main()
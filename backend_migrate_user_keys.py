@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+User-Key Migration for Brain Rot Reduction Backend
+Backfills userId on documents written before every collection was keyed by
+user, builds the userId-led indexes and optionally shards the collections
+with the layout documented in backend/storage_mongo.py.
+
+The backfill runs in batches of _id ranges, so each write is short and the
+migration can run against a live database and be resumed after interruption.
+Documents with no owner (old challenges and registry entries) are assigned to
+--default-user, the same user the API falls back to.
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+
+MISSING_USER = {"$or": [{"userId": {"$exists": False}}, {"userId": None}]}
+
+
+def backfill(collection, default_user: str, batch_size: int, dry_run: bool) -> int:
+    """Set userId on every document that lacks one; returns the number updated (or found)"""
+    if dry_run:
+        return collection.count_documents(MISSING_USER)
+
+    updated = 0
+    while True:
+        ids = [doc["_id"] for doc in collection.find(MISSING_USER, {"_id": 1}).sort("_id", 1).limit(batch_size)]
+        if not ids:
+            return updated
+        result = collection.update_many(
+            {"_id": {"$in": ids}, **MISSING_USER},
+            {"$set": {"userId": default_user}}
+        )
+        updated += result.modified_count
+
+
+def shard(client, db_name: str, shard_keys, dry_run: bool):
+    from pymongo.errors import OperationFailure
+
+    if dry_run:
+        print(f"   sh.enableSharding(\"{db_name}\")")
+        for name, key in shard_keys.items():
+            print(f"   sh.shardCollection(\"{db_name}.{name}\", {key})")
+        return
+
+    try:
+        client.admin.command("enableSharding", db_name)
+    except OperationFailure as e:
+        print(f"❌ enableSharding failed (is this a mongos?): {e}")
+        sys.exit(1)
+    for name, key in shard_keys.items():
+        try:
+            client.admin.command("shardCollection", f"{db_name}.{name}", key=key)
+            print(f"✅ Sharded {name} on {key}")
+        except OperationFailure as e:
+            print(f"⚠️  {name}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=None)
+    parser.add_argument("--db-name", default=None)
+    parser.add_argument("--default-user", default="default", help="owner for documents without a userId")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--skip-indexes", action="store_true", help="only backfill")
+    parser.add_argument("--shard", action="store_true", help="shard the collections (run against mongos)")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(BACKEND_DIR / ".env")
+    except ImportError:
+        pass
+    mongo_url = args.mongo_url or os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+    db_name = args.db_name or os.environ.get("DB_NAME")
+    if not db_name:
+        print("❌ Set --db-name or DB_NAME")
+        sys.exit(1)
+
+    import pymongo
+    from storage_mongo import INDEXES, SHARD_KEYS
+
+    print("🔑 User-Key Migration")
+    print("=" * 40)
+
+    client = pymongo.MongoClient(mongo_url)
+    db = client[db_name]
+    started = time.perf_counter()
+
+    for name in INDEXES:
+        count = backfill(db[name], args.default_user, args.batch_size, args.dry_run)
+        verb = "would set" if args.dry_run else "set"
+        print(f"✅ {name}: {verb} userId on {count:,} documents")
+
+    if not args.skip_indexes:
+        for name, indexes in INDEXES.items():
+            if args.dry_run:
+                print(f"   {name}: {', '.join(index.document['name'] for index in indexes)}")
+                continue
+            db[name].create_indexes(indexes)
+            print(f"✅ {name}: indexes ready")
+
+    if args.shard:
+        shard(client, db_name, SHARD_KEYS, args.dry_run)
+
+    print(f"⏱️  Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
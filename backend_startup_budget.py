@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Startup Budget Check for Brain Rot Reduction Backend
+Measures how long `import server` takes and how long a fresh uvicorn process
+needs to answer its first request, and fails if either exceeds its budget.
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+
+# Budgets in seconds; override with --import-budget / --first-request-budget
+DEFAULT_IMPORT_BUDGET = 1.0
+DEFAULT_FIRST_REQUEST_BUDGET = 3.0
+
+
+def measure_import_time(runs: int) -> float:
+    """Best-of-N wall time for importing server.py in a fresh interpreter"""
+    code = (
+        "import time; t = time.perf_counter(); import server; "
+        "print(time.perf_counter() - t)"
+    )
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        )
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return min(timings)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_request(timeout: float) -> float:
+    """Time from spawning uvicorn until /api/health answers 200"""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/api/health"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=0.5) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError(f"No response from {url} within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--import-budget", type=float, default=DEFAULT_IMPORT_BUDGET)
+    parser.add_argument("--first-request-budget", type=float, default=DEFAULT_FIRST_REQUEST_BUDGET)
+    parser.add_argument("--runs", type=int, default=3, help="import measurements to take (best is reported)")
+    args = parser.parse_args()
+
+    print("⏱️  Backend Startup Budget")
+    print("=" * 40)
+
+    import_time = measure_import_time(args.runs)
+    first_request = measure_first_request(timeout=max(args.first_request_budget * 5, 10))
+
+    failed = False
+    for name, value, budget in (
+        ("import server", import_time, args.import_budget),
+        ("time to first request", first_request, args.first_request_budget),
+    ):
+        ok = value <= budget
+        failed = failed or not ok
+        status = "✅ PASS" if ok else "❌ FAIL"
+        print(f"{status} {name}: {value * 1000:.0f} ms (budget {budget * 1000:.0f} ms)")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
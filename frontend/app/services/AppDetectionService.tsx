@@ -1,6 +1,7 @@
 import * as Application from 'expo-application';
 import * as Device from 'expo-device';
 import AsyncStorage from '@react-native-async-storage/async-storage';
+import { deviceHeaders } from './DeviceIdentity';
 
 export interface DetectedApp {
   id: string;
@@ -235,9 +236,9 @@ class AppDetectionService {
     try {
       const response = await fetch(`${this.backendUrl}/api/apps/bulk-register`, {
         method: 'POST',
-        headers: {
+        headers: await deviceHeaders({
           'Content-Type': 'application/json',
-        },
+        }),
         body: JSON.stringify(apps),
       });
 
@@ -351,9 +352,9 @@ class AppDetectionService {
     try {
       const response = await fetch(`${this.backendUrl}/api/usage/session`, {
         method: 'POST',
-        headers: {
+        headers: await deviceHeaders({
           'Content-Type': 'application/json',
-        },
+        }),
         body: JSON.stringify({
           packageName: session.packageName,
           appName: session.appName,
@@ -380,7 +381,9 @@ class AppDetectionService {
    */
   async getRealTimeUsage(): Promise<any[]> {
     try {
-      const response = await fetch(`${this.backendUrl}/api/usage/realtime`);
+      const response = await fetch(`${this.backendUrl}/api/usage/realtime`, {
+        headers: await deviceHeaders(),
+      });
       if (!response.ok) {
         throw new Error(`Real-time usage fetch failed: ${response.status}`);
       }
@@ -0,0 +1,41 @@
+import AsyncStorage from '@react-native-async-storage/async-storage';
+
+const DEVICE_ID_KEY = 'deviceId';
+
+let deviceId: Promise<string> | null = null;
+
+function randomId(): string {
+  const hex = () => Math.floor(Math.random() * 0x10000).toString(16).padStart(4, '0');
+  return `${hex()}${hex()}-${hex()}-${hex()}-${hex()}-${hex()}${hex()}${hex()}`;
+}
+
+async function loadDeviceId(): Promise<string> {
+  try {
+    const stored = await AsyncStorage.getItem(DEVICE_ID_KEY);
+    if (stored) {
+      return stored;
+    }
+    const created = randomId();
+    await AsyncStorage.setItem(DEVICE_ID_KEY, created);
+    return created;
+  } catch (error) {
+    console.error('Failed to load device id:', error);
+    return randomId();
+  }
+}
+
+/**
+ * Stable id for this install, generated on first use. The backend keys its
+ * polling rate limit on it (X-Device-Id), so devices behind one NAT or proxy
+ * do not share a limit.
+ */
+export function getDeviceId(): Promise<string> {
+  if (!deviceId) {
+    deviceId = loadDeviceId();
+  }
+  return deviceId;
+}
+
+export async function deviceHeaders(headers: Record<string, string> = {}): Promise<Record<string, string>> {
+  return { ...headers, 'X-Device-Id': await getDeviceId() };
+}
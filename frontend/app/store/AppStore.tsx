@@ -155,31 +155,39 @@ const useAppStore = create<AppState>((set, get) => ({
         percentage: 0,
       }));
 
-      // Add to backend
-      for (const app of newMonitoredApps) {
-        try {
-          const response = await fetch(`${process.env.EXPO_PUBLIC_BACKEND_URL}/api/apps/monitored`, {
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-              packageName: app.packageName,
-              appName: app.name,
-              displayName: app.displayName,
-              icon: app.icon,
-              dailyLimit: app.dailyLimit,
-              category: app.category,
-              userId: 'default',
-            }),
-          });
-
-          if (!response.ok) {
-            console.warn(`Failed to add ${app.name} to backend:`, response.status);
+      // Add to backend in a single round trip
+      try {
+        const response = await fetch(`${process.env.EXPO_PUBLIC_BACKEND_URL}/api/apps/monitored/bulk`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          body: JSON.stringify({
+            userId: 'default',
+            operations: newMonitoredApps.map(app => ({
+              op: 'add',
+              app: {
+                packageName: app.packageName,
+                appName: app.name,
+                displayName: app.displayName,
+                icon: app.icon,
+                dailyLimit: app.dailyLimit,
+                category: app.category,
+              },
+            })),
+          }),
+        });
+
+        if (!response.ok) {
+          console.warn('Failed to add apps to backend:', response.status);
+        } else {
+          const result = await response.json();
+          for (const error of result.errors || []) {
+            console.warn(`Failed to add ${newMonitoredApps[error.index]?.name} to backend:`, error.detail);
           }
-        } catch (error) {
-          console.error(`Failed to sync ${app.name} with backend:`, error);
         }
+      } catch (error) {
+        console.error('Failed to sync monitored apps with backend:', error);
       }
 
       // Update local state
@@ -475,13 +483,20 @@ const useAppStore = create<AppState>((set, get) => ({
       
       // Reset all monitored apps from backend
       const state = get();
-      for (const app of state.monitoredApps) {
+      if (state.monitoredApps.length > 0) {
         try {
-          await fetch(`${process.env.EXPO_PUBLIC_BACKEND_URL}/api/apps/monitored/${app.id}`, {
-            method: 'DELETE',
+          await fetch(`${process.env.EXPO_PUBLIC_BACKEND_URL}/api/apps/monitored/bulk`, {
+            method: 'POST',
+            headers: {
+              'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+              userId: 'default',
+              operations: state.monitoredApps.map(app => ({ op: 'remove', id: app.id })),
+            }),
           });
         } catch (error) {
-          console.warn(`Failed to remove ${app.name} from backend:`, error);
+          console.warn('Failed to remove monitored apps from backend:', error);
         }
       }
 
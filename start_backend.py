@@ -1,15 +1,30 @@
 #!/usr/bin/env python3
 """
 MindClear Backend Startup Script
-This script starts the backend server locally for the APK version
+This script starts the backend server locally for the APK version.
+
+Pass --prod for a production launch: multiple workers, uvloop/httptools when
+available, no auto-reload and no dependency reinstall.
+
+Pass --storage sqlite to run without MongoDB; data is kept in an embedded
+SQLite file (SQLITE_PATH, default backend/mindclear.db). SQLite runs in a
+single worker, so --prod with it needs --workers 1.
 """
 
+import argparse
+import importlib.util
 import subprocess
 import sys
 import os
 import webbrowser
 from pathlib import Path
 
+BACKEND_DIR = Path(__file__).parent / "backend"
+DEFAULT_MONGO_URL = "mongodb://localhost:27017"
+
+# PyMongo's default maxPoolSize
+DEFAULT_MAX_POOL_SIZE = 100
+
 def check_python():
     """Check if Python 3.7+ is installed"""
     if sys.version_info < (3, 7):
@@ -18,11 +33,19 @@ def check_python():
     print("✅ Python version:", sys.version.split()[0])
     return True
 
-def check_mongodb():
+def load_backend_env():
+    """Load backend/.env so the checks below see the same settings as the server"""
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv(BACKEND_DIR / ".env")
+
+def check_mongodb(mongo_url=DEFAULT_MONGO_URL):
     """Check if MongoDB is running"""
     try:
         import pymongo
-        client = pymongo.MongoClient("mongodb://localhost:27017", serverSelectionTimeoutMS=2000)
+        client = pymongo.MongoClient(mongo_url, serverSelectionTimeoutMS=2000)
         client.server_info()
         print("✅ MongoDB is running")
         return True
@@ -31,11 +54,46 @@ def check_mongodb():
         print("   On Debian/Ubuntu: sudo systemctl start mongod")
         return False
 
+def check_pool_size(mongo_url, workers):
+    """
+    Each worker process owns its own connection pool, so the server must be
+    able to accept workers * maxPoolSize connections.
+    """
+    import pymongo
+    from pymongo.uri_parser import parse_uri
+
+    options = parse_uri(mongo_url).get("options", {})
+    max_pool_size = int(os.environ.get("MONGO_MAX_POOL_SIZE") or options.get("maxPoolSize", DEFAULT_MAX_POOL_SIZE))
+    min_pool_size = int(os.environ.get("MONGO_MIN_POOL_SIZE") or options.get("minPoolSize", 0))
+
+    if max_pool_size == 0:
+        print("⚠️  maxPoolSize=0 means unbounded pools; set MONGO_MAX_POOL_SIZE for production")
+        return True
+
+    worst_case = workers * max_pool_size
+    print(f"🔌 Connection pools: {workers} workers × maxPoolSize {max_pool_size} = up to {worst_case} connections")
+    if min_pool_size:
+        print(f"   {workers * min_pool_size} connections are held open at idle (minPoolSize {min_pool_size})")
+
+    try:
+        client = pymongo.MongoClient(mongo_url, serverSelectionTimeoutMS=2000)
+        connections = client.admin.command("serverStatus").get("connections", {})
+        client.close()
+    except Exception as e:
+        print(f"⚠️  Could not read serverStatus to verify connection limits: {e}")
+        return True
+
+    capacity = connections.get("current", 0) + connections.get("available", 0)
+    if capacity and worst_case > capacity:
+        print(f"❌ MongoDB accepts at most {capacity} connections; lower MONGO_MAX_POOL_SIZE or --workers")
+        return False
+    print(f"✅ MongoDB connection capacity: {capacity}")
+    return True
+
 def install_requirements():
     """Install required packages"""
-    backend_dir = Path(__file__).parent / "backend"
-    requirements_file = backend_dir / "requirements.txt"
-    
+    requirements_file = BACKEND_DIR / "requirements.txt"
+
     if requirements_file.exists():
         print("📦 Installing backend dependencies...")
         subprocess.run([sys.executable, "-m", "pip", "install", "-r", str(requirements_file)])
@@ -45,46 +103,107 @@ def install_requirements():
         return False
     return True
 
-def start_backend():
+def has_module(name):
+    return importlib.util.find_spec(name) is not None
+
+def uvicorn_command(args):
+    command = [
+        sys.executable, "-m", "uvicorn", "server:app",
+        "--host", args.host,
+        "--port", str(args.port),
+    ]
+    if not args.prod:
+        return command + ["--reload"]
+
+    command += [
+        "--workers", str(args.workers),
+        "--timeout-keep-alive", str(args.keep_alive),
+        "--no-access-log",
+    ]
+    # Faster event loop and HTTP parser when they are installed
+    if has_module("uvloop"):
+        command += ["--loop", "uvloop"]
+    if has_module("httptools"):
+        command += ["--http", "httptools"]
+    return command
+
+def start_backend(args):
     """Start the FastAPI backend server"""
-    backend_dir = Path(__file__).parent / "backend"
-    server_file = backend_dir / "server.py"
-    
+    server_file = BACKEND_DIR / "server.py"
+
     if not server_file.exists():
         print("❌ server.py not found")
         return False
-    
+
+    command = uvicorn_command(args)
+
     print("🚀 Starting MindClear backend server...")
-    print("📡 Backend will be available at: http://localhost:8001")
-    print("🔗 API documentation: http://localhost:8001/docs")
+    print(f"📡 Backend will be available at: http://localhost:{args.port}")
+    print(f"🔗 API documentation: http://localhost:{args.port}/docs")
+    if args.prod:
+        print(f"🏭 Production mode: {args.workers} workers, keep-alive {args.keep_alive}s")
+        print(f"   {' '.join(command[3:])}")
     print("\n⚠️  Keep this terminal window open while using the app")
     print("⚠️  Press Ctrl+C to stop the server\n")
-    
+
     # Change to backend directory
-    os.chdir(backend_dir)
-    
+    os.chdir(BACKEND_DIR)
+
     # Start the server
-    subprocess.run([
-        sys.executable, "-m", "uvicorn", "server:app",
-        "--host", "0.0.0.0",
-        "--port", "8001",
-        "--reload"
-    ])
+    subprocess.run(command)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Start the MindClear backend")
+    parser.add_argument("--prod", action="store_true",
+                        help="multi-worker production launch without reload or reinstall")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes in --prod mode (default: CPU count)")
+    parser.add_argument("--keep-alive", type=int, default=int(os.environ.get("KEEP_ALIVE_SECONDS", "5")),
+                        help="seconds to hold idle keep-alive connections (default: 5)")
+    parser.add_argument("--storage", choices=["mongo", "sqlite", "memory"], default=None,
+                        help="storage backend (default: STORAGE_BACKEND or mongo)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+
     print("🧠 MindClear Backend Startup")
     print("=" * 40)
-    
+
     if not check_python():
         return
-    
-    if not check_mongodb():
-        return
-    
-    if not install_requirements():
+
+    load_backend_env()
+    # The server process inherits the choice through the environment
+    storage = args.storage or os.environ.get("STORAGE_BACKEND", "mongo")
+    os.environ["STORAGE_BACKEND"] = storage
+
+    if storage == "mongo":
+        mongo_url = os.environ.get("MONGO_URL", DEFAULT_MONGO_URL)
+        if not check_mongodb(mongo_url):
+            return
+        if args.prod and not check_pool_size(mongo_url, args.workers):
+            return
+    else:
+        print(f"✅ Storage: {storage} (no MongoDB needed)")
+        if args.prod and storage == "memory":
+            print("⚠️  In-memory storage is per worker and lost on restart")
+        if args.prod and storage == "sqlite" and args.workers > 1:
+            # The SQLite backend serializes writes with in-process locks only
+            print("❌ SQLite storage supports a single worker; use --workers 1 or --storage mongo")
+            return
+
+    if args.prod and args.workers > 1 and not os.environ.get("INVALIDATION_BUS"):
+        # Each worker caches reads; keep the caches in step over local sockets
+        os.environ["INVALIDATION_BUS"] = "unix"
+        print("🔁 Cross-worker invalidation: unix sockets (INVALIDATION_BUS=mongo for several hosts)")
+
+    if not args.prod and not install_requirements():
         return
-    
-    start_backend()
+
+    start_backend(args)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
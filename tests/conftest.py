@@ -0,0 +1,36 @@
+import contextlib
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+BACKEND_DIR = Path(__file__).parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Run the app in-process on the memory backend: `async with api(POLL_BURST="2") as (server, client)`"""
+
+    @contextlib.asynccontextmanager
+    async def start(**env):
+        import server
+
+        monkeypatch.setenv("STORAGE_BACKEND", "memory")
+        # Challenges use the fallback generator unless a test stubs the LLM
+        monkeypatch.delenv("EMERGENT_LLM_KEY", raising=False)
+        monkeypatch.setenv("INVALIDATION_BUS", "none")
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        async with server.lifespan(server.app):
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                yield server, client
+
+    return start
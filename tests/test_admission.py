@@ -0,0 +1,51 @@
+import pytest
+
+from admission import client_key
+
+pytestmark = pytest.mark.anyio
+
+POLL = {"POLL_RATE_PER_SECOND": "0.001", "POLL_BURST": "2"}
+
+
+def test_client_key_prefers_device_then_credentials_then_address():
+    scope = {"client": ("10.0.0.1", 5000), "headers": []}
+    assert client_key(scope) == "addr:10.0.0.1"
+
+    scope["headers"] = [(b"authorization", b"Bearer secret")]
+    assert client_key(scope).startswith("auth:")
+    assert "secret" not in client_key(scope)
+
+    scope["headers"].append((b"x-device-id", b"phone-1"))
+    assert client_key(scope) == "device:phone-1"
+
+
+async def test_user_id_param_does_not_pick_the_bucket(api):
+    async with api(**POLL) as (server, client):
+        statuses = [
+            (await client.get("/api/apps/monitored", params={"user_id": f"user-{i}"})).status_code
+            for i in range(3)
+        ]
+        assert statuses == [200, 200, 429]
+
+
+async def test_devices_get_their_own_buckets(api):
+    async with api(**POLL) as (server, client):
+        for device in ("phone-1", "phone-2"):
+            for _ in range(2):
+                response = await client.get("/api/apps/monitored", headers={"X-Device-Id": device})
+                assert response.status_code == 200
+        response = await client.get("/api/apps/monitored", headers={"X-Device-Id": "phone-1"})
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+
+
+async def test_block_state_is_never_rate_limited(api):
+    async with api(**POLL) as (server, client):
+        for _ in range(5):
+            assert (await client.get("/api/apps/blocked")).status_code == 200
+
+
+async def test_polling_is_not_capped_by_default(api):
+    async with api() as (server, client):
+        for _ in range(30):
+            assert (await client.get("/api/usage/realtime")).status_code == 200
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from challenge_cache import ChallengeCache
+
+pytestmark = pytest.mark.anyio
+
+
+def test_recent_lists_user_history_then_pool():
+    cache = ChallengeCache()
+    cache.add("easy", "mid", {"question": "1 + 1 = ?", "answer": 2, "timeReward": 5})
+    cache.add("easy", "mid", {"question": "2 + 2 = ?", "answer": 4, "timeReward": 5})
+    cache.mark_seen("alice", "3 + 3 = ?")
+    assert cache.recent("easy", "mid", "alice") == ["3 + 3 = ?", "2 + 2 = ?", "1 + 1 = ?"]
+    assert cache.recent("easy", "mid", "alice", limit=2) == ["3 + 3 = ?", "2 + 2 = ?"]
+
+
+def test_refills_are_numbered_per_key():
+    cache = ChallengeCache()
+    assert [cache.next_refill("easy", "mid") for _ in range(2)] == [1, 2]
+    assert cache.next_refill("hard", "mid") == 1
+
+
+def scripted_llm(monkeypatch, server, questions):
+    calls = []
+
+    async def request(difficulty, band, refill, avoid):
+        calls.append((refill, list(avoid)))
+        question = questions[min(len(calls), len(questions)) - 1]
+        a, b = (int(part) for part in question.split(" = ")[0].split(" + "))
+        return json.dumps({"question": question, "answer": a + b, "timeReward": 6})
+
+    monkeypatch.setattr(server, "request_llm_challenge", request)
+    return calls
+
+
+async def generate(client, user_id):
+    response = await client.post("/api/challenges/generate", json={"userId": user_id, "difficulty": "easy"})
+    assert response.status_code == 200
+    return response.json()["question"]
+
+
+async def test_generated_repeats_are_not_served_again(api, monkeypatch):
+    async with api(EMERGENT_LLM_KEY="test") as (server, client):
+        calls = scripted_llm(monkeypatch, server, ["1 + 1 = ?", "1 + 1 = ?", "2 + 2 = ?"])
+        assert await generate(client, "alice") == "1 + 1 = ?"
+        # The pool has nothing new for alice, and the model repeats itself once
+        assert await generate(client, "alice") == "2 + 2 = ?"
+        refills = [refill for refill, _ in calls]
+        assert refills == [1, 2, 3]
+        assert "1 + 1 = ?" in calls[1][1]
+
+
+async def test_constant_repeats_fall_back(api, monkeypatch):
+    async with api(EMERGENT_LLM_KEY="test") as (server, client):
+        scripted_llm(monkeypatch, server, ["1 + 1 = ?"])
+        assert await generate(client, "alice") == "1 + 1 = ?"
+        assert await generate(client, "alice") != "1 + 1 = ?"
+        assert await generate(client, "bob") == "1 + 1 = ?"
+
+
+async def test_llm_sessions_are_unique_per_process(monkeypatch):
+    import server
+
+    session_ids = []
+
+    class StubChat:
+        def __init__(self, session_id, **kwargs):
+            session_ids.append(session_id)
+
+        def with_model(self, provider, model):
+            return self
+
+        async def send_message(self, message):
+            return json.dumps({"question": "1 + 1 = ?", "answer": 2, "timeReward": 6})
+
+    monkeypatch.setattr(server, "load_llm_client", lambda: (StubChat, lambda text: text))
+    for refill in (1, 2):
+        await server.request_llm_challenge("easy", "mid", refill, [])
+    assert session_ids == [f"challenge_{server.CHALLENGE_SESSION_PREFIX}_easy_mid_{refill}" for refill in (1, 2)]
+    assert len(server.CHALLENGE_SESSION_PREFIX) == 12
@@ -0,0 +1,90 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from daily_reset import DailyResetScheduler
+from storage import create_storage
+
+pytestmark = pytest.mark.anyio
+
+# 01:30 in Berlin (UTC+2 in October), still the previous day in UTC
+NOW = datetime(2026, 10, 19, 23, 30, tzinfo=timezone.utc)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+async def storage(request, tmp_path):
+    options = {"path": str(tmp_path / "test.db")} if request.param == "sqlite" else {}
+    storage = create_storage(request.param, **options)
+    await storage.start(1)
+    yield storage
+    await storage.close()
+
+
+async def add_app(storage, package_name, time_used, **fields):
+    app = {
+        "id": str(uuid.uuid4()), "userId": "alice", "packageName": package_name, "appName": package_name,
+        "dailyLimit": 60, "timeUsed": time_used, "isBlocked": False, "isActive": True, **fields,
+    }
+    await storage.monitored_apps.insert(app)
+    return app
+
+
+async def time_used(storage, package_name):
+    return (await storage.monitored_apps.find_active("alice", package_name))["timeUsed"]
+
+
+async def test_apps_without_timezone_are_reset_in_the_default_zone(storage):
+    await add_app(storage, "com.legacy", 45)
+    counts = await DailyResetScheduler(storage.monitored_apps).run_once(NOW)
+    assert counts == {"UTC": 1}
+    assert await time_used(storage, "com.legacy") == 0
+
+
+async def test_app_moving_into_an_already_reset_zone_is_reset(storage):
+    scheduler = DailyResetScheduler(storage.monitored_apps)
+    await add_app(storage, "com.berlin", 30, timezone="Europe/Berlin", lastResetDate="2026-10-19")
+    assert await scheduler.run_once(NOW) == {"Europe/Berlin": 1}
+
+    # Reset for its old zone's date only, then the owner moves to Berlin
+    await add_app(storage, "com.moved", 40, timezone="UTC", lastResetDate="2026-10-19")
+    await storage.monitored_apps.set_timezone("alice", "Europe/Berlin", datetime.utcnow())
+    assert await scheduler.run_once(NOW) == {"Europe/Berlin": 1}
+    assert await time_used(storage, "com.moved") == 0
+    assert await time_used(storage, "com.berlin") == 0
+
+
+async def test_app_moving_west_is_not_reset_again(storage):
+    await add_app(storage, "com.west", 20, timezone="America/New_York", lastResetDate="2026-10-20")
+    assert await DailyResetScheduler(storage.monitored_apps).run_once(NOW) == {"America/New_York": 0}
+    assert await time_used(storage, "com.west") == 20
+
+
+async def test_usage_after_midnight_survives_the_late_reset(storage):
+    await add_app(storage, "com.berlin", 50, timezone="Europe/Berlin", lastResetDate="2026-10-19")
+    await storage.monitored_apps.add_usage({("alice", "com.berlin"): 5}, NOW.replace(tzinfo=None))
+    assert await time_used(storage, "com.berlin") == 5
+
+    assert await DailyResetScheduler(storage.monitored_apps).run_once(NOW) == {"Europe/Berlin": 0}
+    assert await time_used(storage, "com.berlin") == 5
+
+
+async def test_logged_session_starts_the_new_day(api):
+    user_id = f"u-{uuid.uuid4().hex}"
+    async with api() as (server, client):
+        app = (await client.post("/api/apps/monitored", json={
+            "userId": user_id, "packageName": "com.example", "appName": "Example",
+            "displayName": "Example", "dailyLimit": 60,
+        })).json()
+        yesterday = (datetime.utcnow() - timedelta(days=1)).date().isoformat()
+        await server.storage.monitored_apps.set_usage(user_id, app["id"], 55, False, datetime.utcnow())
+        stored = await server.storage.monitored_apps.get(user_id, app["id"])
+        stored["lastResetDate"] = yesterday
+        await server.storage.monitored_apps.table.replace([stored])
+
+        await client.post("/api/usage/session", json={
+            "userId": user_id, "appId": app["id"], "packageName": "com.example",
+            "appName": "Example", "duration": 10, "date": yesterday,
+        })
+        apps = (await client.get(f"/api/apps/monitored?user_id={user_id}")).json()
+        assert [(a["timeUsed"], a["isBlocked"]) for a in apps] == [(10, False)]
@@ -0,0 +1,75 @@
+import asyncio
+import uuid
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def app_info(user_id, package_name):
+    return {
+        "userId": user_id, "packageName": package_name, "appName": package_name,
+        "displayName": package_name, "category": "other",
+    }
+
+
+async def test_revalidation_sees_write(api):
+    user_id = f"u-{uuid.uuid4().hex}"
+    async with api() as (server, client):
+        first = await client.get(f"/api/apps/registry?user_id={user_id}")
+        etag = first.headers["etag"]
+        assert (await client.get(f"/api/apps/registry?user_id={user_id}", headers={"If-None-Match": etag})).status_code == 304
+
+        await client.post("/api/apps/register", json=app_info(user_id, "com.example"))
+
+        after = await client.get(f"/api/apps/registry?user_id={user_id}", headers={"If-None-Match": etag})
+        assert after.status_code == 200
+        assert after.headers["etag"] != etag
+        assert [app["packageName"] for app in after.json()] == ["com.example"]
+
+
+async def test_stale_body_never_gets_current_etag(api):
+    user_id = f"u-{uuid.uuid4().hex}"
+    async with api() as (server, client):
+        started = asyncio.Event()
+        release = asyncio.Event()
+        original = server.storage.app_registry.list
+
+        async def slow_list(*args, **kwargs):
+            apps = await original(*args, **kwargs)
+            started.set()
+            await release.wait()
+            return apps
+
+        server.storage.app_registry.list = slow_list
+        try:
+            read = asyncio.create_task(client.get(f"/api/apps/registry?user_id={user_id}"))
+            await started.wait()
+            await client.post("/api/apps/register", json=app_info(user_id, "com.example"))
+            release.set()
+            stale = await read
+        finally:
+            server.storage.app_registry.list = original
+
+        assert stale.json() == []
+        # Revalidating the pre-write body must not be answered 304
+        response = await client.get(f"/api/apps/registry?user_id={user_id}", headers={"If-None-Match": stale.headers["etag"]})
+        assert response.status_code == 200
+        assert [app["packageName"] for app in response.json()] == ["com.example"]
+        # And the ETag that comes with the fresh body validates it
+        etag = response.headers["etag"]
+        assert (await client.get(f"/api/apps/registry?user_id={user_id}", headers={"If-None-Match": etag})).status_code == 304
+
+
+async def test_cached_analytics_follow_session_writes(api):
+    user_id = f"u-{uuid.uuid4().hex}"
+    async with api() as (server, client):
+        first = await client.get(f"/api/analytics?user_id={user_id}")
+        assert first.json()["totalTimeUsed"] == 0
+        await client.post("/api/usage/session", json={
+            "userId": user_id, "appId": "a", "packageName": "com.example", "appName": "Example",
+            "duration": 12, "date": "2026-01-01",
+        })
+        after = await client.get(f"/api/analytics?user_id={user_id}", headers={"If-None-Match": first.headers["etag"]})
+        assert after.status_code == 200
+        assert after.json()["totalTimeUsed"] == 12
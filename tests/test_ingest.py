@@ -0,0 +1,148 @@
+import asyncio
+import uuid
+from datetime import datetime
+
+import pytest
+
+from ingest import IngestBuffer
+from storage import create_storage
+
+pytestmark = pytest.mark.anyio
+
+
+def session(user_id, duration=5):
+    return {
+        "id": str(uuid.uuid4()), "userId": user_id, "appId": "a", "packageName": "com.example",
+        "appName": "Example", "duration": duration, "date": "2026-01-01", "timestamp": datetime.utcnow(),
+    }
+
+
+async def make_storage(user_id):
+    storage = create_storage("memory")
+    await storage.start(1)
+    await storage.monitored_apps.insert({
+        "id": str(uuid.uuid4()), "userId": user_id, "packageName": "com.example", "appName": "Example",
+        "dailyLimit": 60, "timeUsed": 0, "isBlocked": False, "isActive": True,
+    })
+    return storage
+
+
+def failing(method, times, before=None):
+    """Wrap a storage method so its first `times` calls raise (after running `before`, if given)"""
+    calls = {"n": 0}
+
+    async def wrapper(*args, **kwargs):
+        calls["n"] += 1
+        if calls["n"] <= times:
+            if before is not None:
+                await before(*args, **kwargs)
+            raise ConnectionError("storage unavailable")
+        return await method(*args, **kwargs)
+
+    return wrapper
+
+
+async def stored(storage, user_id):
+    return await storage.usage_sessions.list_since(user_id, datetime(2000, 1, 1), {"_id": 0, "id": 1})
+
+
+async def time_used(storage, user_id):
+    app = await storage.monitored_apps.find_active(user_id, "com.example")
+    return app["timeUsed"]
+
+
+async def test_failed_insert_is_retried():
+    storage = await make_storage("u")
+    storage.usage_sessions.insert_many = failing(storage.usage_sessions.insert_many, 2)
+    buffer = IngestBuffer(storage, retry_delay=0.01)
+    await buffer.flush([session("u"), session("u")])
+
+    assert len(await stored(storage, "u")) == 2
+    assert await time_used(storage, "u") == 10
+    assert buffer.stats()["retries"] == 2
+    assert buffer.stats()["flushed"] == 2
+
+
+async def test_partial_insert_is_not_duplicated():
+    storage = await make_storage("u")
+    original = storage.usage_sessions.insert_many
+
+    async def store_first(sessions):
+        await original(sessions[:1])
+
+    storage.usage_sessions.insert_many = failing(original, 1, before=store_first)
+    buffer = IngestBuffer(storage, retry_delay=0.01)
+    batch = [session("u"), session("u"), session("u")]
+    await buffer.flush(batch)
+
+    assert sorted(s["id"] for s in await stored(storage, "u")) == sorted(s["id"] for s in batch)
+
+
+async def test_usage_failure_does_not_reinsert_sessions():
+    storage = await make_storage("u")
+    inserts = []
+    original = storage.usage_sessions.insert_many
+
+    async def counting_insert(sessions):
+        inserts.append(len(sessions))
+        await original(sessions)
+
+    storage.usage_sessions.insert_many = counting_insert
+    storage.monitored_apps.add_usage = failing(storage.monitored_apps.add_usage, 1)
+    buffer = IngestBuffer(storage, retry_delay=0.01)
+    await buffer.flush([session("u", 7)])
+
+    assert inserts == [1]
+    assert len(await stored(storage, "u")) == 1
+    assert await time_used(storage, "u") == 7
+    assert buffer.stats()["flushed"] == 1
+    assert buffer.stats()["lost"] == 0
+
+
+async def test_drain_keeps_retrying_then_reports_loss():
+    storage = await make_storage("u")
+    storage.usage_sessions.insert_many = failing(storage.usage_sessions.insert_many, 1000)
+    buffer = IngestBuffer(storage, flush_interval=0.01, retry_delay=0.01, max_retry_delay=0.01, drain_timeout=0.2)
+    buffer.start()
+    for _ in range(3):
+        assert await buffer.submit(session("u"))
+    await asyncio.sleep(0.05)
+    await buffer.submit(session("u"))
+
+    await buffer.drain()
+    assert buffer.stats()["lost"] == 4
+    assert buffer.stats()["retries"] > 1
+
+
+async def test_drain_flushes_after_storage_recovers():
+    storage = await make_storage("u")
+    storage.usage_sessions.insert_many = failing(storage.usage_sessions.insert_many, 3)
+    buffer = IngestBuffer(storage, flush_interval=0.01, retry_delay=0.01, drain_timeout=5)
+    buffer.start()
+    for _ in range(3):
+        await buffer.submit(session("u"))
+
+    await buffer.drain()
+    assert len(await stored(storage, "u")) == 3
+    assert buffer.stats()["lost"] == 0
+
+
+async def test_flush_of_unmonitored_sessions_changes_analytics_etag(api):
+    user_id = f"u-{uuid.uuid4().hex}"
+    async with api(INGEST_BUFFER_ENABLED="true", INGEST_FLUSH_INTERVAL_SECONDS="0.01") as (server, client):
+        first = await client.get(f"/api/analytics?user_id={user_id}")
+        etag = first.headers["etag"]
+        assert first.json()["totalTimeUsed"] == 0
+
+        posted = {key: value for key, value in session(user_id, duration=7).items() if key != "timestamp"}
+        posted["packageName"] = "com.unmonitored"
+        assert (await client.post("/api/usage/session", json=posted)).status_code == 202
+
+        for _ in range(100):
+            response = await client.get(f"/api/analytics?user_id={user_id}", headers={"If-None-Match": etag})
+            if response.status_code != 304:
+                break
+            await asyncio.sleep(0.01)
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert response.json()["totalTimeUsed"] == 7
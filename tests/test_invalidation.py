@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from invalidation import UnixSocketBus
+
+pytestmark = pytest.mark.anyio
+
+
+def worker_bus(directory, name):
+    # Workers are told apart by pid; in one test process give each its own socket
+    bus = UnixSocketBus(str(directory))
+    bus.path = directory / f"{name}.sock"
+    return bus
+
+
+async def wait_for(condition):
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not met")
+
+
+async def test_unix_bus_delivers_to_other_workers_only(tmp_path):
+    first, second = worker_bus(tmp_path, "first"), worker_bus(tmp_path, "second")
+    received = {"first": [], "second": []}
+    await first.start(received["first"].extend)
+    await second.start(received["second"].extend)
+    try:
+        first.publish("monitored_apps", "alice")
+        first.publish("monitored_apps", "alice")
+        await wait_for(lambda: received["second"])
+        assert received["second"] == [("monitored_apps", "alice")]
+        assert received["first"] == []
+    finally:
+        await first.stop()
+        await second.stop()
+
+
+async def test_unix_bus_removes_sockets_of_exited_workers(tmp_path):
+    bus = worker_bus(tmp_path, "live")
+    stale = tmp_path / "gone.sock"
+    stale.touch()
+    await bus.start(lambda events: None)
+    try:
+        bus.publish("usage_sessions", "alice")
+        await wait_for(lambda: not stale.exists())
+    finally:
+        await bus.stop()
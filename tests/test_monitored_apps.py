@@ -0,0 +1,68 @@
+import uuid
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def storage_env(request, tmp_path):
+    if request.param == "sqlite":
+        return {"STORAGE_BACKEND": "sqlite", "SQLITE_PATH": str(tmp_path / "test.db")}
+    return {}
+
+
+def monitored_app(user_id, package_name, daily_limit=10):
+    return {
+        "userId": user_id, "packageName": package_name, "appName": package_name,
+        "displayName": package_name, "dailyLimit": daily_limit,
+    }
+
+
+def usage_session(user_id, package_name, duration):
+    return {
+        "userId": user_id, "appId": "app", "packageName": package_name,
+        "appName": package_name, "duration": duration, "date": "2026-01-01",
+    }
+
+
+async def test_usage_goes_to_the_re_added_app(api, storage_env):
+    user_id = f"u-{uuid.uuid4().hex}"
+    async with api(**storage_env) as (server, client):
+        first = (await client.post("/api/apps/monitored", json=monitored_app(user_id, "com.example"))).json()
+        assert (await client.delete(f"/api/apps/monitored/{first['id']}?user_id={user_id}")).status_code == 200
+        second = (await client.post("/api/apps/monitored", json=monitored_app(user_id, "com.example"))).json()
+
+        for _ in range(2):
+            response = await client.post("/api/usage/session", json=usage_session(user_id, "com.example", 8))
+            assert response.status_code == 200
+
+        apps = (await client.get(f"/api/apps/monitored?user_id={user_id}")).json()
+        assert [(app["id"], app["timeUsed"], app["isBlocked"]) for app in apps] == [(second["id"], 16, True)]
+        # Read the block state back from storage, not from the in-process snapshot
+        server.block_state.invalidate(user_id)
+        blocked = (await client.get(f"/api/apps/blocked?user_id={user_id}")).json()
+        assert blocked["blocked"] == ["com.example"]
+
+
+async def test_bulk_reports_ids_the_user_does_not_have(api, storage_env):
+    user_id, other_id = f"u-{uuid.uuid4().hex}", f"u-{uuid.uuid4().hex}"
+    async with api(**storage_env) as (server, client):
+        mine = (await client.post("/api/apps/monitored", json=monitored_app(user_id, "com.mine"))).json()
+        theirs = (await client.post("/api/apps/monitored", json=monitored_app(other_id, "com.theirs"))).json()
+
+        response = await client.post("/api/apps/monitored/bulk", json={"userId": user_id, "operations": [
+            {"op": "update_limit", "id": theirs["id"], "dailyLimit": 5},
+            {"op": "update_limit", "id": mine["id"], "dailyLimit": 5},
+            {"op": "remove", "id": "missing"},
+            {"op": "add", "app": monitored_app(user_id, "com.new")},
+        ]})
+        body = response.json()
+        assert body["success"] is False
+        assert [(error["index"], error["detail"]) for error in body["errors"]] == [
+            (0, "Monitored app not found"), (2, "Monitored app not found"),
+        ]
+        assert (body["inserted"], body["modified"]) == (1, 1)
+
+        theirs_now = (await client.get(f"/api/apps/monitored?user_id={other_id}")).json()
+        assert [app["dailyLimit"] for app in theirs_now] == [10]
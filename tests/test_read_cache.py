@@ -0,0 +1,94 @@
+import asyncio
+import uuid
+
+import pytest
+
+from read_cache import ReadCache
+
+pytestmark = pytest.mark.anyio
+
+
+def test_set_without_invalidation_is_cached():
+    cache = ReadCache()
+    token = cache.begin_load("u", "analytics")
+    cache.set("u", "analytics", {"total": 1}, token=token)
+    assert cache.get("u", "analytics") == {"total": 1}
+
+
+@pytest.mark.parametrize("invalidate", [
+    lambda cache: cache.invalidate("u"),
+    lambda cache: cache.invalidate("u", "analytics"),
+    lambda cache: cache.invalidate(None, "analytics"),
+    lambda cache: cache.invalidate(),
+])
+def test_invalidation_during_load_drops_result(invalidate):
+    cache = ReadCache()
+    token = cache.begin_load("u", "analytics")
+    invalidate(cache)
+    cache.set("u", "analytics", {"total": 1}, token=token)
+    assert cache.get("u", "analytics") is None
+    assert cache.stats()["staleLoads"] == 1
+
+
+def test_unrelated_invalidation_keeps_result():
+    cache = ReadCache()
+    token = cache.begin_load("u", "analytics")
+    cache.invalidate("u", "app_registry")
+    cache.invalidate("v")
+    cache.set("u", "analytics", {"total": 1}, token=token)
+    assert cache.get("u", "analytics") == {"total": 1}
+
+
+async def test_registry_write_during_inflight_read_is_not_masked(api):
+    user_id = f"u-{uuid.uuid4().hex}"
+    async with api() as (server, client):
+        started = asyncio.Event()
+        release = asyncio.Event()
+        original = server.storage.app_registry.list
+
+        async def slow_list(*args, **kwargs):
+            apps = await original(*args, **kwargs)
+            started.set()
+            await release.wait()
+            return apps
+
+        server.storage.app_registry.list = slow_list
+        try:
+            read = asyncio.create_task(client.get(f"/api/apps/registry?user_id={user_id}"))
+            await started.wait()
+            response = await client.post("/api/apps/register", json={
+                "userId": user_id, "packageName": "com.example", "appName": "Example",
+                "displayName": "Example", "category": "other",
+            })
+            assert response.status_code == 200
+            release.set()
+            assert (await read).json() == []
+        finally:
+            server.storage.app_registry.list = original
+
+        response = await client.get(f"/api/apps/registry?user_id={user_id}")
+        assert [app["packageName"] for app in response.json()] == ["com.example"]
+
+
+async def test_session_writes_keep_registry_cached(api):
+    user_id = f"u-{uuid.uuid4().hex}"
+    async with api() as (server, client):
+        loads = []
+        original = server.storage.app_registry.list
+
+        async def counting_list(*args, **kwargs):
+            loads.append(args)
+            return await original(*args, **kwargs)
+
+        server.storage.app_registry.list = counting_list
+        try:
+            await client.get(f"/api/apps/registry?user_id={user_id}")
+            for _ in range(3):
+                await client.post("/api/usage/session", json={
+                    "userId": user_id, "appId": "a", "packageName": "com.example", "appName": "Example",
+                    "duration": 1, "date": "2026-01-01",
+                })
+                await client.get(f"/api/apps/registry?user_id={user_id}")
+        finally:
+            server.storage.app_registry.list = original
+        assert len(loads) == 1
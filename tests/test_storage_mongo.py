@@ -0,0 +1,41 @@
+import pytest
+from pymongo.errors import OperationFailure
+
+from storage_mongo import INDEXES, MongoStorage
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeCollection:
+    def __init__(self, error):
+        self.error = error
+
+    async def create_indexes(self, indexes):
+        if self.error:
+            raise self.error
+
+
+class FakeDatabase:
+    def __init__(self, failing):
+        self.failing = failing
+
+    def __getitem__(self, name):
+        return FakeCollection(OperationFailure("E11000 duplicate key") if name in self.failing else None)
+
+
+def storage(failing):
+    mongo = object.__new__(MongoStorage)
+    mongo.schema = "legacy"
+    mongo.db = FakeDatabase(failing)
+    return mongo
+
+
+async def test_unique_index_failure_stops_startup():
+    assert any(index.document.get("unique") for index in INDEXES["monitored_apps"])
+    with pytest.raises(RuntimeError, match="monitored_apps"):
+        await storage({"monitored_apps"}).ensure_indexes()
+
+
+async def test_other_index_failures_are_logged():
+    assert not any(index.document.get("unique") for index in INDEXES["usage_sessions"])
+    await storage({"usage_sessions"}).ensure_indexes()
@@ -0,0 +1,81 @@
+import uuid
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def monitored_app(user_id, package_name, daily_limit=10):
+    return {
+        "userId": user_id, "packageName": package_name, "appName": package_name,
+        "displayName": package_name, "dailyLimit": daily_limit,
+    }
+
+
+async def sync(client, user_id, since=None):
+    params = {"user_id": user_id}
+    if since is not None:
+        params["since"] = since
+    response = await client.get("/api/sync", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+async def earn_reward(server, client, user_id):
+    challenge = server.Challenge(userId=user_id, question="2 + 2 = ?", answer=4)
+    await server.storage.challenges.insert(challenge.dict())
+    response = await client.post(
+        f"/api/challenges/{challenge.id}/submit", params={"answer": 4, "user_id": user_id}
+    )
+    assert response.json()["correct"]
+    return {"challengeId": challenge.id, "timeReward": challenge.timeReward}
+
+
+async def test_incremental_sync_sends_changed_and_removed_apps(api):
+    user_id = f"u-{uuid.uuid4().hex}"
+    async with api() as (server, client):
+        kept = (await client.post("/api/apps/monitored", json=monitored_app(user_id, "com.kept"))).json()
+        dropped = (await client.post("/api/apps/monitored", json=monitored_app(user_id, "com.dropped"))).json()
+
+        first = await sync(client, user_id)
+        assert first["full"]
+        assert {app["id"] for app in first["apps"]} == {kept["id"], dropped["id"]}
+
+        unchanged = await sync(client, user_id, first["cursor"])
+        assert (unchanged["full"], unchanged["apps"], unchanged["removed"]) == (False, [], [])
+
+        added = (await client.post("/api/apps/monitored", json=monitored_app(user_id, "com.added"))).json()
+        await client.delete(f"/api/apps/monitored/{dropped['id']}", params={"user_id": user_id})
+        reward = await earn_reward(server, client, user_id)
+
+        changes = await sync(client, user_id, unchanged["cursor"])
+        assert not changes["full"]
+        assert [app["id"] for app in changes["apps"]] == [added["id"]]
+        assert changes["removed"] == [dropped["id"]]
+        assert changes["rewards"] == [reward]
+
+
+async def test_full_sync_after_day_rollover_keeps_rewards(api):
+    user_id = f"u-{uuid.uuid4().hex}"
+    async with api() as (server, client):
+        app = (await client.post("/api/apps/monitored", json=monitored_app(user_id, "com.example"))).json()
+        first = await sync(client, user_id)
+        reward = await earn_reward(server, client, user_id)
+
+        # Same sequence number, but the cursor was taken on an earlier local day
+        seq, _, _ = first["cursor"].partition(".")
+        rolled_over = await sync(client, user_id, f"{seq}.2000-01-01")
+        assert rolled_over["full"]
+        assert [entry["id"] for entry in rolled_over["apps"]] == [app["id"]]
+        assert rolled_over["rewards"] == [reward]
+
+        # Rewards already delivered are not sent again
+        caught_up = await sync(client, user_id, rolled_over["cursor"])
+        assert caught_up["rewards"] == []
+
+
+async def test_sync_without_cursor_has_no_rewards(api):
+    user_id = f"u-{uuid.uuid4().hex}"
+    async with api() as (server, client):
+        await earn_reward(server, client, user_id)
+        assert (await sync(client, user_id))["rewards"] == []